@@ -1,16 +1,22 @@
 import os
-import redis
 import tempfile
+import time
 import uuid
-from cachelib.file import FileSystemCache
 from dotenv import load_dotenv
-from flask import Flask, g, request
+from flask import Flask, g, request, session
 from werkzeug.middleware.proxy_fix import ProxyFix
 from flask_session import Session
 
+import startup_profile
 from app.extensions import configure_logger, cors
 from app.routes import auth_bp, grades_bp, share_bp, system_bp
-from fetcher import GradeFetcher
+from app.services.auth_service import refresh_session_expiry
+from app.services.captcha_pool import CaptchaPool
+from app.services.metrics import ROUTE_LATENCY, InstrumentedRedis
+from app.services.rate_limiter import TokenBucketLimiter
+from app.services.redis_readiness import FallbackSessionInterface, RedisReadiness
+from app.services.static_assets import StaticAssetIndex
+from app.services.upstream_guard import AdaptiveConcurrencyLimiter, CircuitBreaker, UpstreamGuard
 
 load_dotenv()
 
@@ -33,12 +39,32 @@ def create_app():
     @app.before_request
     def assign_request_id():
         g.request_id = request.headers.get('X-Request-Id', str(uuid.uuid4())[:8])
-
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def observe_route_latency(response):
+        started = g.get('request_started')
+        if started is not None:
+            route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+            ROUTE_LATENCY.labels(route, request.method, str(response.status_code)).observe(
+                time.perf_counter() - started
+            )
+        return response
+
+    @app.after_request
+    def extend_active_session(response):
+        # 只在 API 回應延長 session，靜態檔（可被 CDN 快取）不帶 Set-Cookie
+        if request.path.startswith('/api/'):
+            refresh_session_expiry(session._get_current_object(), app.permanent_session_lifetime.total_seconds())
+        return response
+
+
+    flask_env = os.environ.get('FLASK_ENV', '').lower()
+    app_env = os.environ.get('APP_ENV', '').lower()
+    testing_env = 'testing' in (flask_env, app_env)
 
     secret_key = _read_secret('SECRET_KEY', '')
     if not secret_key:
-        flask_env = os.environ.get('FLASK_ENV', '').lower()
-        app_env = os.environ.get('APP_ENV', '').lower()
         if flask_env in ('development', 'testing') or app_env in ('development', 'testing'):
             secret_key = os.urandom(24).hex()
             print("WARNING: SECRET_KEY not set – using random key. All sessions will be lost on restart.")
@@ -49,35 +75,114 @@ def create_app():
     app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
     app.config['SESSION_COOKIE_SECURE'] = True
     app.config['SESSION_COOKIE_HTTPONLY'] = True
+    # session 未變更時不回寫儲存；活躍 session 剩餘存活時間不到一半時才延長（見 extend_active_session）
+    app.config['SESSION_REFRESH_EACH_REQUEST'] = False
 
+    # Redis 在背景連線（見 redis_readiness），就緒前 REDIS_CLIENT 為 None，各元件使用本機備援
     redis_url = os.environ.get('REDIS_URL', 'redis://127.0.0.1:6379/0')
-    redis_client = redis.from_url(redis_url)
+    redis_client = InstrumentedRedis.from_url(
+        redis_url, socket_connect_timeout=float(os.environ.get('REDIS_CONNECT_TIMEOUT', 2.0))
+    )
+    app.config['REDIS_CLIENT'] = None
 
-    try:
-        redis_client.ping()
-        app.config['REDIS_CLIENT'] = redis_client
-        app.config['SESSION_TYPE'] = 'redis'
-        app.config['SESSION_REDIS'] = redis_client
+    with startup_profile.phase('session'):
         app.config['SESSION_USE_SIGNER'] = False
         app.config['SESSION_KEY_PREFIX'] = 'session:'
         app.config['PERMANENT_SESSION_LIFETIME'] = 86400  # 1 day
+        app.config['SESSION_TYPE'] = 'redis'
+        app.config['SESSION_REDIS'] = redis_client
         Session(app)
-    except redis.exceptions.ConnectionError:
-        app.config['REDIS_CLIENT'] = None
-        # 退回到 cachelib 檔案型 session，避免 Flask-Session 因無效的 SESSION_TYPE 直接拋錯
-        app.config['SESSION_TYPE'] = 'cachelib'
-        app.config['SESSION_CACHELIB'] = FileSystemCache(
-            cache_dir=os.path.join(tempfile.gettempdir(), 'grades-flask-session')
+        redis_session_interface = app.session_interface
+
+    def build_fallback_session_interface():
+        # Redis 不可用時的 cachelib 檔案型 session（第一次需要時才載入 cachelib）
+        from cachelib.file import FileSystemCache
+        from flask_session.cachelib import CacheLibSessionInterface
+
+        return CacheLibSessionInterface(
+            app,
+            client=FileSystemCache(cache_dir=os.path.join(tempfile.gettempdir(), 'grades-flask-session')),
+            key_prefix=app.config['SESSION_KEY_PREFIX'],
+            use_signer=app.config['SESSION_USE_SIGNER'],
         )
-        Session(app)
-        print("WARNING: Redis not available. Using filesystem session fallback for development.")
+
+    # 設定後 /metrics 需帶 Authorization: Bearer <token>；未設定時只對內網/loopback 開放
+    app.config['METRICS_TOKEN'] = _read_secret('METRICS_TOKEN', '')
 
     app.config['TURNSTILE_SITE_KEY'] = os.environ.get('TURNSTILE_SITE_KEY', '')
     app.config['TURNSTILE_SECRET_KEY'] = _read_secret('TURNSTILE_SECRET_KEY', '')
+    # 已驗證 token 的快取秒數（同一請求重送時不再呼叫 siteverify），0 表示停用
+    app.config['TURNSTILE_CACHE_TTL'] = int(os.environ.get('TURNSTILE_CACHE_TTL', 30))
 
     app.config['SHARE_TTL'] = int(os.environ.get('SHARE_TTL', 7200))
-
-    app.config['GRADE_FETCHER'] = GradeFetcher()
+    # 分享 API 回應可在 CDN 快取的秒數（瀏覽器一律以 ETag 重新驗證）
+    app.config['SHARE_CDN_MAX_AGE'] = int(os.environ.get('SHARE_CDN_MAX_AGE', 300))
+    # 設定後分享更新時會主動清除 Cloudflare 快取
+    app.config['CLOUDFLARE_ZONE_ID'] = os.environ.get('CLOUDFLARE_ZONE_ID', '')
+    app.config['CLOUDFLARE_API_TOKEN'] = _read_secret('CLOUDFLARE_API_TOKEN', '')
+    app.config['PUBLIC_BASE_URL'] = os.environ.get('PUBLIC_BASE_URL', '')
+    app.config['STRUCTURE_YEARS_TTL'] = int(os.environ.get('STRUCTURE_YEARS_TTL', 600))
+    app.config['STRUCTURE_EXAMS_TTL'] = int(os.environ.get('STRUCTURE_EXAMS_TTL', 1800))
+    # 成績結果加密快取秒數，0 表示停用
+    app.config['GRADES_CACHE_TTL'] = int(os.environ.get('GRADES_CACHE_TTL', 0))
+    app.config['FETCH_ALL_MAX_WORKERS'] = int(os.environ.get('FETCH_ALL_MAX_WORKERS', 4))
+    # 每個請求對學校系統的總時間預算（含 retry 與平行子請求），須小於 gunicorn --timeout
+    app.config['UPSTREAM_DEADLINE_SECONDS'] = float(os.environ.get('UPSTREAM_DEADLINE_SECONDS', 25))
+    app.config['FETCH_ALL_DEADLINE_SECONDS'] = float(os.environ.get('FETCH_ALL_DEADLINE_SECONDS', 100))
+    # 跨 worker 合併相同成績請求（Redis 只短暫保留完成訊號與加密結果），預設只在單一 worker 內合併
+    app.config['SINGLE_FLIGHT_REDIS'] = os.environ.get('SINGLE_FLIGHT_REDIS', '').lower() in ('1', 'true', 'yes')
+
+    # 學校系統上游保護：跨 worker 的 circuit breaker + 每個 worker 的 AIMD 併發上限
+    upstream_guard = UpstreamGuard(
+        CircuitBreaker(
+            app.config['REDIS_CLIENT'],
+            threshold=int(os.environ.get('UPSTREAM_BREAKER_THRESHOLD', 5)),
+            window=int(os.environ.get('UPSTREAM_BREAKER_WINDOW', 30)),
+            open_seconds=int(os.environ.get('UPSTREAM_BREAKER_OPEN_SECONDS', 30)),
+            failure_ratio=float(os.environ.get('UPSTREAM_BREAKER_FAILURE_RATIO', 0.5)),
+        ),
+        AdaptiveConcurrencyLimiter(
+            initial=int(os.environ.get('UPSTREAM_CONCURRENCY_INITIAL', 8)),
+            max_limit=int(os.environ.get('UPSTREAM_CONCURRENCY_MAX', 32)),
+            latency_target=float(os.environ.get('UPSTREAM_LATENCY_TARGET', 5.0)),
+        ),
+        queue_timeout=float(os.environ.get('UPSTREAM_QUEUE_TIMEOUT', 2.0)),
+    )
+    app.config['UPSTREAM_GUARD'] = upstream_guard
+
+    with startup_profile.phase('grade_fetcher'):
+        if os.environ.get('GRADE_FETCHER_BACKEND', '').lower() == 'async':
+            # asyncio/httpx 版本：所有上游呼叫共用一個背景 event loop 與連線池
+            from async_fetcher import AsyncGradeFetcher, LoopBoundGradeFetcher
+            app.config['GRADE_FETCHER'] = LoopBoundGradeFetcher(AsyncGradeFetcher(guard=upstream_guard))
+        else:
+            from fetcher import GradeFetcher
+            app.config['GRADE_FETCHER'] = GradeFetcher(guard=upstream_guard)
+
+    # 每個 worker 各自的 token bucket（Redis 前的預過濾，以及 Redis 不可用時的備援限制）
+    app.config['LOCAL_RATE_LIMITER'] = TokenBucketLimiter()
+
+    captcha_pool_size = int(os.environ.get('CAPTCHA_POOL_SIZE', 3))
+    if captcha_pool_size > 0:
+        app.config['CAPTCHA_POOL'] = CaptchaPool(
+            app.config['GRADE_FETCHER'],
+            redis_client=app.config['REDIS_CLIENT'],
+            size=captcha_pool_size,
+            max_age=int(os.environ.get('CAPTCHA_POOL_MAX_AGE', 45)),
+        )
+    else:
+        app.config['CAPTCHA_POOL'] = None
+
+    # 靜態資源索引：index.html 與 dist 在啟動時載入（ETag / 壓縮版本 / 記憶體快取），開發環境檔案變更即重新載入
+    dev_env = (os.environ.get('FLASK_ENV', '').lower() == 'development'
+               or os.environ.get('APP_ENV', '').lower() == 'development')
+    app.config['STATIC_ASSETS'] = StaticAssetIndex(
+        os.path.join(root_path, 'public'),
+        cache_max_bytes=int(os.environ.get('STATIC_CACHE_MAX_BYTES', 512 * 1024)),
+        reload=dev_env,
+    )
+    with startup_profile.phase('static_assets'):
+        app.config['STATIC_ASSETS'].warm()
 
     app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1, x_proto=1, x_host=1, x_prefix=1)
 
@@ -92,4 +197,31 @@ def create_app():
     app.register_blueprint(share_bp)
     app.register_blueprint(system_bp)
 
+    def on_redis_ready(client):
+        # 已注入其他 client（例如測試的 fakeredis）時不覆寫
+        if app.config['REDIS_CLIENT'] is not None:
+            return
+        app.config['REDIS_CLIENT'] = client
+        upstream_guard.breaker.redis_client = client
+        if app.config['CAPTCHA_POOL'] is not None:
+            app.config['CAPTCHA_POOL'].redis_client = client
+
+    readiness = RedisReadiness(
+        redis_client, on_redis_ready, retry_seconds=float(os.environ.get('REDIS_CONNECT_RETRY_SECONDS', 30))
+    )
+    app.session_interface = FallbackSessionInterface(
+        redis_session_interface, build_fallback_session_interface, readiness
+    )
+    # 測試環境不連線 Redis（避免開發者本機的 Redis 取代測試注入的 client），直接使用本機備援
+    if testing_env:
+        app.config['REDIS_READINESS'] = readiness.disable()
+    else:
+        app.config['REDIS_READINESS'] = readiness.start()
+
+    # 啟動時預先補滿驗證碼池（測試環境不連學校系統）
+    warm_default = '0' if testing_env else '1'
+    if (app.config['CAPTCHA_POOL'] is not None
+            and os.environ.get('CAPTCHA_POOL_WARM', warm_default).lower() in ('1', 'true', 'yes')):
+        app.config['CAPTCHA_POOL'].warm_async(readiness)
+
     return app
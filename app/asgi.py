@@ -0,0 +1,140 @@
+"""WSGI → ASGI 橋接 — 讓既有的 Flask app 跑在 gunicorn 的 asyncio worker（``-k asgi``）上。
+
+連線、request body 與回應（含 NDJSON 串流）都在 worker 的 event loop 上收送，慢速 client
+不佔 thread；Flask routes 在 thread pool 中執行。搭配 ``GRADE_FETCHER_BACKEND=async`` 時，
+route thread 等待上游只停在 Future 上，實際 I/O 由共用 event loop 處理，
+一個 process 可同時維持的上游請求數由 ``ASGI_WSGI_THREADS`` 決定，而非 gunicorn ``--threads``。
+"""
+
+import asyncio
+import io
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+
+def build_environ(scope, body):
+    """依 ASGI HTTP scope 建立 WSGI environ（PEP 3333）。"""
+    server_name, server_port = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    path = scope.get('raw_path') or scope['path'].encode('utf-8')
+    root_path = scope.get('root_path', '')
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': root_path.encode('utf-8').decode('latin-1'),
+        'PATH_INFO': path.split(b'?', 1)[0].decode('latin-1')[len(root_path):],
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if body:
+        environ['CONTENT_LENGTH'] = str(len(body))
+    for raw_name, raw_value in scope.get('headers', []):
+        name = raw_name.decode('latin-1').upper().replace('-', '_')
+        value = raw_value.decode('latin-1')
+        if name == 'CONTENT_LENGTH':
+            continue
+        key = name if name == 'CONTENT_TYPE' else f'HTTP_{name}'
+        environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+class WSGIBridge:
+    """在 asyncio worker 上執行 WSGI app：body 在 loop 上收完，app 在 thread pool 執行，回應逐塊送回 loop。"""
+
+    def __init__(self, wsgi_app, max_threads=256, max_body=None):
+        self.wsgi_app = wsgi_app
+        self.max_body = max_body
+        self.executor = ThreadPoolExecutor(max_workers=max_threads, thread_name_prefix='asgi-wsgi')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+
+        loop = asyncio.get_running_loop()
+
+        body = bytearray()
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+            body += message.get('body', b'')
+            more_body = message.get('more_body', False)
+            if self.max_body is not None and len(body) > self.max_body:
+                await send({'type': 'http.response.start', 'status': 413, 'headers': []})
+                await send({'type': 'http.response.body', 'body': b''})
+                return
+
+        environ = build_environ(scope, bytes(body))
+        await loop.run_in_executor(self.executor, self._run_wsgi, loop, environ, send)
+
+    def _run_wsgi(self, loop, environ, send):
+        def post(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        status_headers = []
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info and status_headers:
+                raise exc_info[1].with_traceback(exc_info[2])
+            status_headers[:] = [status, headers]
+
+        started = False
+        iterable = self.wsgi_app(environ, start_response)
+        try:
+            for chunk in iterable:
+                if not started:
+                    post(self._start_message(status_headers))
+                    started = True
+                if chunk:
+                    post({'type': 'http.response.body', 'body': bytes(chunk), 'more_body': True})
+            if not started:
+                post(self._start_message(status_headers))
+            post({'type': 'http.response.body', 'body': b''})
+        finally:
+            close = getattr(iterable, 'close', None)
+            if close is not None:
+                close()
+
+    @staticmethod
+    def _start_message(status_headers):
+        status, headers = status_headers
+        return {
+            'type': 'http.response.start',
+            'status': int(status.split(' ', 1)[0]),
+            'headers': [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers],
+        }
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+def create_asgi_app(flask_app, max_threads=None):
+    """以 Flask app 建立 ASGI app。"""
+    if max_threads is None:
+        try:
+            max_threads = int(os.environ.get('ASGI_WSGI_THREADS', 256))
+        except ValueError:
+            max_threads = 256
+    return WSGIBridge(flask_app, max_threads=max_threads, max_body=flask_app.config.get('MAX_CONTENT_LENGTH'))
@@ -1,11 +1,92 @@
+import atexit
+import json
 import logging
-from logging.handlers import RotatingFileHandler
+import os
+import queue
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 
+from flask import g, has_request_context
 from flask_cors import CORS
 
 
 cors = CORS()
 
+LOG_QUEUE_SIZE = 10000
+# 請求以外（啟動、背景 thread）的 record 沒有 request_id / user，以此佔位（JSON 格式輸出 null）
+LOG_PLACEHOLDER = '-'
+# LOG_FORMAT=text 時的格式；request_id / user 由 RequestContextFilter 補上
+TEXT_LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s %(user)s] %(message)s'
+
+
+class RequestContextFilter(logging.Filter):
+    """在呼叫端 thread 補上 request_id（背景 listener thread 沒有 Flask request context）。"""
+
+    def filter(self, record):
+        if getattr(record, 'request_id', None) is None:
+            request_id = g.get('request_id') if has_request_context() else None
+            record.request_id = request_id or LOG_PLACEHOLDER
+        if getattr(record, 'user', None) is None:
+            record.user = LOG_PLACEHOLDER
+        return True
+
+
+class BoundedQueueHandler(QueueHandler):
+    """寫入有上限的 queue；queue 滿時直接丟棄並計數，不讓 request thread 等待 I/O。"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self._dropped = 0
+        self._dropped_lock = threading.Lock()
+
+    @property
+    def dropped(self):
+        return self._dropped
+
+    def prepare(self, record):
+        # 同 process 內的 queue 不需要序列化，格式化延後到 listener thread
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # 多個 request thread 可能同時遇到 queue 滿
+            with self._dropped_lock:
+                self._dropped += 1
+
+
+def _or_null(value):
+    return None if value == LOG_PLACEHOLDER else value
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+            'request_id': _or_null(getattr(record, 'request_id', None)),
+            'user': _or_null(getattr(record, 'user', None)),
+        }
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def get_dropped_log_count() -> int:
+    handler = _queue_handler(logging.getLogger('SchoolGradesServer'))
+    return handler.dropped if handler else 0
+
+
+def _queue_handler(logger):
+    for handler in logger.handlers:
+        if isinstance(handler, BoundedQueueHandler):
+            return handler
+    return None
+
 
 def configure_logger() -> logging.Logger:
     logger = logging.getLogger('SchoolGradesServer')
@@ -14,7 +95,10 @@ def configure_logger() -> logging.Logger:
     if logger.handlers:
         return logger
 
-    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    if os.environ.get('LOG_FORMAT', 'json').lower() == 'text':
+        formatter = logging.Formatter(TEXT_LOG_FORMAT)
+    else:
+        formatter = JsonFormatter()
 
     file_handler = RotatingFileHandler(
         'server.log',
@@ -29,7 +113,14 @@ def configure_logger() -> logging.Logger:
     console_handler.setLevel(logging.INFO)
     console_handler.setFormatter(formatter)
 
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
+    # request thread 只把 record 放進 queue，檔案寫入與 rotation 交給背景 listener
+    log_queue = queue.Queue(maxsize=int(os.environ.get('LOG_QUEUE_SIZE', LOG_QUEUE_SIZE)))
+    queue_handler = BoundedQueueHandler(log_queue)
+    queue_handler.addFilter(RequestContextFilter())
+    listener = QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+
+    logger.addHandler(queue_handler)
 
     return logger
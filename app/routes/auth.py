@@ -1,8 +1,11 @@
 from flask import Blueprint, current_app, jsonify, request, session, Response
 
+from app.routes.upstream_errors import deadline_exceeded, upstream_unavailable
 from app.services.auth_service import is_logged_in, login_and_build_session_payload
-from app.services.rate_limiter import is_rate_limited
-from app.services.turnstile_service import verify_turnstile_token
+from app.services.deadline import Deadline, DeadlineExceeded
+from app.services.rate_limiter import rate_limit, refund_rate_limit
+from app.services.turnstile_service import verify_turnstile_token_async
+from app.services.upstream_guard import UpstreamUnavailable
 import logging
 
 logger = logging.getLogger('SchoolGradesServer.Auth')
@@ -33,57 +36,100 @@ def login():
     masked_username = (username[:3] + "***") if username and len(username) > 3 else "***"
     logger.info(f'Login attempt for user: {masked_username}')
 
-    # Turnstile 人機驗證
-    ts_ok, ts_err = verify_turnstile_token(
+    # Turnstile 人機驗證在背景進行，與速率限制檢查、學校登入同時跑；
+    # 兩者都成功才寫入 session，驗證失敗時丟棄學校登入結果。
+    # 注意：驗證尚未完成時學校登入 POST 已送出，即使之後 Turnstile 失敗，
+    # 該次嘗試仍會計入學校系統自己的錯誤次數/鎖定
+    ts_future = verify_turnstile_token_async(
         data.get('turnstile_token'),
-        remoteip=request.remote_addr
+        remoteip=request.remote_addr,
+        action='login',
+        identity=username if isinstance(username, str) else None,
     )
-    if not ts_ok:
-        return jsonify({'success': False, 'message': ts_err}), 403
-
-    # 速率限制檢查（在 Turnstile 之後）
-    redis_client = current_app.config.get('REDIS_CLIENT')
-    if redis_client:
-        try:
-            limited, remaining, retry_after = is_rate_limited(
-                redis_client, request.remote_addr,
+
+    # 速率限制檢查（在送出學校登入之前，超量請求不會打到學校系統）
+    # 本機 token bucket 預過濾 → Redis 共用限制；Redis 不可用時改以本機限制代替
+    limited, remaining, retry_after = rate_limit(
+        current_app.config.get('REDIS_CLIENT'), request.remote_addr,
+        max_attempts=LOGIN_RATE_LIMIT_MAX,
+        window_seconds=LOGIN_RATE_LIMIT_WINDOW,
+        prefilter_ip=request.remote_addr,
+        limiter=current_app.config['LOCAL_RATE_LIMITER'],
+    )
+
+    def turnstile_rejection(**extra):
+        ts_ok, ts_err = ts_future.result()
+        if ts_ok:
+            return None
+        if not limited:
+            # 人機驗證失敗的請求不佔用此 IP 的登入次數（本機預過濾仍會計入）
+            refund_rate_limit(
+                current_app.config.get('REDIS_CLIENT'), request.remote_addr,
                 max_attempts=LOGIN_RATE_LIMIT_MAX,
-                window_seconds=LOGIN_RATE_LIMIT_WINDOW,
+                limiter=current_app.config['LOCAL_RATE_LIMITER'],
             )
-            if limited:
-                logger.warning(f'Rate limited login from IP: {request.remote_addr}')
-                resp = jsonify({
-                    'success': False,
-                    'message': f'登入嘗試過於頻繁，請在 {retry_after} 秒後再試',
-                })
-                resp.headers['Retry-After'] = str(retry_after)
-                return resp, 429
-        except Exception as exc:
-            logger.error(f'Rate limiter error: {exc}', exc_info=True)
-
-    if not username or not password:
-        return jsonify({'success': False, 'message': '請輸入帳號密碼'}), 400
-
-    if not captcha_code:
+        return jsonify({'success': False, 'message': ts_err, **extra}), 403
+
+    if limited:
+        rejection = turnstile_rejection()
+        if rejection:
+            return rejection
+        logger.warning(f'Rate limited login from IP: {request.remote_addr}')
+        resp = jsonify({
+            'success': False,
+            'message': f'登入嘗試過於頻繁，請在 {retry_after} 秒後再試',
+        })
+        resp.headers['Retry-After'] = str(retry_after)
+        return resp, 429
+
+    if not username or not password or not captcha_code:
+        rejection = turnstile_rejection()
+        if rejection:
+            return rejection
+        if not username or not password:
+            return jsonify({'success': False, 'message': '請輸入帳號密碼'}), 400
         return jsonify({'success': False, 'message': '請輸入驗證碼'}), 400
 
+    # 已知失敗（例如缺少 token）時不必送出學校登入
+    if ts_future.done():
+        rejection = turnstile_rejection()
+        if rejection:
+            return rejection
+
     fetcher = current_app.config['GRADE_FETCHER']
     school_login_context = session.get('school_login_context')
-    success, message, payload = login_and_build_session_payload(
-        fetcher,
-        username,
-        password,
-        captcha_code=captcha_code,
-        login_context=school_login_context,
-    )
+    try:
+        success, message, payload = login_and_build_session_payload(
+            fetcher,
+            username,
+            password,
+            captcha_code=captcha_code,
+            login_context=school_login_context,
+            deadline=Deadline(current_app.config['UPSTREAM_DEADLINE_SECONDS']),
+        )
+    except UpstreamUnavailable as exc:
+        session.pop('school_login_context', None)
+        return upstream_unavailable(exc, {'success': False, 'message': str(exc), 'need_refresh_captcha': True})
+    except DeadlineExceeded as exc:
+        session.pop('school_login_context', None)
+        return deadline_exceeded({'success': False, 'message': str(exc), 'need_refresh_captcha': True})
 
     # 驗證碼一次性使用，避免重放
     session.pop('school_login_context', None)
 
+    # 學校登入已用掉驗證碼，人機驗證失敗時也需重新取得
+    rejection = turnstile_rejection(need_refresh_captcha=True)
+    if rejection:
+        logger.warning('Discarding school login result: Turnstile verification failed')
+        return rejection
+
     if not success:
         # 驗證碼為一次性使用，登入失敗後一律需要重新取得
         return jsonify({'success': False, 'message': message, 'need_refresh_captcha': True}), 401
 
+    # 結構樹屬於前一個登入者，重新登入時一併清除
+    session.pop('structure', None)
+    session.pop('structure_key', None)
     session.update(payload)
     logger.info('Login successful')
 
@@ -93,16 +139,28 @@ def login():
 @bp.route('/api/school-captcha/image')
 def school_captcha_image():
     try:
-        fetcher = current_app.config['GRADE_FETCHER']
-        success, message, payload = fetcher.prepare_login_captcha()
-        if not success:
-            return jsonify({'success': False, 'message': message}), 200
+        captcha_pool = current_app.config.get('CAPTCHA_POOL')
+        payload = captcha_pool.take() if captcha_pool else None
+        if payload is None:
+            fetcher = current_app.config['GRADE_FETCHER']
+            success, message, payload = fetcher.prepare_login_captcha(
+                deadline=Deadline(current_app.config['UPSTREAM_DEADLINE_SECONDS'])
+            )
+            if not success:
+                return jsonify({'success': False, 'message': message}), 200
+        if captcha_pool:
+            # 只補回這次用掉（或池中缺少）的一個
+            captcha_pool.refill_async(1)
 
         session['school_login_context'] = payload['context']
         resp = Response(payload['image_bytes'], mimetype=payload.get('content_type') or 'image/png')
         resp.headers['Cache-Control'] = 'no-store, no-cache, must-revalidate, max-age=0'
         resp.headers['Pragma'] = 'no-cache'
         return resp
+    except UpstreamUnavailable as exc:
+        return upstream_unavailable(exc, {'success': False, 'message': str(exc)})
+    except DeadlineExceeded as exc:
+        return deadline_exceeded({'success': False, 'message': str(exc)})
     except Exception as exc:
         logger.error(f'Failed to load school captcha image: {exc}', exc_info=True)
         return jsonify({'success': False, 'message': '驗證碼服務暫時異常，請稍後再試'}), 200
@@ -1,6 +1,21 @@
-from flask import Blueprint, current_app, jsonify, request, session
-
-from app.services.grades_service import fetch_grades, get_structure
+import json
+
+from flask import Blueprint, Response, current_app, jsonify, request, session, stream_with_context
+
+from app.services.auth_service import session_cookies
+from app.services.deadline import Deadline, DeadlineExceeded
+from app.services.grades_service import (
+    fetch_all_grades,
+    fetch_grades,
+    get_structure,
+    load_session_structure,
+    store_session_structure,
+)
+from app.routes.upstream_errors import deadline_exceeded as _deadline_exceeded
+from app.routes.upstream_errors import upstream_unavailable as _upstream_unavailable
+from app.services.result_cache import GradesResultCache
+from app.services.single_flight import REDIS_RESULT_TTL
+from app.services.upstream_guard import UpstreamUnavailable
 import logging
 
 logger = logging.getLogger('SchoolGradesServer.Grades')
@@ -16,14 +31,27 @@ def fetch_grades_route():
     payload = payload or {}
     year_value = payload.get('year_value')
     exam_value = payload.get('exam_value')
+    force = payload.get('force') is True
 
-    cookies = session.get('api_cookies')
+    cookies = session_cookies(session)
     token = session.get('api_token')
     student_no = session.get('student_no')
 
     if not cookies or not token:
         return jsonify({'error': '未登入'}), 401
 
+    redis_client = current_app.config.get('REDIS_CLIENT')
+    cache_ttl = current_app.config['GRADES_CACHE_TTL']
+    result_cache = None
+    if redis_client is not None and cache_ttl > 0:
+        result_cache = GradesResultCache(redis_client, current_app.secret_key, token, cache_ttl)
+    coalesce_cache = None
+    if redis_client is not None and current_app.config['SINGLE_FLIGHT_REDIS']:
+        # 跨 worker 合併時 leader 的結果以加密快取交給其他 worker
+        coalesce_cache = result_cache or GradesResultCache(
+            redis_client, current_app.secret_key, token, REDIS_RESULT_TTL
+        )
+
     try:
         data = fetch_grades(
             current_app.config['GRADE_FETCHER'],
@@ -32,8 +60,16 @@ def fetch_grades_route():
             token,
             year_value,
             exam_value,
+            coalesce_cache=coalesce_cache,
+            result_cache=result_cache,
+            force=force,
+            deadline=Deadline(current_app.config['UPSTREAM_DEADLINE_SECONDS']),
         )
         return jsonify({'success': True, 'message': '成績已更新', 'data': data})
+    except UpstreamUnavailable as exc:
+        return _upstream_unavailable(exc, {'success': False, 'error': str(exc)})
+    except DeadlineExceeded as exc:
+        return _deadline_exceeded({'success': False, 'error': str(exc)})
     except Exception as exc:
         logger.error(f'Error fetching grades (API): {exc}', exc_info=True)
         return jsonify({'success': False, 'error': str(exc)}), 500
@@ -45,26 +81,91 @@ def get_structure_route():
         return jsonify({'error': '未登入'}), 401
 
     force_reload = request.args.get('reload') == 'true'
-    cached = session.get('structure')
+    redis_client = current_app.config.get('REDIS_CLIENT')
+    cached = None if force_reload else load_session_structure(session, redis_client)
 
     if cached and not force_reload:
         return jsonify({'structure': cached})
 
     try:
-        if not session.get('api_cookies') or not session.get('student_no'):
+        cookies = session_cookies(session)
+        if not cookies or not session.get('student_no'):
             return jsonify({'error': '連線過期，請重新登入'}), 401
 
         structure = get_structure(
             current_app.config['GRADE_FETCHER'],
-            session['api_cookies'],
+            cookies,
             session['student_no'],
             session['api_token'],
+            redis_client=redis_client,
+            force_reload=force_reload,
+            years_ttl=current_app.config['STRUCTURE_YEARS_TTL'],
+            exams_ttl=current_app.config['STRUCTURE_EXAMS_TTL'],
+            deadline=Deadline(current_app.config['UPSTREAM_DEADLINE_SECONDS']),
         )
-        session['structure'] = structure
+        store_session_structure(session, redis_client, structure)
         return jsonify({'structure': structure})
+    except UpstreamUnavailable as exc:
+        return _upstream_unavailable(exc, {'error': str(exc)})
+    except DeadlineExceeded as exc:
+        return _deadline_exceeded({'error': str(exc)})
     except Exception as exc:
         logger.error(f'Error getting structure (API): {exc}', exc_info=True)
         return jsonify({'error': str(exc)}), 500
 
 
+@bp.route('/api/fetch_all', methods=['POST'])
+def fetch_all_grades_route():
+    """以 NDJSON 串流回傳所有學年期/考次成績，每完成一筆輸出一行，最後一行為摘要。"""
+    cookies = session_cookies(session)
+    token = session.get('api_token')
+    student_no = session.get('student_no')
+
+    if not cookies or not token or not student_no:
+        return jsonify({'error': '未登入'}), 401
+
+    fetcher = current_app.config['GRADE_FETCHER']
+    redis_client = current_app.config.get('REDIS_CLIENT')
+    cache_ttl = current_app.config['GRADES_CACHE_TTL']
+    result_cache = None
+    if redis_client is not None and cache_ttl > 0:
+        result_cache = GradesResultCache(redis_client, current_app.secret_key, token, cache_ttl)
+
+    # 結構與所有考次共用同一個預算
+    deadline = Deadline(current_app.config['FETCH_ALL_DEADLINE_SECONDS'])
+    try:
+        structure = load_session_structure(session, redis_client) or get_structure(
+            fetcher,
+            cookies,
+            student_no,
+            token,
+            redis_client=redis_client,
+            years_ttl=current_app.config['STRUCTURE_YEARS_TTL'],
+            exams_ttl=current_app.config['STRUCTURE_EXAMS_TTL'],
+            deadline=deadline,
+        )
+    except UpstreamUnavailable as exc:
+        return _upstream_unavailable(exc, {'error': str(exc)})
+    except DeadlineExceeded as exc:
+        return _deadline_exceeded({'error': str(exc)})
+    except Exception as exc:
+        logger.error(f'Error getting structure for fetch_all: {exc}', exc_info=True)
+        return jsonify({'error': str(exc)}), 500
 
+    max_workers = current_app.config['FETCH_ALL_MAX_WORKERS']
+
+    def generate():
+        total = failed = 0
+        for item in fetch_all_grades(fetcher, cookies, student_no, token, structure,
+                                     max_workers=max_workers, result_cache=result_cache, deadline=deadline):
+            total += 1
+            if not item['success']:
+                failed += 1
+                logger.error(f"fetch_all item failed: {item['year_value']}/{item['exam_value']}: {item['error']}")
+            yield json.dumps(item, ensure_ascii=False) + '\n'
+        yield json.dumps({'done': True, 'total': total, 'failed': failed}) + '\n'
+
+    resp = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    resp.headers['Cache-Control'] = 'no-store'
+    resp.headers['X-Accel-Buffering'] = 'no'
+    return resp
@@ -1,16 +1,17 @@
-from flask import Blueprint, current_app, jsonify, request, send_from_directory, session
+from flask import Blueprint, current_app, jsonify, request, session
 
-from app.services.rate_limiter import is_rate_limited
+from app.services.cdn_service import purge_share_async
+from app.services.rate_limiter import check_rate_limits, prefilter, rate_limit
 from app.services.share_service import (
+    create_share,
     generate_share_id,
     is_valid_share_id,
-    refresh_share_metadata_ttl,
-    read_share_metadata,
-    read_shared_data,
-    validate_share_payload,
-    write_share_metadata,
-    write_shared_data,
+    prepare_share_payload,
+    read_share_etag,
+    read_shared_entry,
+    update_share,
 )
+from app.services.static_assets import INDEX_CACHE_CONTROL, send_asset
 from app.services.turnstile_service import verify_turnstile_token
 import logging
 
@@ -22,6 +23,20 @@ SHARE_EXPIRY_OPTIONS = {
 
 bp = Blueprint('share', __name__)
 
+# GET /api/share/<id> 的回應外框，中間直接接上儲存的 JSON bytes
+_SHARE_ENVELOPE_PREFIX = b'{"success":true,"data":'
+_SHARE_ENVELOPE_SUFFIX = b'}'
+
+
+def _share_cache_headers(response):
+    """瀏覽器每次以 ETag 重新驗證；CDN 可快取 s-maxage 秒，更新時由 purge 或 ETag 改變失效。"""
+    max_age = current_app.config.get('SHARE_CDN_MAX_AGE', 0)
+    if max_age > 0:
+        response.headers['Cache-Control'] = f'public, max-age=0, s-maxage={max_age}, must-revalidate'
+    else:
+        response.headers['Cache-Control'] = 'no-cache'
+    return response
+
 
 @bp.route('/api/share', methods=['POST'])
 def create_share_link():
@@ -41,21 +56,28 @@ def create_share_link():
         # Turnstile 人機驗證
         ts_ok, ts_err = verify_turnstile_token(
             data.get('turnstile_token'),
-            remoteip=request.remote_addr
+            remoteip=request.remote_addr,
+            action='share',
+            identity=student_no,
         )
         if not ts_ok:
             return jsonify({'error': ts_err}), 403
 
-        # 速率限制檢查（在 Turnstile 之後）
+        # 速率限制檢查（在 Turnstile 之後）：本機預過濾明顯洪水，再交給 Redis
+        limited, retry_after = prefilter(request.remote_addr, current_app.config['LOCAL_RATE_LIMITER'])
+        if limited:
+            logger.warning(f'Prefiltered share creation flood from IP: {request.remote_addr}')
+            resp = jsonify({'error': f'建立分享連結過於頻繁，請在 {retry_after} 秒後再試'})
+            resp.headers['Retry-After'] = str(retry_after)
+            return resp, 429
+
         if redis_client:
             try:
-                # 較寬鬆的速率限制：每小時 (3600 秒) 10 次
-                limited, remaining, retry_after = is_rate_limited(
-                    redis_client, request.remote_addr,
-                    max_attempts=10,
-                    window_seconds=3600,
-                    key_prefix="share"
-                )
+                # 較寬鬆的速率限制：每小時 (3600 秒) 10 次，IP 與學號一次原子檢查
+                limited, remaining, retry_after = check_rate_limits(redis_client, [
+                    ('share', request.remote_addr, 10, 3600),
+                    ('share_student', student_no, 10, 3600),
+                ])
                 if limited:
                     logger.warning(f'Rate limited share creation from IP: {request.remote_addr}')
                     resp = jsonify({
@@ -67,7 +89,7 @@ def create_share_link():
                 logger.error(f'Rate limiter error: {exc}', exc_info=True)
 
         # Payload 大小與結構校驗
-        valid, err, cleaned = validate_share_payload(data)
+        valid, err, json_bytes = prepare_share_payload(data, len(request.get_data()))
         if not valid:
             return jsonify({'error': err}), 400
 
@@ -77,8 +99,7 @@ def create_share_link():
 
         share_id = generate_share_id()
         share_ttl = SHARE_EXPIRY_OPTIONS[requested_expiry]
-        write_shared_data(redis_client, share_id, cleaned, share_ttl)
-        write_share_metadata(redis_client, share_id, student_no, share_ttl)
+        create_share(redis_client, share_id, json_bytes, student_no, share_ttl)
         return jsonify({'success': True, 'id': share_id})
     except Exception as exc:
         logger.error(f'Error creating share: {exc}', exc_info = True)
@@ -104,46 +125,41 @@ def update_share_link(share_id):
             return jsonify({'error': 'Unauthorized'}), 401
 
         rate_limit_subject = requester_student_no or request.remote_addr
-        if redis_client:
-            try:
-                limited, remaining, retry_after = is_rate_limited(
-                    redis_client,
-                    rate_limit_subject,
-                    max_attempts=10,
-                    window_seconds=60,
-                    key_prefix='share_update'
-                )
-                if limited:
-                    resp = jsonify({
-                        'error': f'更新分享過於頻繁，請在 {retry_after} 秒後再試',
-                    })
-                    resp.headers['Retry-After'] = str(retry_after)
-                    return resp, 429
-            except Exception as exc:
-                logger.error(f'Share update rate limiter error: {exc}', exc_info=True)
-
-        metadata = read_share_metadata(redis_client, share_id)
-        if metadata is None:
-            return jsonify({'error': 'Link expired or not found'}), 404
-
-        creator_student_no = metadata.get('creator_student_no')
-        if not creator_student_no:
-            return jsonify({'error': 'Forbidden'}), 403
-
-        if requester_student_no != creator_student_no:
-            return jsonify({'error': 'Forbidden'}), 403
-
-        valid, err, cleaned = validate_share_payload(data)
+        limited, remaining, retry_after = rate_limit(
+            redis_client,
+            rate_limit_subject,
+            max_attempts=10,
+            window_seconds=60,
+            key_prefix='share_update',
+            prefilter_ip=request.remote_addr,
+            limiter=current_app.config['LOCAL_RATE_LIMITER'],
+        )
+        if limited:
+            resp = jsonify({
+                'error': f'更新分享過於頻繁，請在 {retry_after} 秒後再試',
+            })
+            resp.headers['Retry-After'] = str(retry_after)
+            return resp, 429
+
+        valid, err, json_bytes = prepare_share_payload(data, len(request.get_data()))
         if not valid:
             return jsonify({'error': err}), 400
 
-        share_ttl = metadata.get('ttl_seconds', current_app.config['SHARE_TTL'])
-        if share_ttl not in SHARE_EXPIRY_OPTIONS.values():
-            return jsonify({'error': 'Share metadata state conflict'}), 409
-        metadata_ttl_refreshed = refresh_share_metadata_ttl(redis_client, share_id, share_ttl)
-        if not metadata_ttl_refreshed:
+        status, _share_ttl = update_share(
+            redis_client,
+            share_id,
+            json_bytes,
+            requester_student_no,
+            allowed_ttls=SHARE_EXPIRY_OPTIONS.values(),
+            default_ttl=current_app.config['SHARE_TTL'],
+        )
+        if status == 'not_found':
+            return jsonify({'error': 'Link expired or not found'}), 404
+        if status == 'forbidden':
+            return jsonify({'error': 'Forbidden'}), 403
+        if status != 'ok':
             return jsonify({'error': 'Share metadata state conflict'}), 409
-        write_shared_data(redis_client, share_id, cleaned, share_ttl)
+        purge_share_async(current_app.config, share_id)
         return jsonify({'success': True, 'id': share_id})
     except Exception as exc:
         logger.error(f'Error updating share: {exc}', exc_info=True)
@@ -160,11 +176,25 @@ def get_shared_grades(share_id):
         if redis_client is None:
             return jsonify({'error': 'Share service unavailable'}), 503
 
-        data = read_shared_data(redis_client, share_id)
-        if data is None:
+        # 條件式請求：只讀 metadata 中的內容雜湊，相符即回 304，不載入分享內容
+        if request.if_none_match:
+            etag = read_share_etag(redis_client, share_id)
+            if etag and request.if_none_match.contains_weak(etag):
+                resp = current_app.response_class(status=304)
+                resp.set_etag(etag)
+                return _share_cache_headers(resp)
+
+        json_bytes, etag = read_shared_entry(redis_client, share_id)
+        if json_bytes is None:
             return jsonify({'error': 'Link expired or not found'}), 404
 
-        return jsonify({'success': True, 'data': data})
+        # 儲存的 JSON bytes 直接放進外框回傳，不經 json.loads / jsonify 重新序列化
+        resp = current_app.response_class(
+            [_SHARE_ENVELOPE_PREFIX, json_bytes, _SHARE_ENVELOPE_SUFFIX],
+            mimetype='application/json',
+        )
+        resp.set_etag(etag)
+        return _share_cache_headers(resp)
     except Exception as exc:
         logger.error(f'Error reading share: {exc}', exc_info = True)
         return jsonify({'error': str(exc)}), 500
@@ -172,8 +202,4 @@ def get_shared_grades(share_id):
 
 @bp.route('/share/<share_id>')
 def view_shared_page(share_id):
-    response = send_from_directory('public', 'index.html')
-    response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-    response.headers['Pragma'] = 'no-cache'
-    response.headers['Expires'] = '0'
-    return response
+    return send_asset('index.html', INDEX_CACHE_CONTROL)
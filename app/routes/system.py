@@ -1,12 +1,20 @@
+import hmac
+import ipaddress
 import os
 
-from flask import Blueprint, current_app, jsonify, send_from_directory
+from flask import Blueprint, Response, current_app, jsonify, request
 import logging
 
+from app.services.metrics import render_metrics
+from app.services.redis_readiness import CONNECTING, UNAVAILABLE
+from app.services.static_assets import INDEX_CACHE_CONTROL, send_asset
+
 logger = logging.getLogger('SchoolGradesServer.System')
 
 bp = Blueprint('system', __name__)
 
+HEALTH_REDIS_WAIT = 2.0
+
 ALLOWED_STATIC_EXT = {
     '.html', '.css', '.js', '.json', '.png', '.jpg', '.jpeg', '.gif',
     '.svg', '.ico', '.woff', '.woff2', '.webmanifest', '.ttf', '.xml', '.txt',
@@ -16,11 +24,7 @@ ALLOWED_STATIC_EXT = {
 @bp.route('/')
 def index():
     logger.debug('Accessing index page')
-    response = send_from_directory('public', 'index.html')
-    response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-    response.headers['Pragma'] = 'no-cache'
-    response.headers['Expires'] = '0'
-    return response
+    return send_asset('index.html', INDEX_CACHE_CONTROL)
 
 
 @bp.route('/<path:filename>')
@@ -32,18 +36,32 @@ def static_files(filename):
     if any(part.startswith('.') for part in filename.split('/')):
         return jsonify({'error': 'Forbidden'}), 403
 
-    response = send_from_directory('public', filename)
-    if ext in ('.js', '.css'):
-        response.cache_control.max_age = 31536000
+    if filename.startswith('dist/'):
+        # Vite 輸出檔名含內容 hash，內容不會變
+        cache_control = 'public, max-age=31536000, immutable'
+    elif ext in ('.js', '.css'):
+        cache_control = 'public, max-age=31536000'
     elif ext in ('.woff', '.woff2', '.ttf', '.png', '.jpg', '.jpeg', '.gif', '.svg', '.ico', '.webmanifest'):
-        response.cache_control.max_age = 86400
-    return response
+        cache_control = 'public, max-age=86400'
+    else:
+        cache_control = 'no-cache'
+    return send_asset(filename, cache_control)
 
 
 @bp.route('/health')
 def health_check():
-    redis_client = current_app.config.get('REDIS_CLIENT')
     redis_status = 'not_configured'
+    readiness = current_app.config.get('REDIS_READINESS')
+    if readiness is not None:
+        # 啟動中短暫等待第一次連線結果，仍未完成就回報尚未就緒
+        state = readiness.wait(HEALTH_REDIS_WAIT)
+        if state == CONNECTING:
+            return jsonify({'status': 'starting', 'redis': 'connecting'}), 503
+        if state == UNAVAILABLE:
+            # 以本機備援運作（背景仍在重試）
+            redis_status = 'unavailable'
+
+    redis_client = current_app.config.get('REDIS_CLIENT')
 
     if redis_client:
         try:
@@ -60,6 +78,39 @@ def health_check():
     return jsonify({'status': 'ok', 'redis': redis_status}), 200
 
 
+def _is_private_address(addr):
+    try:
+        ip = ipaddress.ip_address(addr or '')
+    except ValueError:
+        return False
+    return ip.is_private or ip.is_loopback
+
+
+def _from_private_network():
+    """請求的直接連線端與 ProxyFix 還原的客戶端位址都必須是內網/loopback。
+
+    只看 remote_addr 時，未經 proxy 直連的客戶端可偽造 X-Forwarded-For；只看直接連線端時，
+    經同機 proxy 轉送的外部請求都會是 127.0.0.1。
+    """
+    orig = request.environ.get('werkzeug.proxy_fix.orig', {}).get('REMOTE_ADDR', request.remote_addr)
+    return _is_private_address(request.remote_addr) and _is_private_address(orig)
+
+
+@bp.route('/metrics')
+def metrics():
+    token = current_app.config.get('METRICS_TOKEN')
+    if token:
+        supplied = request.headers.get('Authorization', '')
+        if not hmac.compare_digest(supplied.encode(), f'Bearer {token}'.encode()):
+            return jsonify({'error': 'Unauthorized'}), 401
+    elif not _from_private_network():
+        # 未設定 token 時只對內網開放（Prometheus 在同一網段抓取），對外當作不存在
+        return jsonify({'error': 'Not found'}), 404
+
+    body, content_type = render_metrics()
+    return Response(body, content_type=content_type, headers={'Cache-Control': 'no-store'})
+
+
 @bp.route('/api/turnstile-config')
 def turnstile_config():
     site_key = current_app.config.get('TURNSTILE_SITE_KEY', '')
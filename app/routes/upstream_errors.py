@@ -0,0 +1,20 @@
+"""學校系統不可用（circuit breaker 開路 / 併發滿載）與 deadline 用盡時的共用回應。"""
+
+import logging
+
+from flask import jsonify, request
+
+logger = logging.getLogger('SchoolGradesServer.Upstream')
+
+
+def upstream_unavailable(exc, body):
+    """上游開路或滿載時快速回 503，讓前端稍後重試。"""
+    logger.warning(f'Upstream unavailable ({exc.reason}) for {exc.endpoint}')
+    resp = jsonify(body)
+    resp.headers['Retry-After'] = str(exc.retry_after)
+    return resp, 503
+
+
+def deadline_exceeded(body):
+    logger.warning(f'Upstream deadline exceeded for {request.path}')
+    return jsonify(body), 504
@@ -1,19 +1,26 @@
+import time
 
+# session 最後一次延長存活時間的時間戳（epoch 秒）
+SESSION_TOUCHED_KEY = '_touched'
 
-def login_and_build_session_payload(fetcher, username, password, captcha_code=None, login_context=None):
+
+
+
+def login_and_build_session_payload(fetcher, username, password, captcha_code=None, login_context=None,
+                                    deadline=None):
     success, message, cookies, student_no, token = fetcher.login_and_get_tokens(
         username,
         password,
         captcha_code=captcha_code,
         login_context=login_context,
+        deadline=deadline,
     )
 
     if not success:
         return False, message, None
 
     payload = {
-        'username': username,
-        'api_cookies': cookies,
+        'api_cookies': pack_cookies(cookies),
         'student_no': student_no,
         'api_token': token,
     }
@@ -21,5 +28,45 @@ def login_and_build_session_payload(fetcher, username, password, captcha_code=No
     return True, message, payload
 
 
+def pack_cookies(cookies):
+    """將學校 cookies dict 壓縮為單一 ``name=value; ...`` 字串存入 session。"""
+    return '; '.join(f'{k}={v}' for k, v in cookies.items())
+
+
+def unpack_cookies(packed):
+    if not packed:
+        return None
+    if isinstance(packed, dict):
+        # 舊版 session 直接保存 dict
+        return packed
+    cookies = {}
+    for part in packed.split('; '):
+        name, sep, value = part.partition('=')
+        if sep:
+            cookies[name] = value
+    return cookies
+
+
+def session_cookies(sess):
+    return unpack_cookies(sess.get('api_cookies'))
+
+
 def is_logged_in(sess):
     return bool(sess.get('api_cookies') and sess.get('api_token'))
+
+
+def refresh_session_expiry(session, lifetime_seconds, now=None):
+    """session 剩餘存活時間不到一半時更新時間戳，使這次回應重新寫入儲存（延長 TTL）與 cookie。
+
+    SESSION_REFRESH_EACH_REQUEST=False 時未變更的 session 不會回寫，活躍使用者會在建立後
+    固定時間被登出；以此節流為每半個存活時間最多回寫一次。回傳是否更新。
+    """
+    if not session:
+        return False
+    now = time.time() if now is None else now
+    # 以 dict.get 讀取，不把 session 標為 accessed（避免回應多出 Vary: Cookie）
+    touched = dict.get(session, SESSION_TOUCHED_KEY) or 0
+    if now - touched < lifetime_seconds / 2:
+        return False
+    session[SESSION_TOUCHED_KEY] = int(now)
+    return True
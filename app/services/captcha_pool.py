@@ -0,0 +1,153 @@
+"""學校驗證碼預取池 — 預先準備少量 (login_token, cookies, captcha 圖片) 上下文。
+
+每個上下文只會被取用一次，超過 max_age 即丟棄。有 Redis 時存放於 ``captcha_pool``
+list 供所有 worker 共用，否則退回 process 內的 deque。
+
+啟動時 ``warm_async`` 補滿一次；之後每個驗證碼請求只在背景補一個（``refill_async(1)``），
+由單一 thread 依序抓取，抓取量跟著實際請求量走，閒置時不會反覆抓取一整池註定過期的上下文。
+"""
+
+import base64
+import json
+import logging
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger('SchoolGradesServer.CaptchaPool')
+
+POOL_KEY = 'captcha_pool'
+REFILL_LOCK_KEY = 'captcha_pool:refill'
+
+
+class CaptchaPool:
+    def __init__(self, fetcher, redis_client=None, size=3, max_age=45):
+        self.fetcher = fetcher
+        self.redis_client = redis_client
+        self.size = size
+        self.max_age = max_age
+        self._local = deque()
+        self._lock = threading.Lock()
+        self._refilling = False
+        self._pending = 0
+
+    # -- storage ---------------------------------------------------------
+
+    def _encode(self, payload):
+        return json.dumps({
+            'created_at': time.time(),
+            'image': base64.b64encode(payload['image_bytes']).decode('ascii'),
+            'content_type': payload.get('content_type'),
+            'context': payload['context'],
+        })
+
+    @staticmethod
+    def _decode(raw):
+        entry = json.loads(raw)
+        return entry['created_at'], {
+            'image_bytes': base64.b64decode(entry['image']),
+            'content_type': entry.get('content_type'),
+            'context': entry['context'],
+        }
+
+    def _pop(self):
+        if self.redis_client is not None:
+            return self.redis_client.lpop(POOL_KEY)
+        with self._lock:
+            return self._local.popleft() if self._local else None
+
+    def _push(self, raw):
+        if self.redis_client is not None:
+            pipe = self.redis_client.pipeline()
+            pipe.rpush(POOL_KEY, raw)
+            pipe.expire(POOL_KEY, self.max_age)
+            pipe.execute()
+        else:
+            with self._lock:
+                self._local.append(raw)
+
+    def _count(self):
+        if self.redis_client is not None:
+            return self.redis_client.llen(POOL_KEY)
+        with self._lock:
+            return len(self._local)
+
+    # -- public API ------------------------------------------------------
+
+    def take(self):
+        """取出一個仍在有效期限內的驗證碼 payload；池中沒有時回傳 None。"""
+        try:
+            while True:
+                raw = self._pop()
+                if raw is None:
+                    return None
+                created_at, payload = self._decode(raw)
+                if time.time() - created_at <= self.max_age:
+                    return payload
+        except Exception as exc:
+            logger.error(f'Captcha pool take failed: {exc}')
+            return None
+
+    def refill_async(self, count=None):
+        """於背景補充驗證碼池（最多到 size 個）；count 為本次要補的數量，None 表示補滿。
+
+        同一時間只有一個補充 thread，進行中再呼叫只會累加待補數量。
+        """
+        with self._lock:
+            wanted = self.size if count is None else self._pending + count
+            self._pending = min(self.size, wanted)
+            if self._refilling or self._pending <= 0:
+                return
+            self._refilling = True
+
+        if self.redis_client is not None:
+            try:
+                if not self.redis_client.set(REFILL_LOCK_KEY, 1, nx=True, ex=max(self.max_age, 10)):
+                    self._finish_refill()
+                    return
+            except Exception as exc:
+                logger.error(f'Captcha pool refill lock failed: {exc}')
+                self._finish_refill()
+                return
+
+        threading.Thread(target=self._refill, name='captcha-pool-refill', daemon=True).start()
+
+    def warm_async(self, readiness=None, wait=5.0):
+        """啟動時於背景補滿驗證碼池；有 readiness 時先等 Redis 第一次連線嘗試完成，
+        避免補進之後不會再讀取的本機 deque。"""
+        def run():
+            if readiness is not None:
+                readiness.wait(wait)
+            self.refill_async()
+
+        threading.Thread(target=run, name='captcha-pool-warm', daemon=True).start()
+
+    def _next_slot(self):
+        with self._lock:
+            if self._pending <= 0:
+                return False
+            self._pending -= 1
+            return True
+
+    def _finish_refill(self):
+        with self._lock:
+            self._refilling = False
+            self._pending = 0
+
+    def _refill(self):
+        try:
+            while self._next_slot() and self._count() < self.size:
+                success, message, payload = self.fetcher.prepare_login_captcha()
+                if not success:
+                    logger.warning(f'Captcha pool refill failed: {message}')
+                    break
+                self._push(self._encode(payload))
+        except Exception as exc:
+            logger.error(f'Captcha pool refill error: {exc}')
+        finally:
+            if self.redis_client is not None:
+                try:
+                    self.redis_client.delete(REFILL_LOCK_KEY)
+                except Exception:
+                    pass
+            self._finish_refill()
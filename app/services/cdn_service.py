@@ -0,0 +1,52 @@
+"""Cloudflare 快取清除 — 分享內容更新後讓 CDN 上的舊版本立即失效。
+
+未設定 zone / API token 時不做任何事；此時 CDN 只會在 s-maxage 到期後重新驗證 ETag。
+"""
+
+import logging
+import threading
+
+logger = logging.getLogger('SchoolGradesServer.CdnService')
+
+PURGE_URL = 'https://api.cloudflare.com/client/v4/zones/{zone_id}/purge_cache'
+PURGE_TIMEOUT = (3, 5)
+
+
+def share_urls(base_url, share_id):
+    """CDN 上可能快取該分享的 URL。"""
+    return [f"{base_url.rstrip('/')}/api/share/{share_id}"]
+
+
+def purge_urls(zone_id, api_token, urls):
+    """呼叫 Cloudflare API 清除指定 URL，回傳是否成功。"""
+    from app.services.http_client import get_pooled_http_session
+
+    try:
+        resp = get_pooled_http_session().post(
+            PURGE_URL.format(zone_id=zone_id),
+            json={'files': list(urls)},
+            headers={'Authorization': f'Bearer {api_token}'},
+            timeout=PURGE_TIMEOUT,
+        )
+        result = resp.json()
+        if result.get('success'):
+            return True
+        logger.warning(f'Cloudflare purge failed: {result.get("errors")}')
+    except Exception as exc:
+        logger.error(f'Cloudflare purge error: {exc}')
+    return False
+
+
+def purge_share_async(config, share_id):
+    """依 app config 於背景清除分享的 CDN 快取，不阻塞回應。"""
+    zone_id = config.get('CLOUDFLARE_ZONE_ID')
+    api_token = config.get('CLOUDFLARE_API_TOKEN')
+    base_url = config.get('PUBLIC_BASE_URL')
+    if not (zone_id and api_token and base_url):
+        return
+    threading.Thread(
+        target=purge_urls,
+        args=(zone_id, api_token, share_urls(base_url, share_id)),
+        name='cdn-purge',
+        daemon=True,
+    ).start()
@@ -0,0 +1,87 @@
+"""請求期限（deadline）— 由 route 設定總預算，傳遞到每一次上游呼叫與 retry。
+
+route 建立 ``Deadline(seconds)`` 後一路以 ``deadline=`` 參數傳入 service 與 GradeFetcher；
+每次上游請求只拿到剩餘時間：
+
+- ``DeadlineTimeout`` 交給 requests/urllib3 作為 timeout，urllib3 每次（含 retry）
+  重新 clone 時都會依當下剩餘時間縮短 connect/read timeout
+- ``LoggingRetry`` 在剩餘時間不足以等待 backoff 時停止 retry（見 ``http_client``）
+"""
+
+import contextvars
+import time
+from contextlib import contextmanager
+
+from urllib3.exceptions import ResponseError
+from urllib3.util.timeout import Timeout
+
+# 進行中的上游請求所屬的 deadline（供 urllib3 retry 判斷），只在 GradeFetcher._send 期間設定
+_current = contextvars.ContextVar('upstream_deadline', default=None)
+
+MIN_ATTEMPT_SECONDS = 0.05
+
+
+class DeadlineExceeded(Exception):
+    def __init__(self, message='學校系統回應逾時，請稍後再試'):
+        super().__init__(message)
+
+
+class RetryBudgetExhausted(ResponseError):
+    """urllib3 retry 因剩餘時間不足而放棄（requests 會包成 RetryError）。"""
+
+
+def is_budget_exhausted(exc):
+    reason = getattr(exc.args[0], 'reason', None) if exc.args else None
+    return isinstance(reason, RetryBudgetExhausted)
+
+
+class Deadline:
+    __slots__ = ('expires_at', '_clock')
+
+    def __init__(self, seconds, clock=time.monotonic):
+        self._clock = clock
+        self.expires_at = clock() + seconds
+
+    def remaining(self):
+        return max(0.0, self.expires_at - self._clock())
+
+    def check(self):
+        """剩餘時間不足以發出請求時拋出 DeadlineExceeded，否則回傳剩餘秒數。"""
+        remaining = self.remaining()
+        if remaining < MIN_ATTEMPT_SECONDS:
+            raise DeadlineExceeded()
+        return remaining
+
+    def clamp(self, seconds):
+        return min(seconds, self.remaining()) if seconds is not None else self.remaining()
+
+
+class DeadlineTimeout(Timeout):
+    """每次被 urllib3 clone（每個 attempt）時依剩餘時間縮短 connect/read timeout。"""
+
+    def __init__(self, deadline, connect=None, read=None):
+        self.deadline = deadline
+        self._base_connect = connect
+        self._base_read = read
+        remaining = max(deadline.remaining(), MIN_ATTEMPT_SECONDS)
+        super().__init__(
+            connect=min(connect, remaining) if connect is not None else remaining,
+            read=min(read, remaining) if read is not None else remaining,
+            total=remaining,
+        )
+
+    def clone(self):
+        return DeadlineTimeout(self.deadline, self._base_connect, self._base_read)
+
+
+def current_deadline():
+    return _current.get()
+
+
+@contextmanager
+def deadline_scope(deadline):
+    token = _current.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current.reset(token)
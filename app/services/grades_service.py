@@ -1,6 +1,77 @@
 
-def get_structure(fetcher, cookies, student_no, token):
-    return fetcher.get_structure_via_api(cookies, student_no, token)
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from app.services.single_flight import SingleFlight, make_key
+from app.services.structure_cache import (
+    STRUCTURE_EXAMS_TTL,
+    STRUCTURE_STALE_TTL,
+    STRUCTURE_YEARS_TTL,
+    exams_key,
+    get_or_load,
+    invalidate_structure,
+    read_tree,
+    tree_key,
+    write_tree,
+    years_key,
+)
+
+
+def get_structure(fetcher, cookies, student_no, token, redis_client=None, force_reload=False,
+                  years_ttl=STRUCTURE_YEARS_TTL, exams_ttl=STRUCTURE_EXAMS_TTL, stale_ttl=STRUCTURE_STALE_TTL,
+                  deadline=None):
+    if redis_client is None:
+        return fetcher.get_structure_via_api(cookies, student_no, token, deadline=deadline)
+
+    if force_reload:
+        invalidate_structure(redis_client, student_no)
+
+    items = get_or_load(
+        redis_client,
+        years_key(student_no),
+        lambda d: fetcher.get_year_terms_via_api(cookies, student_no, token, deadline=d),
+        years_ttl,
+        stale_ttl,
+        force=force_reload,
+        deadline=deadline,
+    )
+
+    def _cached_exams(year_value):
+        return get_or_load(
+            redis_client,
+            exams_key(year_value),
+            lambda d: fetcher.get_exams_via_api(cookies, student_no, token, year_value, deadline=d),
+            exams_ttl,
+            stale_ttl,
+            force=force_reload,
+            deadline=deadline,
+        )
+
+    # fetcher 模組（requests / 解析相關）延後到第一次查詢結構時才載入
+    from fetcher import build_structure
+
+    return build_structure(items, _cached_exams)
+
+
+def load_session_structure(sess, redis_client=None):
+    """取得 session 參照的結構樹；Redis 不可用時 session 內直接保存結構。"""
+    key = sess.get('structure_key')
+    if key and redis_client is not None:
+        return read_tree(redis_client, key)
+    return sess.get('structure')
+
+
+def store_session_structure(sess, redis_client, structure):
+    """結構樹存入共用快取，session 只保存 key；值未改變時不修改 session（避免多餘寫入）。"""
+    if redis_client is None:
+        sess['structure'] = structure
+        return
+
+    key = tree_key(sess['student_no'])
+    write_tree(redis_client, key, structure)
+    if sess.get('structure_key') != key:
+        sess['structure_key'] = key
+    if 'structure' in sess:
+        sess.pop('structure')
 
 
 def filter_grades_data(data):
@@ -76,6 +147,81 @@ def filter_grades_data(data):
     return data
 
 
-def fetch_grades(fetcher, cookies, student_no, token, year_value, exam_value):
-    raw_data = fetcher.fetch_grades_via_api(cookies, student_no, token, year_value, exam_value)
-    return filter_grades_data(raw_data)
+_grades_flight = SingleFlight('grades')
+
+
+def fetch_grades(fetcher, cookies, student_no, token, year_value, exam_value, coalesce_cache=None,
+                 result_cache=None, force=False, deadline=None):
+    """抓取並過濾成績；相同 (student_no, year_value, exam_value) 的並行請求共用一次上游呼叫。
+
+    coalesce_cache（GradesResultCache）有值時另以其 Redis 跨 worker 合併：leader 把結果寫入此
+    加密快取，其他 worker 收到完成訊號後從中解密讀取（Redis 中只有密文）。
+    result_cache（GradesResultCache）有值時先讀加密快取，force=True 則略過快取直接向學校查詢。
+    deadline（Deadline）有值時上游呼叫只使用剩餘時間，用盡時拋出 DeadlineExceeded。
+    """
+    if result_cache is not None and not force:
+        cached = result_cache.get(student_no, year_value, exam_value)
+        if cached is not None:
+            return cached
+
+    def _fetch():
+        raw_data = fetcher.fetch_grades_via_api(cookies, student_no, token, year_value, exam_value, deadline=deadline)
+        data = filter_grades_data(raw_data)
+        if result_cache is not None:
+            result_cache.set(student_no, year_value, exam_value, data)
+        if coalesce_cache is not None and coalesce_cache is not result_cache:
+            coalesce_cache.set(student_no, year_value, exam_value, data)
+        return data
+
+    key = make_key(student_no, year_value, exam_value)
+    if coalesce_cache is None:
+        return _grades_flight.do(key, _fetch)
+    return _grades_flight.do(
+        key, _fetch, redis_client=coalesce_cache.redis_client,
+        read_shared=lambda: coalesce_cache.get(student_no, year_value, exam_value),
+    )
+
+
+def fetch_all_grades(fetcher, cookies, student_no, token, structure, max_workers=4, result_cache=None,
+                     deadline=None):
+    """對 structure 中所有 (學年期, 考次) 以有界 thread pool 平行抓取成績，依完成順序逐筆 yield。
+
+    每筆為 dict：year / year_value / exam / exam_value / success，以及 data 或 error。
+    generator 被提前關閉（例如用戶端中斷連線）時會取消尚未開始的抓取。
+    所有抓取共用同一個 deadline，排在後面的考次只拿到剩餘時間。
+    """
+    jobs = []
+    for year_name, year_info in (structure or {}).items():
+        for exam in year_info.get('exams') or []:
+            if exam.get('value'):
+                jobs.append((year_name, year_info.get('year_value'), exam.get('text'), exam.get('value')))
+
+    if not jobs:
+        return
+
+    pool = ThreadPoolExecutor(max_workers=min(len(jobs), max_workers))
+    try:
+        futures = {
+            pool.submit(
+                fetch_grades, fetcher, cookies, student_no, token, year_value, exam_value,
+                result_cache=result_cache, deadline=deadline,
+            ): (year_name, year_value, exam_text, exam_value)
+            for year_name, year_value, exam_text, exam_value in jobs
+        }
+        for future in as_completed(futures):
+            year_name, year_value, exam_text, exam_value = futures[future]
+            item = {
+                'year': year_name,
+                'year_value': year_value,
+                'exam': exam_text,
+                'exam_value': exam_value,
+            }
+            try:
+                item['data'] = future.result()
+                item['success'] = True
+            except Exception as exc:
+                item['error'] = str(exc)
+                item['success'] = False
+            yield item
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
@@ -1,11 +1,19 @@
+import functools
 import os
 import requests
 import logging
 import certifi
-import tempfile
+import ssl
+import threading
+import time
+from http.cookiejar import DefaultCookiePolicy
+from urllib3.exceptions import MaxRetryError
 from urllib3.util.retry import Retry
 from requests.adapters import HTTPAdapter
 
+from app.services.deadline import MIN_ATTEMPT_SECONDS, RetryBudgetExhausted, current_deadline
+from app.services.metrics import record_tls_handshake, record_upstream, upstream_endpoint
+
 logger = logging.getLogger('SchoolGradesServer.HttpClient')
 
 class LoggingRetry(Retry):
@@ -16,6 +24,17 @@ class LoggingRetry(Retry):
         
         attempt = len(self.history) + 1 if self.history else 1
         status = response.status if response else "N/A"
+
+        # 請求帶有 deadline 時，剩餘時間不足以等待 backoff 再試一次就直接放棄
+        deadline = current_deadline()
+        if deadline is not None:
+            wait = new_retry.get_backoff_time()
+            if response is not None and self.respect_retry_after_header:
+                wait = max(wait, new_retry.get_retry_after(response) or 0)
+            if deadline.remaining() <= wait + MIN_ATTEMPT_SECONDS:
+                logger.warning(f"HTTP Retry skipped (deadline exhausted). Method: {method}, URL: {url}, Status: {status}")
+                reason = RetryBudgetExhausted(f"deadline exhausted after {error or status}")
+                raise MaxRetryError(_pool, url, reason) from error
         
         # 不要紀錄整個 response body 避免洩漏個資，只記錄 endpoint 與錯誤
         logger.warning(
@@ -36,35 +55,231 @@ class TimeoutSession(requests.Session):
             kwargs['timeout'] = self.default_timeout
         return super().request(method, url, **kwargs)
 
-_cached_ca_bundle_path = None
+_CERTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "certs")
+TWCA_CERT_PATH = os.path.join(_CERTS_DIR, "TWCA Secure SSL Certification Authority.crt")
+# 映像建置時由 scripts/build_ca_bundle.py 產生（certifi + TWCA），執行期不再寫檔
+PREBUILT_CA_BUNDLE = os.environ.get("CA_BUNDLE_PATH") or os.path.join(_CERTS_DIR, "ca-bundle.pem")
+
+_ssl_context = None
+_ssl_context_lock = threading.Lock()
+
+
+def build_ca_bundle(dest=PREBUILT_CA_BUNDLE):
+    """將 certifi 與 TWCA 中繼憑證合併寫入 dest（建置時執行）。"""
+    with open(certifi.where(), "r", encoding="utf-8") as f_ca:
+        base_certs = f_ca.read()
+    with open(TWCA_CERT_PATH, "r", encoding="utf-8") as f_custom:
+        custom_cert = f_custom.read()
+    tmp_path = dest + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f_out:
+        f_out.write(base_certs + "\n\n" + custom_cert + "\n")
+    os.replace(tmp_path, dest)
+    return dest
+
+
+class TLSSessionCache:
+    """依 server hostname 保留最近一個可 resume 的 TLS session。"""
+
+    def __init__(self):
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def get(self, host):
+        with self._lock:
+            session = self._sessions.get(host)
+        if session is None:
+            return None
+        if session.time + session.timeout <= time.time():
+            with self._lock:
+                if self._sessions.get(host) is session:
+                    del self._sessions[host]
+            return None
+        return session
+
+    def capture(self, host, ssl_sock):
+        """從 socket 取出 session；取得可 resume 的 session（有 ticket 或 session id）時回傳 True。"""
+        session = ssl_sock.session
+        if session is None or not (session.has_ticket or session.id):
+            return False
+        with self._lock:
+            self._sessions[host] = session
+        return True
+
+    def clear(self):
+        with self._lock:
+            self._sessions.clear()
+
+
+class _ResumableSSLSocket(ssl.SSLSocket):
+    # TLS 1.3 的 session ticket 在 handshake 後才隨第一次讀取送達，
+    # 因此在擁有此 socket 的 thread 讀取時補抓，避免跨 thread 存取 SSL 物件
+    _tls_session_host = None
+
+    def read(self, len=1024, buffer=None):
+        data = super().read(len, buffer)
+        host = self._tls_session_host
+        if host is not None and self.context.tls_sessions.capture(host, self):
+            self._tls_session_host = None
+        return data
+
+
+class ResumingSSLContext(ssl.SSLContext):
+    """新連線帶入同 host 上一條連線的 TLS session，並記錄 resumed / full handshake 次數。"""
+
+    sslsocket_class = _ResumableSSLSocket
+
+    def __init__(self, *args, **kwargs):
+        super().__init__()
+        self.tls_sessions = TLSSessionCache()
+
+    def wrap_socket(self, sock, server_side=False, do_handshake_on_connect=True,
+                    suppress_ragged_eofs=True, server_hostname=None, session=None):
+        if session is None and not server_side and server_hostname:
+            session = self.tls_sessions.get(server_hostname)
+        ssl_sock = super().wrap_socket(
+            sock, server_side=server_side, do_handshake_on_connect=do_handshake_on_connect,
+            suppress_ragged_eofs=suppress_ragged_eofs, server_hostname=server_hostname, session=session,
+        )
+        if not server_side and server_hostname and do_handshake_on_connect:
+            record_tls_handshake(server_hostname, ssl_sock.session_reused)
+            if not self.tls_sessions.capture(server_hostname, ssl_sock):
+                ssl_sock._tls_session_host = server_hostname
+        return ssl_sock
+
+
+def get_ssl_context() -> ResumingSSLContext:
+    """回傳 process 共用的 SSLContext（certifi + TWCA），CA 只解析一次，並啟用 TLS session resumption。"""
+    global _ssl_context
+    if _ssl_context is not None:
+        return _ssl_context
+    with _ssl_context_lock:
+        if _ssl_context is None:
+            context = ResumingSSLContext(ssl.PROTOCOL_TLS_CLIENT)
+            if os.path.isfile(PREBUILT_CA_BUNDLE):
+                context.load_verify_locations(cafile=PREBUILT_CA_BUNDLE)
+            else:
+                # 沒有預先建置的 bundle（本機開發）時直接載入兩個來源，不寫暫存檔
+                context.load_verify_locations(cafile=certifi.where())
+                if os.path.isfile(TWCA_CERT_PATH):
+                    context.load_verify_locations(cafile=TWCA_CERT_PATH)
+            _ssl_context = context
+    return _ssl_context
+
+
+class _ReuseTrackingConnection:
+    """在 urllib3 response 上標記這次請求是否沿用既有連線（``reused_connection``）。
 
-def _get_ca_bundle_path():
-    global _cached_ca_bundle_path
-    if _cached_ca_bundle_path is not None:
-        return _cached_ca_bundle_path
+    urllib3 只有在新連線或連線已斷開重連時才呼叫 connect()，因此 connect 後的第一個 response
+    為新連線，其後同一連線上的 response 皆為重用。
+    """
+
+    _fresh_connection = True
+
+    def connect(self):
+        self._fresh_connection = True
+        return super().connect()
+
+    def getresponse(self, *args, **kwargs):
+        response = super().getresponse(*args, **kwargs)
+        response.reused_connection = not self._fresh_connection
+        self._fresh_connection = False
+        return response
+
+
+@functools.lru_cache(maxsize=None)
+def _reuse_tracking_pool_class(pool_cls):
+    conn_cls = type(pool_cls.ConnectionCls.__name__, (_ReuseTrackingConnection, pool_cls.ConnectionCls), {})
+    return type(pool_cls.__name__, (pool_cls,), {'ConnectionCls': conn_cls})
+
+
+def _track_connection_reuse(manager):
+    manager.pool_classes_by_scheme = {
+        scheme: _reuse_tracking_pool_class(cls) for scheme, cls in manager.pool_classes_by_scheme.items()
+    }
+    return manager
+
+
+class SSLContextAdapter(HTTPAdapter):
+    """所有 pool（含 SOCKS proxy）共用 get_ssl_context()，不再依 session.verify 的路徑逐連線載入 CA。
+
+    各 pool 的連線會標記每個 response 是否沿用既有連線（見 ``_ReuseTrackingConnection``）。
+    """
+
+    def init_poolmanager(self, *args, **pool_kwargs):
+        pool_kwargs.setdefault("ssl_context", get_ssl_context())
+        super().init_poolmanager(*args, **pool_kwargs)
+        _track_connection_reuse(self.poolmanager)
+
+    def proxy_manager_for(self, proxy, **proxy_kwargs):
+        proxy_kwargs.setdefault("ssl_context", get_ssl_context())
+        known = proxy in self.proxy_manager
+        manager = super().proxy_manager_for(proxy, **proxy_kwargs)
+        if not known:
+            _track_connection_reuse(manager)
+        return manager
+
+    def cert_verify(self, conn, url, verify, cert):
+        super().cert_verify(conn, url, verify, cert)
+        if verify is True:
+            # requests 預設會把 certifi 路徑設為 ca_certs，urllib3 會對共用 context 重新載入
+            conn.ca_certs = None
+            conn.ca_cert_dir = None
+
+
+class _RejectAllCookiePolicy(DefaultCookiePolicy):
+    """拒絕將任何 response cookie 寫入 session 共用的 cookie jar。"""
+
+    def set_ok(self, cookie, request):
+        return False
+
+
+class PooledSession(TimeoutSession):
+    """跨 request / 跨使用者共用的 keep-alive session。
+
+    - session 本身不保存 cookie，使用者 cookie 必須每次以 ``cookies=`` 傳入
+    - ``close()`` 為 no-op，避免呼叫端誤關閉共用連線池；真正釋放請用 ``shutdown()``
+    - 每次請求記錄延遲、狀態碼、retry 次數、回應大小與是否重用連線（見 ``app.services.metrics``）
+    """
+
+    def __init__(self, timeout=None):
+        super().__init__(timeout=timeout)
+        self.cookies.set_policy(_RejectAllCookiePolicy())
 
-    cert_path = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "certs", "TWCA Secure SSL Certification Authority.crt")
-    if os.path.exists(cert_path):
-        combined_path = os.path.join(tempfile.gettempdir(), "twca_combined_ca_bundle.pem")
+    def request(self, method, url, **kwargs):
+        endpoint = upstream_endpoint(url)
+        start = time.perf_counter()
         try:
-            # Overwrite if missing or too small
-            if not os.path.exists(combined_path) or os.path.getsize(combined_path) < 100:
-                with open(certifi.where(), "r", encoding="utf-8") as f_ca:
-                    base_certs = f_ca.read()
-                with open(cert_path, "r", encoding="utf-8") as f_custom:
-                    custom_cert = f_custom.read()
-                with open(combined_path, "w", encoding="utf-8") as f_out:
-                    f_out.write(base_certs + "\n\n" + custom_cert + "\n")
-            _cached_ca_bundle_path = combined_path
-        except Exception as e:
-            logger.error(f"Failed to create combined CA bundle: {e}")
-            _cached_ca_bundle_path = certifi.where()  # fallback
-    else:
-        _cached_ca_bundle_path = certifi.where()
-    
-    return _cached_ca_bundle_path
+            response = super().request(method, url, **kwargs)
+        except Exception:
+            record_upstream(endpoint, time.perf_counter() - start, 'error')
+            raise
+        retries = getattr(response.raw, 'retries', None)
+        record_upstream(
+            endpoint,
+            time.perf_counter() - start,
+            response.status_code,
+            retries=len(retries.history) if retries is not None else 0,
+            nbytes=0 if kwargs.get('stream') else len(response.content),
+            reused=getattr(response.raw, 'reused_connection', None),
+            proxy=bool(self.proxies),
+        )
+        return response
+
+    def close(self):
+        pass
+
+    def shutdown(self):
+        super().close()
 
-def get_http_session() -> TimeoutSession:
+
+def _env_int(name, default):
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def get_http_session(pool_connections=None, pool_maxsize=None, session_cls=TimeoutSession) -> TimeoutSession:
     """
     Returns a requests.Session customized with default timeouts and automatic retries.
     Configurable via environment variables.
@@ -90,10 +305,8 @@ def get_http_session() -> TimeoutSession:
     except ValueError:
         backoff_factor = 0.5
 
-    session = TimeoutSession(timeout=(connect_timeout, read_timeout))
-    
-    session.verify = _get_ca_bundle_path()
-    
+    session = session_cls(timeout=(connect_timeout, read_timeout))
+
     retry_strategy = LoggingRetry(
         total=total_retries,
         backoff_factor=backoff_factor,
@@ -102,20 +315,56 @@ def get_http_session() -> TimeoutSession:
         respect_retry_after_header=True
     )
     
-    adapter = HTTPAdapter(max_retries=retry_strategy)
+    adapter_kwargs = {'max_retries': retry_strategy}
+    if pool_connections is not None:
+        adapter_kwargs['pool_connections'] = pool_connections
+    if pool_maxsize is not None:
+        adapter_kwargs['pool_maxsize'] = pool_maxsize
+    adapter = SSLContextAdapter(**adapter_kwargs)
     session.mount("http://", adapter)
     session.mount("https://", adapter)
     
     return session
 
 
-def get_school_http_session() -> TimeoutSession:
+def _env_float(name, default):
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def get_turnstile_http_session(pool_connections=None, pool_maxsize=None, session_cls=TimeoutSession) -> TimeoutSession:
+    """Cloudflare siteverify 用的 session：timeout 與 retry 獨立於學校系統，逾時快速失敗。"""
+    session = get_http_session(pool_connections, pool_maxsize, session_cls)
+    session.default_timeout = (
+        _env_float("TURNSTILE_TIMEOUT_CONNECT", 2.0),
+        _env_float("TURNSTILE_TIMEOUT_READ", 3.0),
+    )
+    retry_strategy = LoggingRetry(
+        total=_env_int("TURNSTILE_RETRY_TOTAL", 1),
+        # token 一次性：請求已送出後讀取逾時不重送，避免 Cloudflare 判定 duplicate
+        read=0,
+        backoff_factor=0.1,
+        status_forcelist=[500, 502, 503, 504],
+        allowed_methods=["POST"],
+    )
+    adapter_kwargs = {'max_retries': retry_strategy}
+    if pool_connections is not None:
+        adapter_kwargs['pool_connections'] = pool_connections
+    if pool_maxsize is not None:
+        adapter_kwargs['pool_maxsize'] = pool_maxsize
+    session.mount("https://", SSLContextAdapter(**adapter_kwargs))
+    return session
+
+
+def get_school_http_session(pool_connections=None, pool_maxsize=None, session_cls=TimeoutSession) -> TimeoutSession:
     """
     Returns a requests.Session for school system requests.
     If SCHOOL_SOCKS_PROXY is set (e.g. socks5://tailscale:1055), routes traffic
     through a Tailscale exit node. Otherwise behaves identically to get_http_session().
     """
-    session = get_http_session()
+    session = get_http_session(pool_connections, pool_maxsize, session_cls)
 
     socks_proxy = os.environ.get("SCHOOL_SOCKS_PROXY", "").strip()
     if socks_proxy:
@@ -133,3 +382,94 @@ def get_school_http_session() -> TimeoutSession:
         logger.info(f"School HTTP session using SOCKS proxy: {safe_addr}")
 
     return session
+
+
+# ---------------------------------------------------------------------------
+# Process-wide connection pools
+# ---------------------------------------------------------------------------
+
+_pooled_sessions = {}
+_pooled_sessions_lock = threading.Lock()
+
+
+def _get_pooled_session(name, factory):
+    session = _pooled_sessions.get(name)
+    if session is not None:
+        return session
+
+    with _pooled_sessions_lock:
+        session = _pooled_sessions.get(name)
+        if session is None:
+            session = factory(
+                pool_connections=_env_int("HTTP_POOL_CONNECTIONS", 10),
+                pool_maxsize=_env_int("HTTP_POOL_MAXSIZE", 20),
+                session_cls=PooledSession,
+            )
+            _pooled_sessions[name] = session
+        return session
+
+
+def get_pooled_http_session() -> PooledSession:
+    """回傳 process 共用、不走 proxy 的 keep-alive session。"""
+    return _get_pooled_session("default", get_http_session)
+
+
+def get_pooled_turnstile_http_session() -> PooledSession:
+    """回傳 process 共用的 Turnstile siteverify keep-alive session，避免每次驗證重新 TLS handshake。"""
+    return _get_pooled_session("turnstile", get_turnstile_http_session)
+
+
+def get_pooled_school_http_session() -> PooledSession:
+    """回傳 process 共用的學校系統 keep-alive session（依設定走 SOCKS proxy）。
+
+    此 session 不保存 cookie，呼叫端需以 ``cookies=`` 傳入各使用者的 cookie，
+    並用 ``merge_response_cookies()`` 收集 response 設定的 cookie。
+    """
+    return _get_pooled_session("school", get_school_http_session)
+
+
+def merge_response_cookies(jar, response):
+    """將 response（含 redirect history）設定的 cookie 合併進呼叫端自己的 jar。"""
+    for r in list(response.history) + [response]:
+        jar.update(r.cookies)
+    return jar
+
+
+def _pool_manager_stats(manager):
+    with manager.pools.lock:
+        pools = list(manager.pools._container.values())
+    return {
+        "pools": len(pools),
+        "connections_created": sum(p.num_connections for p in pools),
+        "requests": sum(p.num_requests for p in pools),
+        "idle_connections": sum(p.pool.qsize() for p in pools if p.pool is not None),
+    }
+
+
+def get_pool_stats():
+    """回傳各共用 session 的連線池統計（供 health / metrics 使用）。"""
+    stats = {}
+    for name, session in list(_pooled_sessions.items()):
+        adapter = session.get_adapter("https://")
+        managers = [adapter.poolmanager] + list(adapter.proxy_manager.values())
+        totals = {"pools": 0, "connections_created": 0, "requests": 0, "idle_connections": 0}
+        for manager in managers:
+            for key, value in _pool_manager_stats(manager).items():
+                totals[key] += value
+        totals["pool_connections"] = adapter._pool_connections
+        totals["pool_maxsize"] = adapter._pool_maxsize
+        stats[name] = totals
+    return stats
+
+
+def pooled_session_uses_proxy(name):
+    session = _pooled_sessions.get(name)
+    return bool(session is not None and session.proxies)
+
+
+def reset_pooled_sessions():
+    """關閉並清除所有共用 session（測試或 fork 後重建連線用）。"""
+    with _pooled_sessions_lock:
+        for session in _pooled_sessions.values():
+            session.shutdown()
+        _pooled_sessions.clear()
@@ -0,0 +1,167 @@
+"""Prometheus 指標 — 上游學校系統呼叫、Redis 指令與 route 延遲。
+
+- 上游：每個端點的延遲 histogram、狀態碼、retry 次數、回應位元組
+- 連線池：各 pool 建立的連線數與處理的請求數（兩者比值即連線重用率），並標示是否走 proxy；
+  另逐次上游請求記錄是否沿用既有（proxy / keep-alive）連線
+- TLS：依 host 的 resumed / full handshake 次數（兩者比值即 session resumption 命中率）
+- Redis：依指令名稱的延遲 histogram（pipeline 視為一次 ``PIPELINE``）
+- Route：依 URL rule / method / status 的延遲 histogram
+
+gunicorn 多 worker 時設定 ``PROMETHEUS_MULTIPROC_DIR``，/metrics 會彙整所有 worker 的數值。
+"""
+
+import os
+import time
+
+import redis
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from redis.client import Pipeline
+
+UPSTREAM_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 8.0, 13.0, 20.0, 30.0)
+REDIS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+ROUTE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+UPSTREAM_LATENCY = Histogram(
+    'school_upstream_request_seconds', 'Upstream request latency, including redirects and retries',
+    ['endpoint'], buckets=UPSTREAM_BUCKETS,
+)
+UPSTREAM_REQUESTS = Counter(
+    'school_upstream_requests_total', 'Upstream requests by final status', ['endpoint', 'status'],
+)
+UPSTREAM_RETRIES = Counter(
+    'school_upstream_retries_total', 'Upstream retries performed by urllib3', ['endpoint'],
+)
+UPSTREAM_BYTES = Counter(
+    'school_upstream_response_bytes_total', 'Upstream response body bytes', ['endpoint'],
+)
+UPSTREAM_CONNECTIONS = Counter(
+    'school_upstream_connection_reuse_total',
+    'Upstream requests by whether they reused a pooled (keep-alive / proxy) connection',
+    ['endpoint', 'proxy', 'reused'],
+)
+TLS_HANDSHAKES = Counter(
+    'tls_handshakes_total', 'Outgoing TLS handshakes by host and whether the session was resumed',
+    ['host', 'result'],
+)
+REDIS_LATENCY = Histogram(
+    'redis_command_seconds', 'Redis command round-trip latency', ['command'], buckets=REDIS_BUCKETS,
+)
+ROUTE_LATENCY = Histogram(
+    'http_request_seconds', 'Flask route latency until the response object is returned',
+    ['route', 'method', 'status'], buckets=ROUTE_BUCKETS,
+)
+
+# (URL 片段, 端點名稱)，依序比對
+_UPSTREAM_ENDPOINTS = (
+    ('/Auth/Auth/CloudLogin', 'login_page'),
+    ('/Auth/Auth/GetCaptcha', 'captcha'),
+    ('/Auth/Auth/DoCloudLoginCheck', 'login_check'),
+    ('/ICampus/StudentInfo/Index', 'grades_page'),
+    ('GetGradeCanQueryYearTermListByStudentNo', 'structure'),
+    ('GetGradeCanQueryExamNoListByStudentNo', 'exams'),
+    ('GetScoreForStudentExamContent', 'grades'),
+    ('challenges.cloudflare.com/turnstile/', 'turnstile'),
+)
+
+
+def upstream_endpoint(url):
+    for marker, name in _UPSTREAM_ENDPOINTS:
+        if marker in url:
+            return name
+    return 'other'
+
+
+def record_upstream(endpoint, seconds, status, retries=0, nbytes=0, reused=None, proxy=False):
+    """reused 為 None 表示未知（例如請求失敗、沒有拿到連線）。"""
+    UPSTREAM_LATENCY.labels(endpoint).observe(seconds)
+    UPSTREAM_REQUESTS.labels(endpoint, str(status)).inc()
+    if reused is not None:
+        UPSTREAM_CONNECTIONS.labels(
+            endpoint, 'true' if proxy else 'false', 'true' if reused else 'false'
+        ).inc()
+    if retries:
+        UPSTREAM_RETRIES.labels(endpoint).inc(retries)
+    if nbytes:
+        UPSTREAM_BYTES.labels(endpoint).inc(nbytes)
+
+
+def record_tls_handshake(host, resumed):
+    TLS_HANDSHAKES.labels(host, 'resumed' if resumed else 'full').inc()
+
+
+class InstrumentedPipeline(Pipeline):
+    def execute(self, raise_on_error=True):
+        start = time.perf_counter()
+        try:
+            return super().execute(raise_on_error)
+        finally:
+            REDIS_LATENCY.labels('PIPELINE').observe(time.perf_counter() - start)
+
+
+class InstrumentedRedis(redis.Redis):
+    """記錄每個指令延遲的 Redis client，用法與 ``redis.Redis`` 相同。"""
+
+    def execute_command(self, *args, **options):
+        start = time.perf_counter()
+        try:
+            return super().execute_command(*args, **options)
+        finally:
+            command = args[0] if args else 'UNKNOWN'
+            if isinstance(command, bytes):
+                command = command.decode('ascii', 'replace')
+            REDIS_LATENCY.labels(str(command).upper()).observe(time.perf_counter() - start)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return InstrumentedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+class _ProcessCollector:
+    """只存在於本 process 的狀態（連線池、log queue），於 scrape 時讀取。"""
+
+    def describe(self):
+        # 註冊時不實際讀取狀態（http_client 可能尚未載入完成）
+        return []
+
+    def collect(self):
+        from app.extensions import get_dropped_log_count
+        from app.services.http_client import get_pool_stats, pooled_session_uses_proxy
+
+        pid = str(os.getpid())
+        created = CounterMetricFamily(
+            'http_pool_connections_created', 'Connections opened by the process-wide pool',
+            labels=['pool', 'proxy', 'pid'],
+        )
+        requests_total = CounterMetricFamily(
+            'http_pool_requests', 'Requests sent through the process-wide pool (reuse = 1 - created / requests)',
+            labels=['pool', 'proxy', 'pid'],
+        )
+        idle = GaugeMetricFamily(
+            'http_pool_idle_connections', 'Idle keep-alive connections', labels=['pool', 'proxy', 'pid'],
+        )
+        for name, stats in get_pool_stats().items():
+            labels = [name, 'true' if pooled_session_uses_proxy(name) else 'false', pid]
+            created.add_metric(labels, stats['connections_created'])
+            requests_total.add_metric(labels, stats['requests'])
+            idle.add_metric(labels, stats['idle_connections'])
+
+        dropped = CounterMetricFamily('log_records_dropped', 'Log records dropped on queue overflow', labels=['pid'])
+        dropped.add_metric([pid], get_dropped_log_count())
+        return [created, requests_total, idle, dropped]
+
+
+_process_collector = _ProcessCollector()
+REGISTRY.register(_process_collector)
+
+
+def render_metrics():
+    """回傳 (body, content_type)。"""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        registry.register(_process_collector)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
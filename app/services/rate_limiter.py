@@ -1,17 +1,149 @@
-"""速率限制服務 — 基於 Redis 固定視窗計數器。"""
+"""速率限制服務 — 以 Redis Lua script 在單一 round-trip 內原子完成。
 
+支援三種演算法：
 
-def is_rate_limited(redis_client, ip, max_attempts=5, window_seconds=60, key_prefix="login"):
-    """檢查指定 IP 是否超過速率限制。
+- ``fixed``：固定視窗計數器（INCR + EXPIRE 於同一 script，不會留下沒有 TTL 的 key）
+- ``sliding``：滑動視窗 log（ZSET 記錄每次嘗試時間）
+- ``gcra``：Generic Cell Rate Algorithm，只存一個 TAT 時間戳
 
-    使用 Redis INCR + EXPIRE 的固定視窗計數器策略。
+時間一律取 Redis server 的 TIME，避免多個 worker 時鐘不一致。
+
+Redis 之前另有 process 內的 token bucket 預先過濾明顯的洪水請求；
+Redis 無法使用時也改由本機 bucket 限制，而不是直接放行。
+"""
+
+import logging
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger('SchoolGradesServer.RateLimiter')
+
+PREFILTER_CAPACITY = 20             # 每個 IP 的瞬間突發上限
+PREFILTER_REFILL_PER_SECOND = 0.5   # 每秒補充的 token 數（約每分鐘 30 次）
+LOCAL_MAX_ENTRIES = 10000           # 本機 bucket 最多追蹤的 key 數，超過以 LRU 淘汰
+
+FIXED_WINDOW_LUA = """
+local limit = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local current = redis.call('INCR', KEYS[1])
+local ttl = redis.call('TTL', KEYS[1])
+if ttl < 0 then
+    redis.call('EXPIRE', KEYS[1], window)
+    ttl = window
+end
+if current > limit then
+    return {1, 0, ttl}
+end
+return {0, limit - current, 0}
+"""
+
+SLIDING_WINDOW_LUA = """
+local limit = tonumber(ARGV[1])
+local window_ms = tonumber(ARGV[2]) * 1000
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now - window_ms)
+local count = redis.call('ZCARD', KEYS[1])
+if count >= limit then
+    local oldest = redis.call('ZRANGE', KEYS[1], 0, 0, 'WITHSCORES')
+    local retry_ms = window_ms
+    if oldest[2] then
+        retry_ms = tonumber(oldest[2]) + window_ms - now
+    end
+    return {1, 0, math.max(1, math.ceil(retry_ms / 1000))}
+end
+redis.call('ZADD', KEYS[1], now, ARGV[3])
+redis.call('PEXPIRE', KEYS[1], window_ms)
+return {0, limit - count - 1, 0}
+"""
+
+GCRA_LUA = """
+local limit = tonumber(ARGV[1])
+local period_ms = tonumber(ARGV[2]) * 1000
+local interval = period_ms / limit
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local tat = tonumber(redis.call('GET', KEYS[1]) or now)
+if tat < now then
+    tat = now
+end
+local new_tat = tat + interval
+local allow_at = new_tat - period_ms
+if allow_at > now then
+    return {1, 0, math.max(1, math.ceil((allow_at - now) / 1000))}
+end
+redis.call('SET', KEYS[1], new_tat, 'PX', math.ceil(new_tat - now))
+return {0, math.floor((period_ms - (new_tat - now)) / interval), 0}
+"""
+
+# 多個固定視窗限制一次檢查：全部計數後，任一超限即視為受限
+FIXED_WINDOW_BATCH_LUA = """
+local limited = 0
+local remaining = -1
+local retry_after = 0
+for i, key in ipairs(KEYS) do
+    local limit = tonumber(ARGV[i * 2 - 1])
+    local window = tonumber(ARGV[i * 2])
+    local current = redis.call('INCR', key)
+    local ttl = redis.call('TTL', key)
+    if ttl < 0 then
+        redis.call('EXPIRE', key, window)
+        ttl = window
+    end
+    local left = limit - current
+    if left < 0 then
+        left = 0
+    end
+    if remaining < 0 or left < remaining then
+        remaining = left
+    end
+    if current > limit then
+        limited = 1
+        if ttl > retry_after then
+            retry_after = ttl
+        end
+    end
+end
+return {limited, remaining, retry_after}
+"""
+
+# 退還一次固定視窗計數（不會低於 0，也不會建立新 key）
+REFUND_LUA = """
+local current = tonumber(redis.call('GET', KEYS[1]) or '0')
+if current > 0 then
+    redis.call('DECR', KEYS[1])
+end
+return current
+"""
+
+_SCRIPTS = {
+    'fixed': FIXED_WINDOW_LUA,
+    'sliding': SLIDING_WINDOW_LUA,
+    'gcra': GCRA_LUA,
+}
+
+
+def _rate_limit_key(key_prefix, subject):
+    return f"rate_limit:{key_prefix}:{subject}"
+
+
+def _to_result(raw):
+    limited, remaining, retry_after = (int(v) for v in raw)
+    return bool(limited), max(remaining, 0), retry_after
+
+
+def is_rate_limited(redis_client, ip, max_attempts=5, window_seconds=60, key_prefix="login", algorithm="fixed"):
+    """檢查指定 IP（或其他識別）是否超過速率限制，只需一次 Redis round-trip。
 
     Args:
         redis_client: Redis 連線實例。
-        ip: 客戶端 IP 位址。
+        ip: 客戶端 IP 位址或其他限制對象（如學號）。
         max_attempts: 視窗內最大嘗試次數。
         window_seconds: 視窗長度（秒）。
         key_prefix: Redis key 的前綴
+        algorithm: ``fixed``、``sliding`` 或 ``gcra``。
 
     Returns:
         tuple: (is_limited, remaining, retry_after)
@@ -19,17 +151,145 @@ def is_rate_limited(redis_client, ip, max_attempts=5, window_seconds=60, key_pre
             - remaining (int): 剩餘可用次數。
             - retry_after (int): 若被限速，需等待的秒數。
     """
-    key = f"rate_limit:{key_prefix}:{ip}"
+    try:
+        source = _SCRIPTS[algorithm]
+    except KeyError:
+        raise ValueError(f"Unknown rate limit algorithm: {algorithm}")
+
+    script = redis_client.register_script(source)
+    key = _rate_limit_key(key_prefix, ip)
+    args = [max_attempts, window_seconds]
+    if algorithm == 'sliding':
+        args.append(secrets.token_hex(8))
+    return _to_result(script(keys=[key], args=args))
+
 
-    current = redis_client.incr(key)
+def check_rate_limits(redis_client, limits):
+    """一次原子檢查多個固定視窗限制（例如同時限制 IP 與學號）。
+
+    Args:
+        redis_client: Redis 連線實例。
+        limits: [(key_prefix, subject, max_attempts, window_seconds), ...]
+
+    Returns:
+        tuple: (is_limited, remaining, retry_after)，remaining 取各限制的最小值，
+        retry_after 取受限者中最長的等待秒數。
+    """
+    keys = []
+    args = []
+    for key_prefix, subject, max_attempts, window_seconds in limits:
+        keys.append(_rate_limit_key(key_prefix, subject))
+        args.extend([max_attempts, window_seconds])
+    script = redis_client.register_script(FIXED_WINDOW_BATCH_LUA)
+    return _to_result(script(keys=keys, args=args))
 
-    if current == 1:
-        redis_client.expire(key, window_seconds)
 
-    if current > max_attempts:
-        ttl = redis_client.ttl(key)
-        retry_after = ttl if ttl > 0 else window_seconds
-        return True, 0, retry_after
+class _Bucket:
+    __slots__ = ('tokens', 'updated')
 
-    remaining = max_attempts - current
-    return False, remaining, 0
+    def __init__(self, tokens, updated):
+        self.tokens = tokens
+        self.updated = updated
+
+
+class TokenBucketLimiter:
+    """Process 內、thread-safe 的 token bucket 集合，記憶體以 LRU 上限控制。"""
+
+    def __init__(self, max_entries=LOCAL_MAX_ENTRIES, clock=time.monotonic):
+        self.max_entries = max_entries
+        self._clock = clock
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def consume(self, key, capacity, refill_per_second):
+        """嘗試取用一個 token，回傳 (allowed, remaining, retry_after)。"""
+        now = self._clock()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = _Bucket(float(capacity), now)
+                self._buckets[key] = bucket
+                if len(self._buckets) > self.max_entries:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+                bucket.tokens = min(float(capacity), bucket.tokens + (now - bucket.updated) * refill_per_second)
+                bucket.updated = now
+
+            if bucket.tokens >= 1:
+                bucket.tokens -= 1
+                return True, int(bucket.tokens), 0
+
+            retry_after = (1 - bucket.tokens) / refill_per_second if refill_per_second > 0 else 60
+            return False, 0, max(1, int(retry_after + 0.999))
+
+    def refund(self, key, capacity):
+        """退還先前 consume 取用的一個 token（不超過 capacity）。"""
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.tokens = min(float(capacity), bucket.tokens + 1)
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+_local_limiter = TokenBucketLimiter()
+
+
+def prefilter(ip, limiter=None):
+    """本機預先過濾：明顯洪水的 IP 直接拒絕，不觸及 Redis。回傳 (is_limited, retry_after)。"""
+    if limiter is None:
+        limiter = _local_limiter
+    allowed, _remaining, retry_after = limiter.consume(
+        f"prefilter:{ip}", PREFILTER_CAPACITY, PREFILTER_REFILL_PER_SECOND
+    )
+    return not allowed, retry_after
+
+
+def rate_limit(redis_client, subject, max_attempts=5, window_seconds=60, key_prefix="login",
+               prefilter_ip=None, limiter=None):
+    """完整的速率限制流程：本機預過濾 → Redis 共用限制 → Redis 不可用時以本機 bucket 代替。
+
+    Returns:
+        tuple: (is_limited, remaining, retry_after)，與 is_rate_limited 相同。
+    """
+    if limiter is None:
+        limiter = _local_limiter
+    if prefilter_ip is not None:
+        limited, retry_after = prefilter(prefilter_ip, limiter)
+        if limited:
+            return True, 0, retry_after
+
+    if redis_client is not None:
+        try:
+            return is_rate_limited(
+                redis_client, subject,
+                max_attempts=max_attempts,
+                window_seconds=window_seconds,
+                key_prefix=key_prefix,
+            )
+        except Exception as exc:
+            logger.error(f'Redis rate limiter error, falling back to local limiter: {exc}')
+
+    allowed, remaining, retry_after = limiter.consume(
+        f"{key_prefix}:{subject}", max_attempts, max_attempts / window_seconds
+    )
+    return not allowed, remaining, retry_after
+
+
+def refund_rate_limit(redis_client, subject, max_attempts=5, key_prefix="login", limiter=None):
+    """退還 rate_limit 先前計入的一次嘗試（例如之後才判定請求無效）。
+
+    只退還 Redis / 本機限制的計數，本機預過濾的 token 不退還，洪水請求仍會被擋下。
+    """
+    if limiter is None:
+        limiter = _local_limiter
+    if redis_client is not None:
+        try:
+            script = redis_client.register_script(REFUND_LUA)
+            script(keys=[_rate_limit_key(key_prefix, subject)], args=[])
+            return
+        except Exception as exc:
+            logger.error(f'Redis rate limit refund failed, refunding local limiter: {exc}')
+    limiter.refund(f"{key_prefix}:{subject}", max_attempts)
@@ -0,0 +1,130 @@
+"""Redis 啟動連線 — 背景連線並記錄就緒狀態，create_app 不必等待 ping。
+
+狀態：
+- ``connecting``：第一次連線嘗試尚未完成
+- ``connected``：已連上，呼叫 ``on_ready(client)`` 把 client 交給各元件（session、限流、快取…）
+- ``unavailable``：第一次嘗試失敗，各元件以 Redis 為 None 的本機備援運作；背景持續重試
+  ``retry_seconds`` 秒，期間連上即切換為 ``connected``
+
+備援期間建立的檔案 session 在 Redis 就緒後第一次被使用時搬到 Redis（沿用同一個 session id），
+使用者不會因為切換而被登出。
+"""
+
+import logging
+import threading
+import time
+
+import redis
+from flask.sessions import SessionInterface
+
+logger = logging.getLogger('SchoolGradesServer.RedisReadiness')
+
+CONNECTING = 'connecting'
+CONNECTED = 'connected'
+UNAVAILABLE = 'unavailable'
+
+
+class RedisReadiness:
+    def __init__(self, client, on_ready, retry_seconds=30.0, interval=1.0, clock=time.monotonic):
+        self.client = client
+        self.on_ready = on_ready
+        self.retry_seconds = retry_seconds
+        self.interval = interval
+        self.state = CONNECTING
+        self._clock = clock
+        self._settled = threading.Event()
+        self._stop = threading.Event()
+
+    def start(self):
+        threading.Thread(target=self._run, name='redis-readiness', daemon=True).start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def disable(self):
+        """不連線 Redis，直接以本機備援運作（測試環境使用，避免連到開發者本機的 Redis）。"""
+        self.state = UNAVAILABLE
+        self._settled.set()
+        return self
+
+    def wait(self, timeout=None):
+        """等待第一次連線嘗試完成（最多 timeout 秒），回傳當下狀態。"""
+        self._settled.wait(timeout)
+        return self.state
+
+    @property
+    def ready(self):
+        return self.state == CONNECTED
+
+    def _run(self):
+        give_up_at = self._clock() + self.retry_seconds
+        while True:
+            try:
+                self.client.ping()
+            except (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError) as exc:
+                if self.state == CONNECTING:
+                    logger.warning(f'Redis not available, using local fallbacks while retrying: {exc}')
+                    self.state = UNAVAILABLE
+                    self._settled.set()
+                if self._clock() >= give_up_at or self._stop.wait(self.interval):
+                    logger.warning('Redis still unavailable, staying on local fallbacks')
+                    return
+                continue
+            self.on_ready(self.client)
+            self.state = CONNECTED
+            self._settled.set()
+            logger.info('Redis connected')
+            return
+
+
+class FallbackSessionInterface(SessionInterface):
+    """Redis 就緒時使用 Redis session，否則使用備援（檔案）session。
+
+    備援 interface 由 ``fallback_factory`` 在第一次需要時建立（Redis 正常時不必載入 cachelib）。
+    以開啟 session 時所用的 interface 儲存，避免同一個請求中途切換。
+    """
+
+    def __init__(self, redis_interface, fallback_factory, readiness):
+        self.redis_interface = redis_interface
+        self.readiness = readiness
+        self._fallback_factory = fallback_factory
+        self._fallback = None
+        self._lock = threading.Lock()
+
+    @property
+    def fallback_interface(self):
+        if self._fallback is None:
+            with self._lock:
+                if self._fallback is None:
+                    self._fallback = self._fallback_factory()
+        return self._fallback
+
+    def open_session(self, app, request):
+        if not self.readiness.ready:
+            interface = self.fallback_interface
+            session = interface.open_session(app, request)
+        else:
+            interface = self.redis_interface
+            session = interface.open_session(app, request)
+            if self._fallback is not None:
+                session = self._migrate(app, request, session)
+        if session is not None:
+            session._interface = interface
+        return session
+
+    def _migrate(self, app, request, session):
+        """Redis 中沒有這個 session id、但備援中有時，以相同 id 搬到 Redis（儲存時寫入）。"""
+        sid = request.cookies.get(app.config['SESSION_COOKIE_NAME'])
+        if not sid or session.sid == sid:
+            return session
+        old = self._fallback.open_session(app, request)
+        if old is None or old.sid != sid or not old:
+            return session
+        migrated = self.redis_interface.session_class(dict(old), sid=sid)
+        migrated.modified = True
+        return migrated
+
+    def save_session(self, app, session, response):
+        interface = getattr(session, '_interface', None) or self.fallback_interface
+        return interface.save_session(app, session, response)
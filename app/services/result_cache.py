@@ -0,0 +1,69 @@
+"""成績結果短期快取 — 以 session 衍生金鑰加密後存入 Redis。
+
+快取的是已經過 ``filter_grades_data`` 的 payload。加密金鑰由伺服器 SECRET_KEY 與
+該次登入的 api_token 以 HMAC-SHA256 衍生，Redis 中只會有 AES-GCM 密文；
+使用者重新登入後 token 改變，舊快取即無法解密而自然失效。
+"""
+
+import hashlib
+import hmac
+import json
+import logging
+import os
+
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+from app.services.single_flight import make_key
+
+logger = logging.getLogger('SchoolGradesServer.ResultCache')
+
+NONCE_BYTES = 12
+
+
+def derive_cache_key(secret_key, api_token):
+    return hmac.new(
+        str(secret_key).encode('utf-8'),
+        b'grades-cache:' + str(api_token).encode('utf-8'),
+        hashlib.sha256,
+    ).digest()
+
+
+class GradesResultCache:
+    def __init__(self, redis_client, secret_key, api_token, ttl):
+        self.redis_client = redis_client
+        self.ttl = ttl
+        self._aead = AESGCM(derive_cache_key(secret_key, api_token))
+
+    @staticmethod
+    def _redis_key(student_no, year_value, exam_value):
+        return f"grades_cache:{make_key(student_no, year_value, exam_value)}"
+
+    @staticmethod
+    def _aad(student_no, year_value, exam_value):
+        return f"{student_no}|{year_value}|{exam_value}".encode('utf-8')
+
+    def get(self, student_no, year_value, exam_value):
+        try:
+            blob = self.redis_client.get(self._redis_key(student_no, year_value, exam_value))
+        except Exception as exc:
+            logger.error(f'Grades cache read failed: {exc}')
+            return None
+        if not blob or len(blob) <= NONCE_BYTES:
+            return None
+        try:
+            plaintext = self._aead.decrypt(
+                blob[:NONCE_BYTES], blob[NONCE_BYTES:], self._aad(student_no, year_value, exam_value)
+            )
+            return json.loads(plaintext)
+        except Exception:
+            # 金鑰不符（例如重新登入）或資料損毀，視同未命中
+            return None
+
+    def set(self, student_no, year_value, exam_value, data):
+        nonce = os.urandom(NONCE_BYTES)
+        plaintext = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        blob = nonce + self._aead.encrypt(nonce, plaintext, self._aad(student_no, year_value, exam_value))
+        try:
+            self.redis_client.setex(self._redis_key(student_no, year_value, exam_value), self.ttl, blob)
+        except Exception as exc:
+            logger.error(f'Grades cache write failed: {exc}')
@@ -0,0 +1,113 @@
+"""分享 payload 的 Redis 儲存格式（versioned codec）。
+
+v1：``b"GS\\x01"`` + zlib(精簡 JSON UTF-8, zdict=ZDICT_V1)
+
+以壓縮後的 JSON 而非 msgpack 等二進位格式儲存：壓縮率幾乎相同，但解壓後即是可直接
+回應給用戶端的 JSON bytes，不需要再 json.loads / json.dumps。
+
+ZDICT_V1 是依 ``filter_grades_data`` 輸出的欄位結構手工組成的 preset dictionary
+（科目名稱 + 一份典型 payload），並非以實際分享資料訓練：真實成績屬個資，repo 中沒有可用的
+樣本。小型 payload 仍因欄位名稱與固定字串都在字典中而有良好壓縮率（見 test_share）。
+
+字典內容一旦發佈就不可更改，``ZDICT_V1_ID``（zlib 串流標頭中的 Adler-32 字典 id）固定了
+這個版本；需要調整（例如改用匿名化樣本訓練）時請新增版本（v2），並保留舊版本解碼。
+
+舊格式（未壓縮 JSON 字串）仍可讀取。
+"""
+
+import json
+import zlib
+
+MAGIC = b"GS"
+VERSION_V1 = 1
+COMPRESS_LEVEL = 9
+
+
+def _sample_subject(name):
+    return {
+        'SubjectName': name,
+        'ScoreDisplay': '84.00',
+        'Score': 84,
+        'ClassAVGScoreDisplay': '72.30',
+        'ClassAVGScore': 72.3,
+        'ClassRank': 5,
+        'ClassRankCount': 36,
+        'YearRank': 45,
+        'YearRankCount': 360,
+        'YearTermDisplay': '114 學年度 上學期',
+    }
+
+
+def _sample_standard(name):
+    return {
+        'SubjectName': name,
+        '頂標': 88, '前標': 80, '均標': 72, '後標': 63, '底標': 56, '標準差': 9.2,
+        '大於90Count': 3, '大於80Count': 6, '大於70Count': 12, '大於60Count': 10, '大於50Count': 3,
+        '大於40Count': 2, '大於30Count': 0, '大於20Count': 0, '大於10Count': 0, '大於0Count': 0,
+    }
+
+
+_SAMPLE_SUBJECTS = ['國語文', '英語文', '數學A', '數學B', '歷史', '地理', '公民與社會', '物理', '化學', '生物', '地球科學']
+
+_SAMPLE = {
+    'Message': '',
+    'Status': 'Success',
+    'Result': {
+        'StudentName': '',
+        'StudentClassName': '高二 1 班',
+        'StudentSeatNo': '12',
+        'StudentNo': '',
+        'GetDataTimeDisplay': '2026/03/15 20:00',
+        'Show班級排名': True,
+        'Show班級排名人數': True,
+        'Show類組排名': True,
+        'Show類組排名人數': True,
+        'ExamItem': {'ExamName': '第一次段考', 'ClassRank': 8, 'ClassCount': 36, '類組排名': 28, '類組排名Count': 220},
+        'SubjectExamInfoList': [_sample_subject(n) for n in _SAMPLE_SUBJECTS[:3]],
+        '成績五標List': [_sample_standard(n) for n in _SAMPLE_SUBJECTS[:3]],
+    },
+}
+
+# zlib 會優先匹配字典尾端的內容，最常出現的結構放在最後
+ZDICT_V1 = (
+    ' '.join(_SAMPLE_SUBJECTS) + ' 第二次段考 期末考 下學期 null'
+).encode('utf-8') + json.dumps(_SAMPLE, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+# zlib 串流標頭中的字典 id；ZDICT_V1 被改動時 test_share 會失敗
+ZDICT_V1_ID = 795506360
+_ZDICT_V1_ID_BYTES = ZDICT_V1_ID.to_bytes(4, 'big')
+
+
+def dumps_json(data) -> bytes:
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def encode_json_bytes(json_bytes: bytes) -> bytes:
+    """將已序列化的 JSON bytes 編碼為目前版本的儲存格式。"""
+    compressor = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, zlib.MAX_WBITS, zdict=ZDICT_V1)
+    return MAGIC + bytes([VERSION_V1]) + compressor.compress(json_bytes) + compressor.flush()
+
+
+def encode(data) -> bytes:
+    return encode_json_bytes(dumps_json(data))
+
+
+def decode_json_bytes(stored) -> bytes:
+    """將儲存值還原成 JSON bytes（支援舊版未壓縮 JSON）。"""
+    if isinstance(stored, str):
+        return stored.encode('utf-8')
+    if stored[:2] == MAGIC and len(stored) > 2:
+        version = stored[2]
+        if version == VERSION_V1:
+            # zlib 標頭 2 bytes 後接 4 bytes 字典 id
+            if stored[5:9] != _ZDICT_V1_ID_BYTES:
+                raise ValueError('Share codec v1 dictionary id mismatch')
+            decompressor = zlib.decompressobj(zlib.MAX_WBITS, zdict=ZDICT_V1)
+            return decompressor.decompress(stored[3:]) + decompressor.flush()
+        raise ValueError(f'Unknown share codec version: {version}')
+    return bytes(stored)
+
+
+def decode(stored):
+    return json.loads(decode_json_bytes(stored))
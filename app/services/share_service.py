@@ -1,8 +1,11 @@
+import hashlib
 import json
 import secrets
 import string
 from datetime import datetime, timezone
 
+from app.services import share_codec
+
 CHARS = string.ascii_letters + string.digits + '-_.~'
 SHARE_ID_LENGTH = 15
 SHARE_MAX_PAYLOAD_BYTES = 512_000  # 500 KB
@@ -16,12 +19,17 @@ def is_valid_share_id(share_id):
     return len(share_id) == SHARE_ID_LENGTH and all(c in CHARS for c in share_id)
 
 
-def validate_share_payload(data, max_bytes=SHARE_MAX_PAYLOAD_BYTES):
+_STRIPPED_FIELDS = frozenset(('turnstile_token', 'share_expiry'))
+
+
+def validate_share_payload(data, max_bytes=SHARE_MAX_PAYLOAD_BYTES, raw_size=None):
     """校驗分享 payload 的大小與結構。
 
     Args:
         data: 解析後的 JSON dict。
-        max_bytes: 序列化後允許的最大位元組數。
+        max_bytes: 允許的最大位元組數。
+        raw_size: 原始 request body 的位元組數；提供時直接以此檢查大小，
+            不再為了量測而重新序列化。
 
     Returns:
         tuple: (is_valid, error_message, cleaned_data)
@@ -29,15 +37,11 @@ def validate_share_payload(data, max_bytes=SHARE_MAX_PAYLOAD_BYTES):
     if not isinstance(data, dict):
         return False, 'Payload 必須為 JSON 物件', None
 
-    # 剝離非必要欄位
-    cleaned = {k: v for k, v in data.items() if k not in ('turnstile_token', 'share_expiry')}
-
-    # 大小檢查
-    serialized = json.dumps(cleaned, ensure_ascii=False)
-    if len(serialized.encode('utf-8')) > max_bytes:
+    if raw_size is not None and raw_size > max_bytes:
         return False, f'Payload 超過大小限制（{max_bytes // 1000}KB）', None
 
-    # 結構校驗
+    # 剝離非必要欄位並同時做結構校驗
+    cleaned = {k: v for k, v in data.items() if k not in _STRIPPED_FIELDS}
     result = cleaned.get('Result')
     if not isinstance(result, dict):
         return False, '缺少 Result 資料', None
@@ -45,30 +49,158 @@ def validate_share_payload(data, max_bytes=SHARE_MAX_PAYLOAD_BYTES):
     if not isinstance(result.get('SubjectExamInfoList'), list):
         return False, '缺少 SubjectExamInfoList 成績清單', None
 
+    if raw_size is None and len(share_codec.dumps_json(cleaned)) > max_bytes:
+        return False, f'Payload 超過大小限制（{max_bytes // 1000}KB）', None
+
     return True, None, cleaned
 
 
+def prepare_share_payload(data, raw_size, max_bytes=SHARE_MAX_PAYLOAD_BYTES):
+    """校驗後只序列化一次，回傳可直接交給 create_share / update_share 的 JSON bytes。
+
+    Returns:
+        tuple: (is_valid, error_message, json_bytes)
+    """
+    valid, err, cleaned = validate_share_payload(data, max_bytes, raw_size=raw_size)
+    if not valid:
+        return False, err, None
+    return True, None, share_codec.dumps_json(cleaned)
+
+
 def write_shared_data(redis_client, share_id, data, ttl=7200):
     cache_key = f"share:{share_id}"
-    redis_client.setex(cache_key, ttl, json.dumps(data, ensure_ascii=False))
+    redis_client.setex(cache_key, ttl, share_codec.encode(data))
 
 
-def write_share_metadata(redis_client, share_id, creator_student_no, ttl=7200):
-    cache_key = f"share_meta:{share_id}"
-    metadata = {
+def content_hash(json_bytes):
+    """分享內容的雜湊值（作為 strong ETag），內容不變則雜湊不變。"""
+    return hashlib.sha256(json_bytes).hexdigest()[:32]
+
+
+def _build_share_metadata(creator_student_no, ttl, content_hash_value=None):
+    meta = {
         'creator_student_no': creator_student_no,
         'created_at': datetime.now(timezone.utc).isoformat(),
         'ttl_seconds': ttl,
     }
-    redis_client.setex(cache_key, ttl, json.dumps(metadata, ensure_ascii=False))
+    if content_hash_value:
+        meta['content_hash'] = content_hash_value
+    return json.dumps(meta, ensure_ascii=False)
+
+
+def write_share_metadata(redis_client, share_id, creator_student_no, ttl=7200):
+    cache_key = f"share_meta:{share_id}"
+    redis_client.setex(cache_key, ttl, _build_share_metadata(creator_student_no, ttl))
+
+
+def create_share(redis_client, share_id, json_bytes, creator_student_no, ttl=7200):
+    """以單一 MULTI/EXEC 交易同時寫入分享內容與 metadata（含內容雜湊），兩者 TTL 一致。
+
+    json_bytes 為 prepare_share_payload 產生的序列化內容。
+    """
+    pipe = redis_client.pipeline(transaction=True)
+    pipe.setex(f"share:{share_id}", ttl, share_codec.encode_json_bytes(json_bytes))
+    pipe.setex(
+        f"share_meta:{share_id}", ttl,
+        _build_share_metadata(creator_student_no, ttl, content_hash(json_bytes)),
+    )
+    pipe.execute()
+
+
+# 檢查擁有者、更新 metadata 的內容雜湊與 TTL 並覆寫分享內容，全部在同一個 script 內原子完成
+UPDATE_SHARE_LUA = """
+local meta_raw = redis.call('GET', KEYS[2])
+if not meta_raw then
+    return {'not_found', 0}
+end
+local ok, meta = pcall(cjson.decode, meta_raw)
+if not ok or type(meta) ~= 'table' then
+    return {'conflict', 0}
+end
+local owner = meta['creator_student_no']
+if type(owner) ~= 'string' or owner == '' then
+    return {'forbidden', 0}
+end
+if owner ~= ARGV[1] then
+    return {'forbidden', 0}
+end
+local ttl = tonumber(meta['ttl_seconds'] or ARGV[3])
+local allowed = false
+for i = 5, #ARGV do
+    if tonumber(ARGV[i]) == ttl then
+        allowed = true
+    end
+end
+if not allowed then
+    return {'conflict', 0}
+end
+meta['content_hash'] = ARGV[4]
+redis.call('SET', KEYS[2], cjson.encode(meta), 'EX', ttl)
+redis.call('SET', KEYS[1], ARGV[2], 'EX', ttl)
+return {'ok', ttl}
+"""
+
+
+def update_share(redis_client, share_id, json_bytes, requester_student_no, allowed_ttls, default_ttl=7200):
+    """原子更新分享內容（json_bytes 為 prepare_share_payload 產生的序列化內容）。
+
+    Returns:
+        tuple: (status, ttl)，status 為 ``ok``、``not_found``、``forbidden`` 或 ``conflict``。
+    """
+    script = redis_client.register_script(UPDATE_SHARE_LUA)
+    status, ttl = script(
+        keys=[f"share:{share_id}", f"share_meta:{share_id}"],
+        args=[
+            requester_student_no,
+            share_codec.encode_json_bytes(json_bytes),
+            default_ttl,
+            content_hash(json_bytes),
+            *allowed_ttls,
+        ],
+    )
+    if isinstance(status, bytes):
+        status = status.decode('ascii')
+    return status, int(ttl)
 
 
 def read_shared_data(redis_client, share_id):
     cache_key = f"share:{share_id}"
-    data_str = redis_client.get(cache_key)
-    if not data_str:
+    stored = redis_client.get(cache_key)
+    if not stored:
         return None
-    return json.loads(data_str)
+    return share_codec.decode(stored)
+
+
+def read_share_etag(redis_client, share_id):
+    """只讀取 metadata 中的內容雜湊，不載入分享內容；舊分享或不存在時回傳 None。"""
+    meta = read_share_metadata(redis_client, share_id)
+    if not meta:
+        return None
+    return meta.get('content_hash') or None
+
+
+def read_shared_entry(redis_client, share_id):
+    """一次 round-trip 讀取分享內容與 metadata。
+
+    Returns:
+        tuple: (json_bytes, etag)，分享不存在時為 (None, None)。
+        舊分享的 metadata 沒有內容雜湊時，以讀到的內容即時計算。
+    """
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.get(f"share:{share_id}")
+    pipe.get(f"share_meta:{share_id}")
+    stored, meta_raw = pipe.execute()
+    if not stored:
+        return None, None
+
+    json_bytes = share_codec.decode_json_bytes(stored)
+    etag = None
+    if meta_raw:
+        try:
+            etag = json.loads(meta_raw).get('content_hash')
+        except (ValueError, AttributeError):
+            etag = None
+    return json_bytes, etag or content_hash(json_bytes)
 
 
 def read_share_metadata(redis_client, share_id):
@@ -77,8 +209,3 @@ def read_share_metadata(redis_client, share_id):
     if not data_str:
         return None
     return json.loads(data_str)
-
-
-def refresh_share_metadata_ttl(redis_client, share_id, ttl=7200):
-    cache_key = f"share_meta:{share_id}"
-    return redis_client.expire(cache_key, ttl) == 1
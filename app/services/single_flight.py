@@ -0,0 +1,136 @@
+"""Single-flight 請求合併 — 相同 key 的並行呼叫共用同一次上游請求。
+
+同一 worker 內以 threading.Event 合併；若提供 redis_client，則另以
+``singleflight:lock:<key>`` 鎖與 ``singleflight:result:<key>`` 結果槽跨 gunicorn worker 合併。
+跟隨者取得 leader 的結果，或收到 leader 的錯誤。
+
+跨 worker 的結果槽只放「完成 / 錯誤」訊號，不放結果本身（成績等個資不以明文進 Redis）；
+其他 worker 的跟隨者收到完成訊號後以 ``read_shared()`` 從呼叫端自己的儲存（例如加密快取）
+讀取結果，讀不到時自行執行 fn()。
+"""
+
+import hashlib
+import json
+import logging
+import threading
+import time
+
+logger = logging.getLogger('SchoolGradesServer.SingleFlight')
+
+REDIS_LOCK_TTL = 30         # leader 鎖的最長持有時間（秒）
+REDIS_RESULT_TTL = 5        # 結果槽保留時間（秒），只需涵蓋等待中的跟隨者
+REDIS_POLL_INTERVAL = 0.05
+
+
+class SingleFlightError(RuntimeError):
+    """跨 worker 跟隨者收到的 leader 錯誤。"""
+
+
+class _Call:
+    __slots__ = ('event', 'result', 'error')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+def make_key(*parts):
+    """將識別資訊雜湊成 key，避免學號等個資直接出現在 Redis key 中。"""
+    raw = '\x1f'.join(str(p) for p in parts)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()[:32]
+
+
+class SingleFlight:
+    def __init__(self, namespace):
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn, redis_client=None, wait_timeout=REDIS_LOCK_TTL, read_shared=None):
+        """執行 fn() 或等待相同 key 進行中的呼叫，回傳其結果（或拋出其錯誤）。
+
+        read_shared 為其他 worker 的 leader 完成後讀取結果的函式（回傳 None 表示讀不到）；
+        未提供時跟隨者在 leader 完成後自行執行 fn()。
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            if redis_client is not None:
+                call.result = self._do_shared(key, fn, redis_client, wait_timeout, read_shared)
+            else:
+                call.result = fn()
+            return call.result
+        except Exception as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+
+    def _do_shared(self, key, fn, redis_client, wait_timeout, read_shared):
+        lock_key = f"singleflight:lock:{self.namespace}:{key}"
+        result_key = f"singleflight:result:{self.namespace}:{key}"
+
+        try:
+            acquired = redis_client.set(lock_key, 1, nx=True, ex=REDIS_LOCK_TTL)
+        except Exception as exc:
+            logger.error(f'Single-flight lock error: {exc}')
+            return fn()
+
+        if acquired:
+            try:
+                result = fn()
+                self._publish(redis_client, result_key, {'ok': True})
+                return result
+            except Exception as exc:
+                self._publish(redis_client, result_key, {'ok': False, 'error': str(exc)})
+                raise
+            finally:
+                try:
+                    redis_client.delete(lock_key)
+                except Exception:
+                    pass
+
+        # 其他 worker 正在抓取：輪詢結果槽，直到結果出現或 leader 鎖消失
+        deadline = time.monotonic() + wait_timeout
+        while time.monotonic() < deadline:
+            try:
+                raw = redis_client.get(result_key)
+                if raw:
+                    slot = json.loads(raw)
+                    if slot.get('ok'):
+                        result = read_shared() if read_shared is not None else None
+                        if result is not None:
+                            return result
+                        break
+                    raise SingleFlightError(slot.get('error') or 'upstream error')
+                if not redis_client.exists(lock_key):
+                    break
+            except SingleFlightError:
+                raise
+            except Exception as exc:
+                logger.error(f'Single-flight poll error: {exc}')
+                break
+            time.sleep(REDIS_POLL_INTERVAL)
+
+        return fn()
+
+    @staticmethod
+    def _publish(redis_client, result_key, slot):
+        try:
+            redis_client.setex(result_key, REDIS_RESULT_TTL, json.dumps(slot, ensure_ascii=False))
+        except Exception as exc:
+            logger.error(f'Single-flight publish error: {exc}')
@@ -0,0 +1,168 @@
+"""靜態資源索引 — 內容雜湊 ETag、預壓縮版本與小檔記憶體快取。
+
+- 啟動時掃描 ``public/`` 的 index.html 與 ``dist/``（其他檔案首次請求時載入），
+  以內容 SHA-256 產生 strong ETag，``If-None-Match`` 相符時回 304
+- 建置時 ``scripts/compress-assets.js`` 為 dist 產生 ``.br`` / ``.gz``；缺少 ``.gz``
+  的可壓縮檔案在載入時以 gzip 壓縮一次存於記憶體，依 ``Accept-Encoding`` 選擇版本
+- 不超過 ``cache_max_bytes`` 的檔案（含壓縮版本）保存在記憶體，之後不再讀取磁碟
+
+各編碼版本各有自己的 ETag（``"<hash>"``、``"<hash>-br"``、``"<hash>-gzip"``）。
+``reload=True``（開發環境）時每次請求檢查 mtime/size，檔案變更即重新載入。
+"""
+
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import threading
+
+from flask import current_app, request, send_file
+from werkzeug.exceptions import NotFound
+from werkzeug.security import safe_join
+
+logger = logging.getLogger('SchoolGradesServer.StaticAssets')
+
+# 依偏好順序
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+COMPRESSIBLE_EXT = {'.html', '.css', '.js', '.json', '.svg', '.webmanifest', '.xml', '.txt', '.ico', '.ttf'}
+COMPRESS_MIN_BYTES = 1024
+CACHE_MAX_BYTES = 512 * 1024
+
+# index.html 引用帶 hash 的 bundle，每次都以 ETag 重新驗證（未變更時回 304）
+INDEX_CACHE_CONTROL = 'no-cache'
+
+mimetypes.add_type('application/manifest+json', '.webmanifest')
+
+
+class _Variant:
+    __slots__ = ('path', 'data', 'etag')
+
+    def __init__(self, path, data, etag):
+        self.path = path
+        self.data = data
+        self.etag = etag
+
+
+class StaticAsset:
+    __slots__ = ('mimetype', 'stat_key', 'variants')
+
+    def __init__(self, mimetype, stat_key, variants):
+        self.mimetype = mimetype
+        self.stat_key = stat_key
+        # encoding（identity 為 None）-> _Variant
+        self.variants = variants
+
+    @property
+    def etag(self):
+        return self.variants[None].etag
+
+
+def _stat_key(path):
+    st = os.stat(path)
+    return st.st_mtime_ns, st.st_size
+
+
+class StaticAssetIndex:
+    def __init__(self, root, cache_max_bytes=CACHE_MAX_BYTES, reload=False):
+        self.root = os.path.abspath(root)
+        self.cache_max_bytes = cache_max_bytes
+        self.reload = reload
+        self._assets = {}
+        self._lock = threading.Lock()
+
+    def warm(self, paths=('index.html', 'dist')):
+        """預先載入指定檔案/目錄下的所有資源，回傳載入數量。"""
+        count = 0
+        for rel in paths:
+            full = os.path.join(self.root, rel)
+            if os.path.isfile(full):
+                count += self.get(rel) is not None
+                continue
+            for dirpath, dirnames, filenames in os.walk(full):
+                dirnames[:] = [d for d in dirnames if not d.startswith('.')]
+                for name in filenames:
+                    if name.startswith('.') or name.endswith(('.br', '.gz')):
+                        continue
+                    relpath = os.path.relpath(os.path.join(dirpath, name), self.root).replace(os.sep, '/')
+                    count += self.get(relpath) is not None
+        logger.info('Static asset index loaded %d files from %s', count, self.root)
+        return count
+
+    def get(self, filename):
+        """回傳 StaticAsset；檔案不存在或路徑不安全時回傳 None。"""
+        asset = self._assets.get(filename)
+        if asset is not None and not self.reload:
+            return asset
+
+        path = safe_join(self.root, filename)
+        if path is None or not os.path.isfile(path):
+            return None
+        if asset is not None and asset.stat_key == _stat_key(path):
+            return asset
+
+        asset = self._load(path)
+        with self._lock:
+            self._assets[filename] = asset
+        return asset
+
+    def _load(self, path):
+        stat_key = _stat_key(path)
+        with open(path, 'rb') as f:
+            data = f.read()
+        digest = hashlib.sha256(data).hexdigest()[:32]
+        cacheable = len(data) <= self.cache_max_bytes
+        variants = {None: _Variant(path, data if cacheable else None, f'"{digest}"')}
+
+        for encoding, suffix in ENCODINGS:
+            encoded_path = path + suffix
+            if os.path.isfile(encoded_path) and _stat_key(encoded_path)[0] >= stat_key[0]:
+                size = os.path.getsize(encoded_path)
+                encoded = None
+                if size <= self.cache_max_bytes:
+                    with open(encoded_path, 'rb') as f:
+                        encoded = f.read()
+                variants[encoding] = _Variant(encoded_path, encoded, f'"{digest}-{encoding}"')
+            elif encoding == 'gzip' and self._compressible(path, len(data)):
+                encoded = gzip.compress(data, compresslevel=6, mtime=0)
+                if len(encoded) < len(data):
+                    variants[encoding] = _Variant(None, encoded, f'"{digest}-{encoding}"')
+
+        mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        return StaticAsset(mimetype, stat_key, variants)
+
+    @staticmethod
+    def _compressible(path, size):
+        return size >= COMPRESS_MIN_BYTES and os.path.splitext(path)[1].lower() in COMPRESSIBLE_EXT
+
+    def select(self, asset, accept_encodings):
+        """依 Accept-Encoding 選擇版本，回傳 (encoding, variant)；encoding 為 None 表示未壓縮。"""
+        for encoding, _suffix in ENCODINGS:
+            if encoding in asset.variants and accept_encodings[encoding] > 0:
+                return encoding, asset.variants[encoding]
+        return None, asset.variants[None]
+
+
+def send_asset(filename, cache_control):
+    """以 app 的 STATIC_ASSETS 索引回應靜態檔案（處理壓縮版本選擇、ETag 與 304）。"""
+    index = current_app.config['STATIC_ASSETS']
+    asset = index.get(filename)
+    if asset is None:
+        raise NotFound()
+
+    encoding, variant = index.select(asset, request.accept_encodings)
+    # If-None-Match 為弱比較（CDN 重新壓縮時會把 ETag 改成 W/）
+    if request.if_none_match.contains_weak(variant.etag.strip('"')):
+        response = current_app.response_class(status=304)
+    elif variant.data is not None:
+        response = current_app.response_class(variant.data, mimetype=asset.mimetype)
+    else:
+        response = send_file(variant.path, mimetype=asset.mimetype, conditional=False, etag=False)
+
+    response.headers['ETag'] = variant.etag
+    response.headers['Cache-Control'] = cache_control
+    if encoding is not None:
+        response.headers['Content-Encoding'] = encoding
+    if len(asset.variants) > 1:
+        response.vary.add('Accept-Encoding')
+    return response
@@ -0,0 +1,134 @@
+"""學年度/考次結構快取 — 跨 session 共用的 Redis 兩層快取。
+
+- ``structure:years:<student_no>``：該學生可查詢的學年期清單
+- ``structure:exams:<year_value>``：某學年期的考次清單（全校幾乎相同，跨學生共用）
+- ``structure:tree:<student_no>``：組合完成的結構樹，session 只保存這個 key 作為參照
+
+每筆資料記錄寫入時間；超過 fresh TTL 但仍在 stale 視窗內時先回傳舊值，
+並於背景重新抓取（stale-while-revalidate）。
+
+loader 以 ``loader(deadline)`` 呼叫：前景載入使用請求的 deadline，背景重新抓取則有自己的
+``REFRESH_DEADLINE_SECONDS`` 預算，不受原請求結束影響；抓取完成（或失敗）即釋放 refresh 鎖。
+"""
+
+import json
+import logging
+import threading
+import time
+
+logger = logging.getLogger('SchoolGradesServer.StructureCache')
+
+STRUCTURE_YEARS_TTL = 600       # 學年期清單新鮮時間（秒）
+STRUCTURE_EXAMS_TTL = 1800      # 考次清單新鮮時間（秒）
+STRUCTURE_STALE_TTL = 3600      # 過期後仍可回傳舊值的時間（秒）
+REFRESH_LOCK_TTL = 30
+REFRESH_DEADLINE_SECONDS = 20   # 背景重新抓取的預算，須小於 REFRESH_LOCK_TTL
+STRUCTURE_TREE_TTL = 86400      # 與 session 存活時間相同
+
+
+def years_key(student_no):
+    return f"structure:years:{student_no}"
+
+
+def exams_key(year_value):
+    return f"structure:exams:{year_value}"
+
+
+def tree_key(student_no):
+    return f"structure:tree:{student_no}"
+
+
+def _read_entry(redis_client, key, ttl):
+    """回傳 (value, is_stale)；沒有快取或讀取失敗時回傳 (None, False)。"""
+    try:
+        raw = redis_client.get(key)
+    except Exception as exc:
+        logger.error(f'Structure cache read failed for {key}: {exc}')
+        return None, False
+    if not raw:
+        return None, False
+    try:
+        entry = json.loads(raw)
+        return entry['value'], time.time() - entry['fetched_at'] > ttl
+    except (ValueError, KeyError, TypeError):
+        return None, False
+
+
+def _write_entry(redis_client, key, value, ttl, stale_ttl):
+    entry = {'value': value, 'fetched_at': time.time()}
+    try:
+        redis_client.setex(key, ttl + stale_ttl, json.dumps(entry, ensure_ascii=False))
+    except Exception as exc:
+        logger.error(f'Structure cache write failed for {key}: {exc}')
+
+
+def _refresh_in_background(redis_client, key, loader, ttl, stale_ttl):
+    lock_key = f"{key}:refresh"
+    try:
+        acquired = redis_client.set(lock_key, 1, nx=True, ex=REFRESH_LOCK_TTL)
+    except Exception:
+        acquired = False
+    if not acquired:
+        return
+
+    def _run():
+        from app.services.deadline import Deadline
+
+        try:
+            value = loader(Deadline(REFRESH_DEADLINE_SECONDS))
+            if value:
+                _write_entry(redis_client, key, value, ttl, stale_ttl)
+        except Exception as exc:
+            # 失敗時保留舊值，stale 視窗內的下一個請求會再觸發重新抓取
+            logger.warning(f'Background structure refresh failed for {key}: {exc}')
+        finally:
+            try:
+                redis_client.delete(lock_key)
+            except Exception:
+                pass
+
+    threading.Thread(target=_run, name='structure-refresh', daemon=True).start()
+
+
+def get_or_load(redis_client, key, loader, ttl, stale_ttl=STRUCTURE_STALE_TTL, force=False, deadline=None):
+    """讀取快取，未命中或 force 時呼叫 loader(deadline) 並寫回；空結果不寫入快取。"""
+    if not force:
+        value, is_stale = _read_entry(redis_client, key, ttl)
+        if value is not None:
+            if is_stale:
+                _refresh_in_background(redis_client, key, loader, ttl, stale_ttl)
+            return value
+
+    value = loader(deadline)
+    if value:
+        _write_entry(redis_client, key, value, ttl, stale_ttl)
+    return value
+
+
+def invalidate_structure(redis_client, student_no):
+    """刪除學生的學年期清單與其涵蓋的考次清單快取（reload=true 時使用）。"""
+    value, _ = _read_entry(redis_client, years_key(student_no), STRUCTURE_YEARS_TTL)
+    keys = [years_key(student_no)]
+    for _name, year_value in value or []:
+        keys.append(exams_key(year_value))
+    try:
+        redis_client.delete(*keys)
+    except Exception as exc:
+        logger.error(f'Structure cache invalidation failed: {exc}')
+
+
+def read_tree(redis_client, key):
+    """讀取 session 參照的結構樹；不存在或讀取失敗時回傳 None。"""
+    try:
+        raw = redis_client.get(key)
+        return json.loads(raw) if raw else None
+    except Exception as exc:
+        logger.error(f'Structure tree read failed for {key}: {exc}')
+        return None
+
+
+def write_tree(redis_client, key, structure, ttl=STRUCTURE_TREE_TTL):
+    try:
+        redis_client.setex(key, ttl, json.dumps(structure, ensure_ascii=False, separators=(',', ':')))
+    except Exception as exc:
+        logger.error(f'Structure tree write failed for {key}: {exc}')
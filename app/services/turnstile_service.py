@@ -1,19 +1,125 @@
-from flask import current_app
+from concurrent.futures import Future, ThreadPoolExecutor
 
-from app.services.http_client import get_http_session
+from flask import current_app
 
+import hashlib
+import hmac
 import logging
 import os
+import threading
+import time
 
 logger = logging.getLogger('SchoolGradesServer.TurnstileService')
 
+
+def get_pooled_turnstile_http_session():
+    # requests / http_client 延後到第一次驗證時才載入
+    from app.services.http_client import get_pooled_turnstile_http_session as _get_session
+
+    return _get_session()
+
 VERIFY_URL = 'https://challenges.cloudflare.com/turnstile/v0/siteverify'
 
+# 驗證成功的 token 在此秒數內重送（例如前端逾時重試同一請求）直接放行，不再呼叫 siteverify；
+# 只涵蓋短暫的重試，不應成為可重複使用的通行證
+TURNSTILE_CACHE_TTL = 30
+_LOCAL_CACHE_MAX = 10000
+
+_local_verified = {}
+_local_lock = threading.Lock()
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _cache_key(secret_key, token, remoteip, action, identity):
+    # 只存 HMAC，Redis 中不會出現可重放的 token 原文或帳號；
+    # 綁定端點、請求身分（帳號/學號）與來源 IP，同一 token 不能用在其他端點或其他帳號
+    identity_hash = hashlib.sha256((identity or '').encode('utf-8')).hexdigest()
+    digest = hmac.new(
+        secret_key.encode('utf-8'),
+        f'{action}|{identity_hash}|{token}|{remoteip or ""}'.encode('utf-8'),
+        hashlib.sha256,
+    ).hexdigest()
+    return f'turnstile:ok:{action}:{digest}'
+
+
+def _is_cached(redis_client, key):
+    if redis_client is not None:
+        try:
+            return bool(redis_client.exists(key))
+        except Exception as exc:
+            logger.error(f'Turnstile cache read failed: {exc}')
+            return False
+    with _local_lock:
+        expires_at = _local_verified.get(key)
+        if expires_at is None:
+            return False
+        if expires_at <= time.monotonic():
+            del _local_verified[key]
+            return False
+        return True
+
+
+def _remember(redis_client, key, ttl):
+    if redis_client is not None:
+        try:
+            redis_client.set(key, 1, ex=ttl)
+        except Exception as exc:
+            logger.error(f'Turnstile cache write failed: {exc}')
+        return
+    now = time.monotonic()
+    with _local_lock:
+        if len(_local_verified) >= _LOCAL_CACHE_MAX:
+            for stale in [k for k, exp in _local_verified.items() if exp <= now]:
+                del _local_verified[stale]
+            if len(_local_verified) >= _LOCAL_CACHE_MAX:
+                _local_verified.clear()
+        _local_verified[key] = now + ttl
+
 
-def verify_turnstile_token(token, remoteip=None):
+def clear_local_cache():
+    with _local_lock:
+        _local_verified.clear()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=int(os.environ.get('TURNSTILE_VERIFY_WORKERS', 8)),
+                    thread_name_prefix='turnstile-verify',
+                )
+    return _executor
+
+
+def verify_turnstile_token_async(token, remoteip=None, action=None, identity=None):
+    """在背景 thread 驗證 token，回傳 Future（結果同 verify_turnstile_token），讓呼叫端同時進行其他上游請求。
+
+    缺少 token 時不需呼叫 siteverify，直接回傳已完成的 Future，呼叫端可在送出上游請求前拒絕。
+    """
+    if not token:
+        future = Future()
+        future.set_result(verify_turnstile_token(token, remoteip=remoteip, action=action, identity=identity))
+        return future
+
+    app = current_app._get_current_object()
+
+    def _verify():
+        with app.app_context():
+            return verify_turnstile_token(token, remoteip=remoteip, action=action, identity=identity)
+
+    return _get_executor().submit(_verify)
+
+
+def verify_turnstile_token(token, remoteip=None, action=None, identity=None):
     """驗證 Cloudflare Turnstile token。
 
     若 TURNSTILE_SECRET_KEY 未設定，僅在開發/測試環境放行，生產環境則阻擋。
+    已驗證成功的 token 在 TURNSTILE_CACHE_TTL 秒內以相同端點（action）、身分（identity）
+    與來源 IP 重送時直接放行；未指定 action 時不使用快取。
     回傳 (success, error_message)。
     """
     secret_key = current_app.config.get('TURNSTILE_SECRET_KEY')
@@ -35,8 +141,16 @@ def verify_turnstile_token(token, remoteip=None):
     if not token:
         return False, '缺少人機驗證 token'
 
+    cache_ttl = current_app.config.get('TURNSTILE_CACHE_TTL', TURNSTILE_CACHE_TTL)
+    redis_client = current_app.config.get('REDIS_CLIENT')
+    if action is None:
+        cache_ttl = 0
+    key = _cache_key(secret_key, token, remoteip, action, identity)
+    if cache_ttl > 0 and _is_cached(redis_client, key):
+        return True, None
+
     try:
-        session = get_http_session()
+        session = get_pooled_turnstile_http_session()
         data = {'secret': secret_key, 'response': token}
         if remoteip:
             data['remoteip'] = remoteip
@@ -48,6 +162,8 @@ def verify_turnstile_token(token, remoteip=None):
         result = resp.json()
 
         if result.get('success'):
+            if cache_ttl > 0:
+                _remember(redis_client, key, cache_ttl)
             return True, None
 
         error_codes = result.get('error-codes', [])
@@ -0,0 +1,325 @@
+"""學校系統上游保護 — 跨 worker 共用的 circuit breaker 與 process 內的自適應併發上限。
+
+- Circuit breaker（每個上游端點一組）：``window`` 秒內失敗至少 ``threshold`` 次、且失敗占
+  該視窗請求數的比例達 ``failure_ratio`` 時開路 ``open_seconds`` 秒（流量大時零星失敗不會開路），期間直接失敗；到期後只放行一個探測請求（half-open），
+  成功則關閉、失敗則再次開路。狀態存於 Redis ``circuit:<endpoint>``，所有 worker 一致；
+  沒有 Redis 時退回 process 內狀態。
+- 併發上限（AIMD）：成功且延遲低於目標時上限緩慢增加，失敗或過慢時減半。
+  超過上限的請求最多排隊 ``queue_timeout`` 秒，逾時即失敗，不讓 route thread 堆積。
+- async 版本（``UpstreamGuard.acall``）：breaker 的 Redis 讀寫交給 executor，排隊以 asyncio
+  等待，不阻塞 event loop；與同步呼叫共用同一組 breaker 與併發上限。
+
+失敗的定義為例外（逾時、連線錯誤）或 5xx 回應。
+"""
+
+import asyncio
+import functools
+import logging
+import threading
+import time
+
+logger = logging.getLogger('SchoolGradesServer.UpstreamGuard')
+
+REJECT = 0
+ALLOW = 1
+PROBE = 2
+
+ALLOW_LUA = """
+local opened_until = tonumber(redis.call('HGET', KEYS[1], 'opened_until') or '0')
+if opened_until == 0 then
+    return 1
+end
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+if now < opened_until then
+    return 0
+end
+if redis.call('SET', KEYS[2], 1, 'NX', 'PX', ARGV[1]) then
+    return 2
+end
+return 0
+"""
+
+# 記錄一次結果（ARGV[1]=1 成功 / 0 失敗），回傳 1 表示此次開路
+RECORD_LUA = """
+local ok = tonumber(ARGV[1])
+local threshold = tonumber(ARGV[2])
+local window_ms = tonumber(ARGV[3]) * 1000
+local open_ms = tonumber(ARGV[4])
+local ratio = tonumber(ARGV[5])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local opened_until = tonumber(redis.call('HGET', KEYS[1], 'opened_until') or '0')
+local trip = false
+if opened_until > 0 then
+    if ok == 1 or now < opened_until then
+        return 0
+    end
+    -- half-open 探測失敗
+    trip = true
+else
+    local total = redis.call('HINCRBY', KEYS[1], 'total', 1)
+    if total == 1 then
+        redis.call('PEXPIRE', KEYS[1], window_ms)
+    end
+    if ok == 1 then
+        return 0
+    end
+    local failures = redis.call('HINCRBY', KEYS[1], 'failures', 1)
+    trip = failures >= threshold and failures >= ratio * total
+end
+if trip then
+    redis.call('HSET', KEYS[1], 'opened_until', now + open_ms, 'failures', 0, 'total', 0)
+    redis.call('PEXPIRE', KEYS[1], open_ms + window_ms)
+    redis.call('DEL', KEYS[2])
+    return 1
+end
+return 0
+"""
+
+
+class UpstreamUnavailable(Exception):
+    """上游開路或已達併發上限，請求未送出即失敗。"""
+
+    def __init__(self, endpoint, reason, retry_after=1):
+        super().__init__('學校系統暫時無法連線，請稍後再試')
+        self.endpoint = endpoint
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    def __init__(self, redis_client=None, threshold=5, window=30, open_seconds=30, failure_ratio=0.5,
+                 clock=time.time):
+        self.redis_client = redis_client
+        self.threshold = threshold
+        self.failure_ratio = failure_ratio
+        self.window = window
+        self.open_seconds = open_seconds
+        self._clock = clock
+        self._local = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _keys(endpoint):
+        return [f"circuit:{endpoint}", f"circuit:{endpoint}:probe"]
+
+    def allow(self, endpoint):
+        """回傳 ALLOW、PROBE（half-open 探測）或 REJECT。Redis 錯誤時放行。"""
+        if self.redis_client is None:
+            return self._local_allow(endpoint)
+        try:
+            script = self.redis_client.register_script(ALLOW_LUA)
+            return int(script(keys=self._keys(endpoint), args=[int(self.open_seconds * 1000)]))
+        except Exception as exc:
+            logger.error(f'Circuit breaker state read failed, allowing request: {exc}')
+            return ALLOW
+
+    def record(self, endpoint, ok, state=ALLOW):
+        if self.redis_client is None:
+            return self._local_record(endpoint, ok, state)
+        try:
+            if ok and state == PROBE:
+                self.redis_client.delete(*self._keys(endpoint))
+                return
+            # 成功也要計入視窗請求數，才能以失敗比例判斷
+            script = self.redis_client.register_script(RECORD_LUA)
+            args = [int(ok), self.threshold, self.window, int(self.open_seconds * 1000), self.failure_ratio]
+            if int(script(keys=self._keys(endpoint), args=args)):
+                logger.warning(f'Circuit opened for upstream endpoint {endpoint}')
+        except Exception as exc:
+            logger.error(f'Circuit breaker state update failed: {exc}')
+
+    def release_probe(self, endpoint):
+        """探測請求未送出時釋放探測權，讓下一個請求重新探測。"""
+        if self.redis_client is None:
+            with self._lock:
+                entry = self._local.get(endpoint)
+                if entry is not None:
+                    entry['probing'] = False
+            return
+        try:
+            self.redis_client.delete(self._keys(endpoint)[1])
+        except Exception as exc:
+            logger.error(f'Circuit breaker probe release failed: {exc}')
+
+    # -- process 內狀態（沒有 Redis 時）-----------------------------------
+
+    def _local_allow(self, endpoint):
+        now = self._clock()
+        with self._lock:
+            entry = self._local.get(endpoint)
+            if entry is None or entry['opened_until'] == 0:
+                return ALLOW
+            if now < entry['opened_until']:
+                return REJECT
+            if entry['probing']:
+                return REJECT
+            entry['probing'] = True
+            return PROBE
+
+    def _local_record(self, endpoint, ok, state):
+        now = self._clock()
+        with self._lock:
+            if ok and state == PROBE:
+                self._local.pop(endpoint, None)
+                return
+            entry = self._local.setdefault(
+                endpoint, {'failures': 0, 'total': 0, 'since': now, 'opened_until': 0, 'probing': False}
+            )
+            if entry['opened_until']:
+                if not ok and now >= entry['opened_until']:
+                    entry.update(opened_until=now + self.open_seconds, failures=0, total=0, probing=False)
+                return
+            if now - entry['since'] > self.window:
+                entry.update(failures=0, total=0, since=now)
+            entry['total'] += 1
+            if ok:
+                return
+            entry['failures'] += 1
+            if entry['failures'] >= self.threshold and entry['failures'] >= self.failure_ratio * entry['total']:
+                entry.update(opened_until=now + self.open_seconds, failures=0, total=0, probing=False)
+                logger.warning(f'Circuit opened for upstream endpoint {endpoint}')
+
+
+class AdaptiveConcurrencyLimiter:
+    """AIMD 併發上限：成功 +1/limit，失敗或超過目標延遲時乘以 backoff（每個目標延遲週期最多一次）。"""
+
+    def __init__(self, initial=8, min_limit=1, max_limit=32, latency_target=5.0, backoff=0.5,
+                 clock=time.monotonic):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target = latency_target
+        self.backoff = backoff
+        self.inflight = 0
+        self._clock = clock
+        self._last_decrease = float('-inf')
+        self._cond = threading.Condition()
+        # 等待名額的 coroutine：(loop, future)，釋放名額時跨 thread 喚醒
+        self._async_waiters = []
+
+    def acquire(self, timeout=0):
+        """取得一個名額；最多等待 timeout 秒，取不到回傳 False。"""
+        deadline = self._clock() + max(timeout, 0)
+        with self._cond:
+            while self.inflight >= int(self.limit):
+                remaining = deadline - self._clock()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            self.inflight += 1
+            return True
+
+    async def acquire_async(self, timeout=0):
+        """acquire() 的 asyncio 版本：在 event loop 上等待名額，不阻塞 loop thread。"""
+        loop = asyncio.get_running_loop()
+        deadline = self._clock() + max(timeout, 0)
+        while True:
+            with self._cond:
+                if self.inflight < int(self.limit):
+                    self.inflight += 1
+                    return True
+                remaining = deadline - self._clock()
+                if remaining <= 0:
+                    return False
+                waiter = loop.create_future()
+                entry = (loop, waiter)
+                self._async_waiters.append(entry)
+            try:
+                await asyncio.wait((waiter,), timeout=remaining)
+            finally:
+                with self._cond:
+                    if entry in self._async_waiters:
+                        self._async_waiters.remove(entry)
+
+    def release(self, latency, ok):
+        now = self._clock()
+        with self._cond:
+            self.inflight -= 1
+            if ok and latency <= self.latency_target:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            elif now - self._last_decrease >= self.latency_target:
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+                self._last_decrease = now
+            self._cond.notify()
+            # 喚醒所有等待中的 coroutine 重新競爭名額，避免被已逾時的 waiter 吃掉通知
+            waiters, self._async_waiters = self._async_waiters, []
+        for loop, waiter in waiters:
+            loop.call_soon_threadsafe(_wake, waiter)
+
+
+def _wake(waiter):
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+class UpstreamGuard:
+    """將 circuit breaker 與併發上限套在單一上游呼叫外。"""
+
+    def __init__(self, breaker, limiter, queue_timeout=2.0):
+        self.breaker = breaker
+        self.limiter = limiter
+        self.queue_timeout = queue_timeout
+
+    def enter(self, endpoint, queue_timeout=None):
+        """檢查開路並取得併發名額，回傳交給 exit() 的 breaker 狀態；無法送出時拋出 UpstreamUnavailable。"""
+        state = self.breaker.allow(endpoint)
+        if state == REJECT:
+            raise UpstreamUnavailable(endpoint, 'circuit_open', self.breaker.open_seconds)
+        timeout = self.queue_timeout if queue_timeout is None else queue_timeout
+        if not self.limiter.acquire(timeout):
+            if state == PROBE:
+                self.breaker.release_probe(endpoint)
+            raise UpstreamUnavailable(endpoint, 'saturated')
+        return state
+
+    def exit(self, endpoint, state, latency, ok):
+        self.limiter.release(latency, ok)
+        self.breaker.record(endpoint, ok, state)
+
+    def call(self, endpoint, fn, queue_timeout=None):
+        """執行 fn() 並回傳其結果（requests/httpx Response）。"""
+        state = self.enter(endpoint, queue_timeout)
+        start = time.monotonic()
+        ok = False
+        try:
+            response = fn()
+            ok = response.status_code < 500
+            return response
+        finally:
+            self.exit(endpoint, state, time.monotonic() - start, ok)
+
+    async def _breaker_io(self, fn, *args):
+        # 沒有 Redis 時 breaker 只動 process 內狀態，直接呼叫；否則交給 executor 避免阻塞 loop
+        if self.breaker.redis_client is None:
+            return fn(*args)
+        return await asyncio.get_running_loop().run_in_executor(None, functools.partial(fn, *args))
+
+    async def aenter(self, endpoint, queue_timeout=None):
+        """enter() 的 asyncio 版本。"""
+        state = await self._breaker_io(self.breaker.allow, endpoint)
+        if state == REJECT:
+            raise UpstreamUnavailable(endpoint, 'circuit_open', self.breaker.open_seconds)
+        timeout = self.queue_timeout if queue_timeout is None else queue_timeout
+        if not await self.limiter.acquire_async(timeout):
+            if state == PROBE:
+                await self._breaker_io(self.breaker.release_probe, endpoint)
+            raise UpstreamUnavailable(endpoint, 'saturated')
+        return state
+
+    async def aexit(self, endpoint, state, latency, ok):
+        self.limiter.release(latency, ok)
+        await self._breaker_io(self.breaker.record, endpoint, ok, state)
+
+    async def acall(self, endpoint, coro_fn, queue_timeout=None):
+        """await coro_fn() 並回傳其結果（httpx Response）。"""
+        state = await self.aenter(endpoint, queue_timeout)
+        start = time.monotonic()
+        ok = False
+        try:
+            response = await coro_fn()
+            ok = response.status_code < 500
+            return response
+        finally:
+            await self.aexit(endpoint, state, time.monotonic() - start, ok)
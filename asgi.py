@@ -0,0 +1,21 @@
+"""ASGI 入口 — ``gunicorn -k asgi --worker-connections 1000 asgi:app``。
+
+與 server.py 相同建立 Flask app，再以 app.asgi.WSGIBridge 包裝；預設使用 async 上游實作，
+route thread 等待上游時不做 I/O，一個 process 可同時維持數百個進行中的上游請求。
+"""
+
+import os
+
+import startup_profile
+
+startup_profile.install()
+
+os.environ.setdefault('GRADE_FETCHER_BACKEND', 'async')
+
+from app import create_app  # noqa: E402
+from app.asgi import create_asgi_app  # noqa: E402
+
+with startup_profile.phase('create_app'):
+    flask_app = create_app()
+app = create_asgi_app(flask_app)
+startup_profile.report()
@@ -0,0 +1,433 @@
+import asyncio
+import logging
+import os
+import ssl
+import threading
+import time
+import weakref
+from http.cookiejar import CookieJar
+
+import httpx
+
+from fetcher import GradeFetcher, _log, _passthrough_errors
+
+logger = logging.getLogger('SchoolGradesServer.AsyncFetcher')
+
+
+def _env_number(name, default, cast=float):
+    try:
+        return cast(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def _cookie_header(cookies):
+    return "; ".join(f"{k}={v}" for k, v in (cookies or {}).items() if k and v is not None)
+
+
+# 與同步版 LoggingRetry 的 status_forcelist 相同
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+MAX_REDIRECTS = 10
+
+
+def _retry_wait(attempt, backoff_factor, response):
+    """第 attempt 次重試前的等待秒數：同 urllib3，第一次立即重試，之後指數 backoff，且不少於 Retry-After。"""
+    wait = backoff_factor * (2 ** (attempt - 1)) if attempt > 1 else 0.0
+    retry_after = response.headers.get("Retry-After", "")
+    if retry_after.isdigit():
+        wait = max(wait, float(retry_after))
+    return wait
+
+
+class InstrumentedAsyncTransport(httpx.AsyncHTTPTransport):
+    """記錄每次上游請求（每個 redirect hop）的延遲、狀態碼、回應大小與是否沿用既有連線。
+
+    httpcore 以 ``network_stream`` extension 提供該請求使用的連線；看過的 stream 即為重用。
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._uses_proxy = kwargs.get('proxy') is not None
+        self._seen_streams = weakref.WeakSet()
+
+    def _reused(self, response):
+        stream = response.extensions.get('network_stream')
+        if stream is None:
+            return None
+        try:
+            reused = stream in self._seen_streams
+            self._seen_streams.add(stream)
+        except TypeError:
+            return None
+        return reused
+
+    async def handle_async_request(self, request):
+        from app.services.metrics import record_upstream, upstream_endpoint
+
+        endpoint = upstream_endpoint(str(request.url))
+        start = time.perf_counter()
+        try:
+            response = await super().handle_async_request(request)
+        except Exception:
+            record_upstream(endpoint, time.perf_counter() - start, 'error')
+            raise
+        record_upstream(
+            endpoint,
+            time.perf_counter() - start,
+            response.status_code,
+            nbytes=int(length) if (length := response.headers.get('Content-Length', '')).isdigit() else 0,
+            reused=self._reused(response),
+            proxy=self._uses_proxy,
+        )
+        return response
+
+
+def build_async_client() -> httpx.AsyncClient:
+    """建立學校系統用的 httpx.AsyncClient（連線上限、keep-alive、SOCKS proxy、TWCA 憑證）。
+
+    client 本身不保存 cookie，也不自動跟隨 redirect：httpx 跟隨 redirect 時會拿掉手動帶入的
+    Cookie header 並改用 client jar，因此由 AsyncGradeFetcher 逐 hop 帶入各使用者的 cookie。
+    transport 的 retries 只重試連線錯誤；429/5xx 由 AsyncGradeFetcher 依 HTTP_RETRY_TOTAL 重試。
+    """
+    from app.services.http_client import _RejectAllCookiePolicy, get_ssl_context
+
+    limits = httpx.Limits(
+        max_connections=_env_number("ASYNC_HTTP_MAX_CONNECTIONS", 100, int),
+        max_keepalive_connections=_env_number("ASYNC_HTTP_MAX_KEEPALIVE", 20, int),
+    )
+    timeout = httpx.Timeout(
+        _env_number("HTTP_TIMEOUT_READ", 20.0),
+        connect=_env_number("HTTP_TIMEOUT_CONNECT", 5.0),
+    )
+    socks_proxy = os.environ.get("SCHOOL_SOCKS_PROXY", "").strip() or None
+    transport = InstrumentedAsyncTransport(
+        retries=_env_number("HTTP_RETRY_TOTAL", 3, int),
+        limits=limits,
+        proxy=socks_proxy,
+        verify=get_ssl_context(),
+    )
+    client = httpx.AsyncClient(transport=transport, timeout=timeout, follow_redirects=False)
+    client.cookies = CookieJar(policy=_RejectAllCookiePolicy())
+    return client
+
+
+class AsyncGradeFetcher(GradeFetcher):
+    """GradeFetcher 的 asyncio/httpx 版本：公開方法名稱與回傳格式相同，但皆為 coroutine。
+
+    結構查詢的各學年期考次以 asyncio.gather 平行抓取，不再佔用 thread。
+    """
+
+    def __init__(self, client_factory=None, guard=None, status_retries=None, backoff_factor=None):
+        self.client_factory = client_factory or build_async_client
+        self.guard = guard
+        self.status_retries = (
+            _env_number("HTTP_RETRY_TOTAL", 3, int) if status_retries is None else status_retries
+        )
+        self.backoff_factor = (
+            _env_number("HTTP_BACKOFF_FACTOR", 0.5) if backoff_factor is None else backoff_factor
+        )
+        self._client = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # client 綁定建立時的 event loop，須在同一個 loop 內使用
+        if self._client is None:
+            self._client = self.client_factory()
+        return self._client
+
+    async def _follow(self, request, cookie_jar):
+        """送出請求並自行跟隨 redirect；每個 hop 都帶入 cookie_jar，並把回應設定的 cookie 併回 cookie_jar。
+
+        cookie_jar 只屬於原請求的 host，redirect 到其他 host 時不帶入也不寫回。
+        """
+        history = []
+        host = request.url.host
+        while True:
+            same_host = cookie_jar is not None and request.url.host == host
+            cookie = _cookie_header(cookie_jar) if same_host else ""
+            if cookie:
+                request.headers["Cookie"] = cookie
+            else:
+                request.headers.pop("Cookie", None)
+            response = await self.client.send(request)
+            if same_host:
+                for name, value in response.cookies.items():
+                    cookie_jar[name] = value
+            if not response.is_redirect or response.next_request is None:
+                response.history = history
+                return response
+            if len(history) >= MAX_REDIRECTS:
+                raise httpx.TooManyRedirects("Exceeded maximum allowed redirects.", request=request)
+            history.append(response)
+            request = response.next_request
+
+    async def _send_with_retries(self, method, url, cookie_jar, deadline, kwargs):
+        attempt = 0
+        while True:
+            response = await self._follow(self.client.build_request(method, url, **kwargs), cookie_jar)
+            if response.status_code not in RETRY_STATUSES or attempt >= self.status_retries:
+                return response
+            attempt += 1
+            wait = _retry_wait(attempt, self.backoff_factor, response)
+            # 剩餘預算不足以等待再試一次就直接回傳這次的回應
+            if deadline is not None and deadline.remaining() <= wait:
+                return response
+            from app.services.metrics import UPSTREAM_RETRIES, upstream_endpoint
+
+            UPSTREAM_RETRIES.labels(upstream_endpoint(url)).inc()
+            logger.warning(f"HTTP Retry invoked (Attempt {attempt}). Method: {method}, URL: {url}, "
+                           f"Status: {response.status_code}")
+            await asyncio.sleep(wait)
+
+    async def _request(self, method, url, deadline=None, cookie_jar=None, **kwargs):
+        """cookie_jar（dict）為這次呼叫使用的 cookie，redirect 過程中設定的 cookie 會寫回其中。"""
+        if deadline is None:
+            return await self._send_with_retries(method, url, cookie_jar, None, kwargs)
+
+        from app.services.deadline import DeadlineExceeded
+
+        remaining = deadline.check()
+        default = self.client.timeout
+        kwargs['timeout'] = httpx.Timeout(
+            connect=deadline.clamp(default.connect),
+            read=deadline.clamp(default.read),
+            write=deadline.clamp(default.write),
+            pool=deadline.clamp(default.pool),
+        )
+        try:
+            # 連同 redirect 與重試在內整體不超過剩餘預算
+            return await asyncio.wait_for(
+                self._send_with_retries(method, url, cookie_jar, deadline, kwargs), remaining
+            )
+        except asyncio.TimeoutError as exc:
+            raise DeadlineExceeded() from exc
+        except httpx.TimeoutException as exc:
+            if deadline.remaining() <= 0.1:
+                raise DeadlineExceeded() from exc
+            raise
+
+    async def _asend(self, method, url, deadline=None, **kwargs):
+        if self.guard is None:
+            return await self._request(method, url, deadline=deadline, **kwargs)
+
+        from app.services.metrics import upstream_endpoint
+
+        # 排隊以 asyncio 等待（不阻塞 event loop），最多等到 deadline 剩餘時間
+        queue_timeout = None
+        if deadline is not None:
+            queue_timeout = min(self.guard.queue_timeout, deadline.check())
+        return await self.guard.acall(
+            upstream_endpoint(url),
+            lambda: self._request(method, url, deadline=deadline, **kwargs),
+            queue_timeout=queue_timeout,
+        )
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def prepare_login_captcha(self, deadline=None):
+        """Prepare school login captcha and context for subsequent login POST."""
+        try:
+            jar = {}
+            r = await self._asend("GET", self.LOGIN_PAGE, cookie_jar=jar, deadline=deadline)
+            r.raise_for_status()
+
+            page = self._parse_login_page(r.text)
+            captcha_url = page["captcha_url"] or self._build_captcha_url()
+
+            image_resp = await self._asend(
+                "GET", captcha_url, headers=self._captcha_image_headers(), cookie_jar=jar, deadline=deadline
+            )
+            if image_resp.status_code == 403:
+                # fallback：部分情況頁面上的舊 URL 會被擋，改用最新 timestamp 再試一次
+                image_resp = await self._asend(
+                    "GET", self._build_captcha_url(), headers=self._captcha_image_headers(), cookie_jar=jar, deadline=deadline
+                )
+            image_resp.raise_for_status()
+
+            image_bytes, content_type = self._normalize_captcha_image(
+                image_resp.headers.get("Content-Type", "image/png"), image_resp.content, image_resp.text
+            )
+            if image_bytes is None:
+                return False, "學校驗證碼回應格式異常", None
+
+            context = {
+                "login_token": page["login_token"],
+                "shcaptcha_gen_code": page["shcaptcha_gen_code"],
+                "device_token": page["device_token"],
+                "cookies": {k: v for k, v in jar.items() if k and v is not None},
+            }
+            return True, "OK", {
+                "image_bytes": image_bytes,
+                "content_type": content_type,
+                "context": context,
+            }
+        except Exception as e:
+            if isinstance(e, _passthrough_errors()):
+                raise
+            _log('error', '', "Prepare captcha exception: %s", e)
+            return False, f"取得學校驗證碼失敗: {str(e)}", None
+
+    async def login_and_get_tokens(self, username, password, captcha_code=None, login_context=None, deadline=None):
+        """Login via httpx, return (success, message, cookies_dict, student_no, token)."""
+        try:
+            _log('info', username, "Attempting login (async mode)")
+            jar = {}
+            login_token = None
+            shcaptcha_gen_code = "10"
+            device_token = ""
+
+            if login_context:
+                login_token = login_context.get("login_token")
+                shcaptcha_gen_code = login_context.get("shcaptcha_gen_code") or "10"
+                device_token = login_context.get("device_token") or ""
+                for k, v in (login_context.get("cookies") or {}).items():
+                    if k and v is not None:
+                        jar[k] = v
+
+            if not login_token:
+                r = await self._asend("GET", self.LOGIN_PAGE, cookie_jar=jar, deadline=deadline)
+                r.raise_for_status()
+                page = self._parse_login_page(r.text)
+                login_token = page["login_token"]
+                shcaptcha_gen_code = page["shcaptcha_gen_code"]
+                device_token = page["device_token"]
+
+            headers, data = self._login_request(
+                username, password, captcha_code, login_token, shcaptcha_gen_code, device_token
+            )
+            resp = await self._asend(
+                "POST", self.DO_CHECK, data=data, headers=headers, cookie_jar=jar, deadline=deadline
+            )
+            resp.raise_for_status()
+
+            try:
+                j = resp.json()
+            except Exception:
+                return False, "登入回應格式錯誤", None, None, None
+
+            ok, msg = self._parse_login_response(j)
+            if not ok:
+                return False, msg, None, None, None
+
+            _log('info', username, "Login OK, fetching grades page for API token...")
+
+            r2 = await self._asend("GET", self.GRADES_PAGE, cookie_jar=jar, deadline=deadline)
+            r2.raise_for_status()
+            api_token = self._get_hidden_token(r2.text)
+
+            cookies_dict = {k: v for k, v in jar.items() if k and v is not None}
+            _log('info', username, "Successfully obtained credentials")
+            return True, "登入成功", cookies_dict, username, api_token
+
+        except Exception as e:
+            if isinstance(e, _passthrough_errors()):
+                raise
+            _log('error', username, "Login Exception: %s", e)
+            return False, f"登入錯誤: {str(e)}", None, None, None
+
+    async def get_year_terms_via_api(self, cookies, student_no, token, session=None, deadline=None):
+        url, headers, data = self._year_terms_request(student_no, token)
+        _log('info', student_no, "Requesting structure...")
+        response = await self._asend("POST", url, headers=headers, cookie_jar=dict(cookies or {}), data=data, deadline=deadline)
+        response.raise_for_status()
+        return self._parse_year_terms(response.json())
+
+    async def get_structure_via_api(self, cookies, student_no, token, session=None, deadline=None):
+        try:
+            items = await self.get_year_terms_via_api(cookies, student_no, token, deadline=deadline)
+            exams_list = await asyncio.gather(*(
+                self.get_exams_via_api(cookies, student_no, token, value, deadline=deadline) for _name, value in items
+            ))
+            return {
+                name: {"year_value": value, "exams": exams}
+                for (name, value), exams in zip(items, exams_list)
+            }
+        except Exception as e:
+            if isinstance(e, _passthrough_errors()):
+                raise
+            _log('error', student_no, "Error fetching structure: %s", e)
+            return {}
+
+    async def get_exams_via_api(self, cookies, student_no, token, year_value, req_id=None, session=None,
+                                deadline=None):
+        url, headers, data = self._exams_request(student_no, token, year_value)
+        try:
+            resp = await self._asend("POST", url, headers=headers, cookie_jar=dict(cookies or {}), data=data, deadline=deadline)
+            if resp.status_code == 200:
+                return self._parse_exams(resp.json())
+        except Exception as e:
+            if isinstance(e, _passthrough_errors()):
+                raise
+            _log('error', student_no, "Error fetching exams via API: %s", e, req_id=req_id)
+        return []
+
+    async def fetch_grades_via_api(self, cookies, student_no, token, year_value, exam_value, session=None,
+                                   deadline=None):
+        url, headers, data = self._grades_request(student_no, token, year_value, exam_value)
+        _log('info', student_no, "API Fetching grades: Year=%s, Term=%s, Exam=%s", data['Year'], data['Term'], exam_value)
+        try:
+            response = await self._asend("POST", url, headers=headers, cookie_jar=dict(cookies or {}), data=data, deadline=deadline)
+            response.raise_for_status()
+            return response.json()
+        except Exception as e:
+            _log('error', student_no, "API Fetch Error: %s", e)
+            raise e
+
+
+class EventLoopThread:
+    """在背景 daemon thread 執行的共用 event loop，讓同步程式碼提交 coroutine。"""
+
+    def __init__(self, name='grade-fetcher-loop'):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def run(self, coro, timeout=None):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+
+class LoopBoundGradeFetcher:
+    """以同步介面包裝 AsyncGradeFetcher，供現有 Flask routes / services 直接使用。
+
+    所有 worker thread 的上游呼叫都交給同一個 event loop 與連線池處理，
+    一個 process 可同時維持大量進行中的上游請求，而不需對應數量的 thread。
+    """
+
+    def __init__(self, async_fetcher=None, loop_thread=None):
+        self.async_fetcher = async_fetcher or AsyncGradeFetcher()
+        self.loop_thread = loop_thread or EventLoopThread()
+
+    def prepare_login_captcha(self, deadline=None):
+        return self.loop_thread.run(self.async_fetcher.prepare_login_captcha(deadline=deadline))
+
+    def login_and_get_tokens(self, username, password, captcha_code=None, login_context=None, deadline=None):
+        return self.loop_thread.run(self.async_fetcher.login_and_get_tokens(
+            username, password, captcha_code=captcha_code, login_context=login_context, deadline=deadline
+        ))
+
+    def get_year_terms_via_api(self, cookies, student_no, token, session=None, deadline=None):
+        return self.loop_thread.run(self.async_fetcher.get_year_terms_via_api(
+            cookies, student_no, token, deadline=deadline
+        ))
+
+    def get_structure_via_api(self, cookies, student_no, token, session=None, deadline=None):
+        return self.loop_thread.run(self.async_fetcher.get_structure_via_api(
+            cookies, student_no, token, deadline=deadline
+        ))
+
+    def get_exams_via_api(self, cookies, student_no, token, year_value, req_id=None, session=None, deadline=None):
+        return self.loop_thread.run(self.async_fetcher.get_exams_via_api(
+            cookies, student_no, token, year_value, req_id=req_id, deadline=deadline
+        ))
+
+    def fetch_grades_via_api(self, cookies, student_no, token, year_value, exam_value, session=None, deadline=None):
+        return self.loop_thread.run(self.async_fetcher.fetch_grades_via_api(
+            cookies, student_no, token, year_value, exam_value, deadline=deadline
+        ))
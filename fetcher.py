@@ -1,7 +1,9 @@
 import logging
-from bs4 import BeautifulSoup
 from concurrent.futures import ThreadPoolExecutor
 from flask import g, has_request_context
+import requests
+from requests.cookies import RequestsCookieJar
+import html as html_lib
 import time
 from urllib.parse import urljoin
 import re
@@ -27,18 +29,108 @@ def _parse_year_term(year_value, default_year="114", default_term="1"):
         pass
     return default_year, default_term
 
-def _log(level: str, user_id: str, msg: str, req_id: str = None):
+_LEVELS = {'error': logging.ERROR, 'warning': logging.WARNING, 'info': logging.INFO, 'debug': logging.DEBUG}
+
+
+def _log(level: str, user_id: str, msg: str, *args, req_id: str = None):
+    """以 %-style 參數延遲格式化；level 未啟用時不做任何字串處理。
+
+    request_id 與遮罩後的使用者放在 record 欄位（結構化 log），不拼進訊息本文。
+    """
+    levelno = _LEVELS.get(level, logging.INFO)
+    if not logger.isEnabledFor(levelno):
+        return
     if not req_id and has_request_context() and 'request_id' in g:
         req_id = g.request_id
-    
-    r_str = f"[{req_id}] " if req_id else ""
-    u_str = f"[User:{_mask_user_id(user_id)}] " if user_id else ""
-    
-    final_msg = f"{r_str}{u_str}{msg}"
-    if level == 'error':
-        logger.error(final_msg)
-    else:
-        logger.info(final_msg)
+    logger.log(levelno, msg, *args, extra={
+        'request_id': req_id,
+        'user': _mask_user_id(user_id) if user_id else None,
+    })
+
+def _soup(html):
+    # BeautifulSoup 只在 fallback 路徑用到，延後到第一次使用才載入以加快啟動
+    from bs4 import BeautifulSoup
+    return BeautifulSoup(html, "html.parser")
+
+
+# 單次掃描 HTML 取出所有 <input> 與 <img> 標籤（略過註解），取代多次建立 BeautifulSoup 樹
+_TAG_RE = re.compile(r"""<!--.*?-->|<(input|img)\b((?:"[^"]*"|'[^']*'|[^'">])*)>""", re.IGNORECASE | re.DOTALL)
+_ATTR_RE = re.compile(r"""([^\s"'=<>/]+)(?:\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'>]+)))?""")
+
+TOKEN_FIELD = "__RequestVerificationToken"
+
+
+def scan_page_tags(html: str):
+    """Single-pass scan returning ({input name: value or None}, [img attribute dicts]) in document order."""
+    inputs = {}
+    imgs = []
+    for m in _TAG_RE.finditer(html or ""):
+        tag = m.group(1)
+        if tag is None:
+            continue
+        attrs = {}
+        for am in _ATTR_RE.finditer(m.group(2)):
+            name = am.group(1).lower()
+            if name in attrs:
+                continue
+            value = am.group(2)
+            if value is None:
+                value = am.group(3) if am.group(3) is not None else am.group(4)
+            attrs[name] = html_lib.unescape(value) if value is not None else None
+        if tag.lower() == "input":
+            name = attrs.get("name")
+            if name is not None and name not in inputs:
+                inputs[name] = attrs.get("value")
+        else:
+            imgs.append(attrs)
+    return inputs, imgs
+
+
+def _passthrough_errors():
+    """上游保護（503）與 deadline（504）的例外須傳到 route，不可被一般錯誤處理吞掉。"""
+    from app.services.deadline import DeadlineExceeded
+    from app.services.upstream_guard import UpstreamUnavailable
+    return UpstreamUnavailable, DeadlineExceeded
+
+
+def _pick_captcha_img(imgs):
+    # 與 BeautifulSoup 版本相同的優先順序
+    checks = (
+        lambda a: "/Auth/Auth/GetCaptcha" in (a.get("src") or ""),
+        lambda a: "GetCaptcha" in (a.get("src") or ""),
+        lambda a: "captcha" in (a.get("id") or "").lower(),
+        lambda a: "captcha" in (a.get("class") or "").lower(),
+    )
+    for check in checks:
+        for attrs in imgs:
+            if check(attrs):
+                return attrs
+    return None
+
+
+def build_structure(items, fetch_exams, max_workers=10):
+    """Assemble {display_text: {"year_value", "exams"}} by calling fetch_exams(year_value) in parallel."""
+    structure = {}
+    if not items:
+        return structure
+
+    def _fetch_one(name_value):
+        n, v = name_value
+        return n, v, fetch_exams(v)
+
+    with ThreadPoolExecutor(max_workers=min(len(items), max_workers)) as pool:
+        for name, value, exams in pool.map(_fetch_one, items):
+            structure[name] = {
+                "year_value": value,
+                "exams": exams
+            }
+    return structure
+
+def _split_timeout(timeout):
+    if isinstance(timeout, tuple):
+        return timeout
+    return timeout, timeout
+
 
 # Note: InsecureRequestWarning is not disabled here; the HTTP session enforces SSL verification.
 
@@ -50,24 +142,73 @@ class GradeFetcher:
     GRADES_PAGE = f"{BASE}/ICampus/StudentInfo/Index?page=%E6%88%90%E7%B8%BE%E6%9F%A5%E8%A9%A2"
     API_BASE = f"{BASE}/ICampus"
 
-    def __init__(self, session_factory=None):
+    def __init__(self, session_factory=None, guard=None):
+        # guard: app.services.upstream_guard.UpstreamGuard，提供 circuit breaker 與併發上限
+        self.guard = guard
         if session_factory is None:
-            # 使用學校系統專用的 HTTP session，當環境設定 SOCKS proxy 時會走 Tailscale exit node
-            from app.services.http_client import get_school_http_session
-            self.session_factory = get_school_http_session
+            # 使用 process 共用的學校系統連線池（keep-alive），當環境設定 SOCKS proxy 時會走 Tailscale exit node。
+            # 共用 session 不保存 cookie，各使用者的 cookie 一律以 cookies= 逐次傳入。
+            from app.services.http_client import get_pooled_school_http_session
+            self.session_factory = get_pooled_school_http_session
         else:
             self.session_factory = session_factory
 
+    def _send(self, session, method, url, deadline=None, **kwargs):
+        """所有對學校系統的請求都經過這裡：套用 deadline、circuit breaker 與併發上限。
+
+        deadline（app.services.deadline.Deadline）有值時，timeout 與排隊時間都只用剩餘預算，
+        urllib3 的 retry 也會在預算不足時停止。
+        """
+        from app.services.deadline import DeadlineExceeded, DeadlineTimeout, deadline_scope, is_budget_exhausted
+
+        queue_timeout = None
+        if deadline is not None:
+            remaining = deadline.check()
+            if self.guard is not None:
+                queue_timeout = min(self.guard.queue_timeout, remaining)
+
+        def _request():
+            if deadline is None:
+                return session.request(method, url, **kwargs)
+            # 排隊後才計算 timeout，只給實際剩下的時間
+            connect, read = _split_timeout(getattr(session, "default_timeout", None))
+            try:
+                with deadline_scope(deadline):
+                    return session.request(
+                        method, url, timeout=DeadlineTimeout(deadline, connect, read), **kwargs
+                    )
+            except (requests.exceptions.Timeout, requests.exceptions.RetryError,
+                    requests.exceptions.ConnectionError) as exc:
+                if is_budget_exhausted(exc) or deadline.remaining() <= 0.1:
+                    raise DeadlineExceeded() from exc
+                raise
+
+        if self.guard is None:
+            return _request()
+        from app.services.metrics import upstream_endpoint
+        return self.guard.call(upstream_endpoint(url), _request, queue_timeout=queue_timeout)
+
+    @staticmethod
+    def _merge_cookies(jar, response):
+        from app.services.http_client import merge_response_cookies
+        merge_response_cookies(jar, response)
+
     def _get_hidden_token(self, html: str) -> str:
         """Extract __RequestVerificationToken from HTML."""
-        soup = BeautifulSoup(html, "html.parser")
+        token = scan_page_tags(html)[0].get(TOKEN_FIELD)
+        if token:
+            return token
+        return self._get_hidden_token_soup(html)
+
+    def _get_hidden_token_soup(self, html: str) -> str:
+        soup = _soup(html)
         el = soup.select_one('input[name="__RequestVerificationToken"]')
         if not el or not el.get("value"):
             raise RuntimeError("找不到 __RequestVerificationToken hidden input")
         return el["value"]
 
     def _extract_hidden_input(self, html: str, field_name: str, default: str = "") -> str:
-        soup = BeautifulSoup(html, "html.parser")
+        soup = _soup(html)
         el = soup.select_one(f'input[name="{field_name}"]')
         if not el:
             return default
@@ -79,7 +220,7 @@ class GradeFetcher:
         return f"{self.CAPTCHA_ENDPOINT}?t={ts}"
 
     def _find_captcha_image_url(self, html: str) -> str:
-        soup = BeautifulSoup(html, "html.parser")
+        soup = _soup(html)
         # 優先使用頁面上實際的 captcha 圖片網址（可能包含額外查詢參數）
         node = (
             soup.select_one('img[src*="/Auth/Auth/GetCaptcha"]')
@@ -108,44 +249,195 @@ class GradeFetcher:
         except ValueError:
             return None
 
-    def prepare_login_captcha(self):
+    # ------------------------------------------------------------------
+    # Request builders / response parsers (shared with AsyncGradeFetcher)
+    # ------------------------------------------------------------------
+
+    def _parse_login_page(self, html):
+        """Extract login token, captcha gen code, device token and captcha image URL from the login page.
+
+        Uses one regex scan; falls back to BeautifulSoup when the token cannot be found that way.
+        """
+        inputs, imgs = scan_page_tags(html)
+        if not inputs.get(TOKEN_FIELD):
+            return self._parse_login_page_soup(html)
+
+        def _hidden(name, default):
+            if name not in inputs:
+                return default
+            return (inputs[name] or default).strip()
+
+        img = _pick_captcha_img(imgs)
+        captcha_src = img.get("src") if img else None
+        return {
+            "login_token": inputs[TOKEN_FIELD],
+            "shcaptcha_gen_code": _hidden("ShCaptchaGenCode", "10"),
+            "device_token": _hidden("DeviceToken", ""),
+            "captcha_url": urljoin(self.BASE + "/", captcha_src) if captcha_src else "",
+        }
+
+    def _parse_login_page_soup(self, html):
+        return {
+            "login_token": self._get_hidden_token_soup(html),
+            "shcaptcha_gen_code": self._extract_hidden_input(html, "ShCaptchaGenCode", "10"),
+            "device_token": self._extract_hidden_input(html, "DeviceToken", ""),
+            "captcha_url": self._find_captcha_image_url(html),
+        }
+
+    def _normalize_captcha_image(self, content_type, content, text):
+        """Return (image_bytes, content_type); image_bytes is None when the response is unusable."""
+        if "image" in (content_type or "").lower():
+            return content, content_type
+        # 有些情況可能回傳 hex 文本，嘗試轉回 png bytes
+        return self._decode_hex_image_bytes(text), "image/png"
+
+    def _captcha_image_headers(self):
+        return {
+            "Accept": "image/avif,image/webp,image/apng,image/svg+xml,image/*,*/*;q=0.8",
+            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0.0.0 Safari/537.36",
+            "Referer": self.LOGIN_PAGE,
+        }
+
+    def _login_request(self, username, password, captcha_code, login_token, shcaptcha_gen_code, device_token):
+        headers = {
+            "Content-Type": "application/x-www-form-urlencoded; charset=UTF-8",
+            "Referer": GradeFetcher.LOGIN_PAGE,
+            "Origin": "https://shcloud2.k12ea.gov.tw",
+            "X-Requested-With": "XMLHttpRequest",
+        }
+        data = {
+            "SchoolCode": "030305",
+            "LoginId": username,
+            "PassString": password,
+            "LoginType": "Student",
+            "IsKeepLogin": "false",
+            "IdentityId": "6",
+            "SchoolName": "國立中大壢中",
+            "GoogleToken": "8",
+            "isRegistration": "false",
+            "ShCaptchaGenCode": (captcha_code or "").strip() or shcaptcha_gen_code,
+            "__RequestVerificationToken": login_token,
+        }
+        if device_token:
+            data["DeviceToken"] = device_token
+        return headers, data
+
+    def _parse_login_response(self, j):
+        ok = bool(j.get("Result", {}).get("IsLoginSuccess"))
+        if not ok:
+            return False, j.get("Result", {}).get("DisplayMsg") or j.get("Message") or "登入失敗"
+        return True, None
+
+    def _year_terms_request(self, student_no, token):
+        url = "https://shcloud2.k12ea.gov.tw/CLHSTYC/ICampus/CommonData/GetGradeCanQueryYearTermListByStudentNo"
+        headers = {
+            "Accept": "*/*",
+            "Content-Type": "application/x-www-form-urlencoded; charset=UTF-8",
+            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+            "X-Requested-With": "XMLHttpRequest",
+            "Origin": "https://shcloud2.k12ea.gov.tw",
+            "Referer": "https://shcloud2.k12ea.gov.tw/CLHSTYC/ICampus/StudentInfo/Index?page=%E6%88%90%E7%B8%BE%E6%9F%A5%E8%A9%A2"
+        }
+        data = {
+            "searchType": "各次考試單科成績",
+            "studentNo": student_no,
+            "__RequestVerificationToken": token
+        }
+        return url, headers, data
+
+    def _parse_year_terms(self, payload):
+        items = []
+        for item in payload:
+            name = item.get('DisplayText') or item.get('text')
+            value = item.get('Value') or item.get('value')
+            if value:
+                items.append((name, value))
+        return items
+
+    def _exams_request(self, student_no, token, year_value):
+        url = "https://shcloud2.k12ea.gov.tw/CLHSTYC/ICampus/CommonData/GetGradeCanQueryExamNoListByStudentNo"
+
+        year, term = _parse_year_term(year_value, default_year="114", default_term="1")
+
+        headers = {
+            "Content-Type": "application/x-www-form-urlencoded; charset=UTF-8",
+            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+            "X-Requested-With": "XMLHttpRequest",
+            "Referer": "https://shcloud2.k12ea.gov.tw/CLHSTYC/ICampus/StudentInfo/Index?page=%E6%88%90%E7%B8%BE%E6%9F%A5%E8%A9%A2"
+        }
+        data = {
+            "searchType": "單次考試所有成績",
+            "studentNo": student_no,
+            "year": year,
+            "term": term,
+            "__RequestVerificationToken": token
+        }
+        return url, headers, data
+
+    def _parse_exams(self, payload):
+        return [
+            {
+                "text": item.get('DisplayText') or item.get('text'),
+                "value": item.get('Value') or item.get('value')
+            }
+            for item in payload
+        ]
+
+    def _grades_request(self, student_no, token, year_value, exam_value):
+        url = "https://shcloud2.k12ea.gov.tw/CLHSTYC/ICampus/TutorShGrade/GetScoreForStudentExamContent"
+        headers = {
+            "Accept": "*/*",
+            "Content-Type": "application/x-www-form-urlencoded; charset=UTF-8",
+            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+            "X-Requested-With": "XMLHttpRequest",
+            "Referer": "https://shcloud2.k12ea.gov.tw/CLHSTYC/ICampus/StudentInfo/Index?page=%E6%88%90%E7%B8%BE%E6%9F%A5%E8%A9%A2"
+        }
+
+        year, term = _parse_year_term(year_value, default_year="114", default_term="2")
+
+        data = {
+            "StudentNo": student_no,
+            "SearchType": "單次考試所有成績",
+            "__RequestVerificationToken": token,
+            "Year": year,
+            "Term": term,
+            "ExamNo": exam_value
+        }
+        return url, headers, data
+
+    def prepare_login_captcha(self, deadline=None):
         """Prepare school login captcha and context for subsequent login POST."""
+        s = None
         try:
             s = self.session_factory()
-            r = s.get(self.LOGIN_PAGE)
+            jar = RequestsCookieJar()
+            r = self._send(s, "GET", self.LOGIN_PAGE, cookies=jar, deadline=deadline)
             r.raise_for_status()
+            self._merge_cookies(jar, r)
 
-            html = r.text
-            login_token = self._get_hidden_token(html)
-            shcaptcha_gen_code = self._extract_hidden_input(html, "ShCaptchaGenCode", "10")
-            device_token = self._extract_hidden_input(html, "DeviceToken", "")
-            captcha_url = self._find_captcha_image_url(html) or self._build_captcha_url()
+            page = self._parse_login_page(r.text)
+            captcha_url = page["captcha_url"] or self._build_captcha_url()
 
-            req_headers = {
-                "Accept": "image/avif,image/webp,image/apng,image/svg+xml,image/*,*/*;q=0.8",
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0.0.0 Safari/537.36",
-                "Referer": self.LOGIN_PAGE,
-            }
-            image_resp = s.get(captcha_url, headers=req_headers)
+            req_headers = self._captcha_image_headers()
+            image_resp = self._send(s, "GET", captcha_url, headers=req_headers, cookies=jar, deadline=deadline)
             if image_resp.status_code == 403:
                 # fallback：部分情況頁面上的舊 URL 會被擋，改用最新 timestamp 再試一次
-                image_resp = s.get(self._build_captcha_url(), headers=req_headers)
+                image_resp = self._send(
+                    s, "GET", self._build_captcha_url(), headers=req_headers, cookies=jar, deadline=deadline
+                )
             image_resp.raise_for_status()
-            content_type = image_resp.headers.get("Content-Type", "image/png")
-            image_bytes = image_resp.content
-
-            if "image" not in content_type.lower():
-                # 有些情況可能回傳 hex 文本，嘗試轉回 png bytes
-                image_bytes = self._decode_hex_image_bytes(image_resp.text)
-                if image_bytes is None:
-                    return False, "學校驗證碼回應格式異常", None
-                content_type = "image/png"
+            self._merge_cookies(jar, image_resp)
+            image_bytes, content_type = self._normalize_captcha_image(
+                image_resp.headers.get("Content-Type", "image/png"), image_resp.content, image_resp.text
+            )
+            if image_bytes is None:
+                return False, "學校驗證碼回應格式異常", None
 
             context = {
-                "login_token": login_token,
-                "shcaptcha_gen_code": shcaptcha_gen_code,
-                "device_token": device_token,
-                "cookies": {c.name: c.value for c in s.cookies if c.name and c.value is not None},
+                "login_token": page["login_token"],
+                "shcaptcha_gen_code": page["shcaptcha_gen_code"],
+                "device_token": page["device_token"],
+                "cookies": {c.name: c.value for c in jar if c.name and c.value is not None},
             }
 
             payload = {
@@ -155,16 +447,21 @@ class GradeFetcher:
             }
             return True, "OK", payload
         except Exception as e:
-            _log('error', '', f"Prepare captcha exception: {e}")
+            if isinstance(e, _passthrough_errors()):
+                raise
+            _log('error', '', "Prepare captcha exception: %s", e)
             return False, f"取得學校驗證碼失敗: {str(e)}", None
         finally:
-            s.close()
+            if s is not None:
+                s.close()
 
-    def login_and_get_tokens(self, username, password, captcha_code=None, login_context=None):
+    def login_and_get_tokens(self, username, password, captcha_code=None, login_context=None, deadline=None):
         """Login via requests session, return (success, message, cookies_dict, student_no, token)."""
+        s = None
         try:
             _log('info', username, "Attempting login (requests mode)")
             s = self.session_factory()
+            jar = RequestsCookieJar()
 
             login_token = None
             shcaptcha_gen_code = "10"
@@ -177,62 +474,46 @@ class GradeFetcher:
                 device_token = login_context.get("device_token") or ""
                 for k, v in (login_context.get("cookies") or {}).items():
                     if k and v is not None:
-                        s.cookies.set(k, v)
+                        jar.set(k, v)
 
             # fallback：若未提供 context，沿用舊流程直接抓 login page
             if not login_token:
-                r = s.get(self.LOGIN_PAGE)
+                r = self._send(s, "GET", self.LOGIN_PAGE, cookies=jar, deadline=deadline)
                 r.raise_for_status()
-                login_token = self._get_hidden_token(r.text)
-                shcaptcha_gen_code = self._extract_hidden_input(r.text, "ShCaptchaGenCode", "10")
-                device_token = self._extract_hidden_input(r.text, "DeviceToken", "")
+                self._merge_cookies(jar, r)
+                page = self._parse_login_page(r.text)
+                login_token = page["login_token"]
+                shcaptcha_gen_code = page["shcaptcha_gen_code"]
+                device_token = page["device_token"]
 
             # 2) POST login
-            headers = {
-                "Content-Type": "application/x-www-form-urlencoded; charset=UTF-8",
-                "Referer": GradeFetcher.LOGIN_PAGE,
-                "Origin": "https://shcloud2.k12ea.gov.tw",
-                "X-Requested-With": "XMLHttpRequest",
-            }
-            data = {
-                "SchoolCode": "030305",
-                "LoginId": username,
-                "PassString": password,
-                "LoginType": "Student",
-                "IsKeepLogin": "false",
-                "IdentityId": "6",
-                "SchoolName": "國立中大壢中",
-                "GoogleToken": "8",
-                "isRegistration": "false",
-                "ShCaptchaGenCode": (captcha_code or "").strip() or shcaptcha_gen_code,
-                "__RequestVerificationToken": login_token,
-            }
-            if device_token:
-                data["DeviceToken"] = device_token
-
-            resp = s.post(self.DO_CHECK, data=data, headers=headers)
+            headers, data = self._login_request(
+                username, password, captcha_code, login_token, shcaptcha_gen_code, device_token
+            )
+            resp = self._send(s, "POST", self.DO_CHECK, data=data, headers=headers, cookies=jar, deadline=deadline)
             resp.raise_for_status()
+            self._merge_cookies(jar, resp)
 
             try:
                 j = resp.json()
             except Exception:
                 return False, "登入回應格式錯誤", None, None, None
 
-            ok = bool(j.get("Result", {}).get("IsLoginSuccess"))
+            ok, msg = self._parse_login_response(j)
             if not ok:
-                msg = j.get("Result", {}).get("DisplayMsg") or j.get("Message") or "登入失敗"
                 return False, msg, None, None, None
 
             _log('info', username, "Login OK, fetching grades page for API token...")
 
             # 3) GET grades page to obtain the API-specific __RequestVerificationToken
-            r2 = s.get(self.GRADES_PAGE)
+            r2 = self._send(s, "GET", self.GRADES_PAGE, cookies=jar, deadline=deadline)
             r2.raise_for_status()
+            self._merge_cookies(jar, r2)
             api_token = self._get_hidden_token(r2.text)
 
             # 4) Extract cookies as dict (filter out malformed cookies like 'no-cache')
             cookies_dict = {}
-            for c in s.cookies:
+            for c in jar:
                 try:
                     if c.name and c.value is not None and c.domain is not None:
                         cookies_dict[c.name] = c.value
@@ -240,140 +521,93 @@ class GradeFetcher:
                     pass
             student_no = username
 
-            _log('info', student_no, f"Successfully obtained credentials for {student_no}")
+            _log('info', student_no, "Successfully obtained credentials")
             return True, "登入成功", cookies_dict, student_no, api_token
 
         except Exception as e:
-            _log('error', username, f"Login Exception: {e}")
+            if isinstance(e, _passthrough_errors()):
+                raise
+            _log('error', username, "Login Exception: %s", e)
             return False, f"登入錯誤: {str(e)}", None, None, None
+        finally:
+            if s is not None:
+                s.close()
+
+    def get_year_terms_via_api(self, cookies, student_no, token, session=None, deadline=None):
+        """Fetch the queryable year/term list as [(display_text, year_value), ...]. Raises on failure."""
+        url, headers, data = self._year_terms_request(student_no, token)
 
-    def get_structure_via_api(self, cookies, student_no, token, session=None):
-        """Fetch structure using requests"""
-        url = "https://shcloud2.k12ea.gov.tw/CLHSTYC/ICampus/CommonData/GetGradeCanQueryYearTermListByStudentNo"
-        headers = {
-            "Accept": "*/*",
-            "Content-Type": "application/x-www-form-urlencoded; charset=UTF-8",
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-            "X-Requested-With": "XMLHttpRequest",
-            "Origin": "https://shcloud2.k12ea.gov.tw",
-            "Referer": "https://shcloud2.k12ea.gov.tw/CLHSTYC/ICampus/StudentInfo/Index?page=%E6%88%90%E7%B8%BE%E6%9F%A5%E8%A9%A2"
-        }
-        data = {
-            "searchType": "各次考試單科成績",
-            "studentNo": student_no,
-            "__RequestVerificationToken": token
-        }
-        
         own_session = False
         if session is None:
             session = self.session_factory()
             own_session = True
 
         try:
-            _log('info', student_no, f"Requesting structure for {student_no}...")
-            response = session.post(url, headers=headers, data=data, cookies=cookies)
+            _log('info', student_no, "Requesting structure...")
+            response = self._send(session, "POST", url, headers=headers, data=data, cookies=cookies, deadline=deadline)
             response.raise_for_status()
-            
-            years_data = response.json()
-            structure = {}
-            
-            # Collect items to fetch
-            items = []
-            for item in years_data:
-                name = item.get('DisplayText') or item.get('text')
-                value = item.get('Value') or item.get('value')
-                if value:
-                    items.append((name, value))
-            
+
+            return self._parse_year_terms(response.json())
+        finally:
+            if own_session:
+                session.close()
+
+    def get_structure_via_api(self, cookies, student_no, token, session=None, deadline=None):
+        """Fetch structure using requests"""
+        own_session = False
+        if session is None:
+            session = self.session_factory()
+            own_session = True
+
+        try:
+            items = self.get_year_terms_via_api(cookies, student_no, token, session=session, deadline=deadline)
+
             # Fetch all exams in parallel
             current_req_id = g.request_id if has_request_context() and 'request_id' in g else None
-            
-            def _fetch_one(name_value):
-                n, v = name_value
-                exams = self.get_exams_via_api(cookies, student_no, token, v, req_id=current_req_id, session=session)
-                return n, v, exams
-            
-            with ThreadPoolExecutor(max_workers=min(len(items) or 1, 10)) as pool:
-                for name, value, exams in pool.map(_fetch_one, items):
-                    structure[name] = {
-                        "year_value": value,
-                        "exams": exams
-                    }
-                
-            return structure
-            
+
+            def _fetch_exams(year_value):
+                return self.get_exams_via_api(
+                    cookies, student_no, token, year_value, req_id=current_req_id, session=session, deadline=deadline
+                )
+
+            return build_structure(items, _fetch_exams)
+
         except Exception as e:
-            _log('error', student_no, f"Error fetching structure: {e}")
+            if isinstance(e, _passthrough_errors()):
+                raise
+            _log('error', student_no, "Error fetching structure: %s", e)
             return {}
         finally:
             if own_session:
                 session.close()
 
-    def get_exams_via_api(self, cookies, student_no, token, year_value, req_id=None, session=None):
+    def get_exams_via_api(self, cookies, student_no, token, year_value, req_id=None, session=None, deadline=None):
         """Helper to fetch exams for a year"""
-        url = "https://shcloud2.k12ea.gov.tw/CLHSTYC/ICampus/CommonData/GetGradeCanQueryExamNoListByStudentNo"
-        
-        year, term = _parse_year_term(year_value, default_year="114", default_term="1")
-
-        headers = {
-            "Content-Type": "application/x-www-form-urlencoded; charset=UTF-8",
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-             "X-Requested-With": "XMLHttpRequest",
-             "Referer": "https://shcloud2.k12ea.gov.tw/CLHSTYC/ICampus/StudentInfo/Index?page=%E6%88%90%E7%B8%BE%E6%9F%A5%E8%A9%A2"
-        }
-        data = {
-            "searchType": "單次考試所有成績",
-            "studentNo": student_no,
-            "year": year,
-            "term": term,
-            "__RequestVerificationToken": token
-        }
+        url, headers, data = self._exams_request(student_no, token, year_value)
         own_session = False
         if session is None:
             session = self.session_factory()
             own_session = True
 
         try:
-            resp = session.post(url, headers=headers, data=data, cookies=cookies)
+            resp = self._send(session, "POST", url, headers=headers, data=data, cookies=cookies, deadline=deadline)
             if resp.status_code == 200:
-                exams = []
-                for item in resp.json():
-                     exams.append({
-                         "text": item.get('DisplayText') or item.get('text'),
-                         "value": item.get('Value') or item.get('value')
-                     })
-                return exams
+                return self._parse_exams(resp.json())
         except Exception as e:
-            _log('error', student_no, f"Error fetching exams via API: {e}", req_id=req_id)
+            if isinstance(e, _passthrough_errors()):
+                raise
+            _log('error', student_no, "Error fetching exams via API: %s", e, req_id=req_id)
         finally:
             if own_session:
                 session.close()
                 
         return []
 
-    def fetch_grades_via_api(self, cookies, student_no, token, year_value, exam_value, session=None):
+    def fetch_grades_via_api(self, cookies, student_no, token, year_value, exam_value, session=None, deadline=None):
         """Fetch grades using requests"""
-        url = "https://shcloud2.k12ea.gov.tw/CLHSTYC/ICampus/TutorShGrade/GetScoreForStudentExamContent"
-        headers = {
-            "Accept": "*/*",
-            "Content-Type": "application/x-www-form-urlencoded; charset=UTF-8",
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-            "X-Requested-With": "XMLHttpRequest",
-            "Referer": "https://shcloud2.k12ea.gov.tw/CLHSTYC/ICampus/StudentInfo/Index?page=%E6%88%90%E7%B8%BE%E6%9F%A5%E8%A9%A2"
-        }
-        
-        year, term = _parse_year_term(year_value, default_year="114", default_term="2")
+        url, headers, data = self._grades_request(student_no, token, year_value, exam_value)
 
-        data = {
-            "StudentNo": student_no,
-            "SearchType": "單次考試所有成績",
-            "__RequestVerificationToken": token,
-            "Year": year,
-            "Term": term,
-            "ExamNo": exam_value
-        }
-        
-        _log('info', student_no, f"API Fetching grades: Year={year}, Term={term}, Exam={exam_value}")
+        _log('info', student_no, "API Fetching grades: Year=%s, Term=%s, Exam=%s", data['Year'], data['Term'], exam_value)
         
         own_session = False
         if session is None:
@@ -381,11 +615,11 @@ class GradeFetcher:
             own_session = True
 
         try:
-            response = session.post(url, headers=headers, data=data, cookies=cookies)
+            response = self._send(session, "POST", url, headers=headers, data=data, cookies=cookies, deadline=deadline)
             response.raise_for_status()
             return response.json()
         except Exception as e:
-            _log('error', student_no, f"API Fetch Error: {e}")
+            _log('error', student_no, "API Fetch Error: %s", e)
             raise e
         finally:
             if own_session:
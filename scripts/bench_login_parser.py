@@ -0,0 +1,35 @@
+"""Micro-benchmark：登入頁解析，單次 regex 掃描 vs. BeautifulSoup（原本每頁解析 4 次）。
+
+用法：python scripts/bench_login_parser.py [html_path] [iterations]
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fetcher import GradeFetcher  # noqa: E402
+
+DEFAULT_FIXTURE = os.path.join('tests', 'backend', 'fixtures', 'school_login_page.html')
+
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_FIXTURE
+    iterations = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    with open(path, encoding='utf-8') as f:
+        html = f.read()
+
+    fetcher = GradeFetcher(session_factory=lambda: None)
+    assert fetcher._parse_login_page(html) == fetcher._parse_login_page_soup(html)
+
+    fast = timeit.timeit(lambda: fetcher._parse_login_page(html), number=iterations)
+    soup = timeit.timeit(lambda: fetcher._parse_login_page_soup(html), number=iterations)
+
+    print(f'page: {path} ({len(html.encode("utf-8")) / 1024:.1f} KB), iterations: {iterations}')
+    print(f'single-pass scan : {fast / iterations * 1000:8.3f} ms/page')
+    print(f'BeautifulSoup x4 : {soup / iterations * 1000:8.3f} ms/page')
+    print(f'speedup          : {soup / fast:8.1f}x')
+
+
+if __name__ == '__main__':
+    main()
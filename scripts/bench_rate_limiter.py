@@ -0,0 +1,83 @@
+"""Benchmark：舊版 INCR/EXPIRE/TTL 速率限制 vs. Lua script 單次 round-trip。
+
+預設使用 fakeredis（只比較 CPU 與指令數）；設定 REDIS_URL 可對本機 Redis 量測實際延遲。
+用法：python scripts/bench_rate_limiter.py [iterations]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.rate_limiter import is_rate_limited  # noqa: E402
+
+
+def legacy_is_rate_limited(redis_client, ip, max_attempts=5, window_seconds=60, key_prefix="login"):
+    key = f"rate_limit:{key_prefix}:{ip}"
+    current = redis_client.incr(key)
+    if current == 1:
+        redis_client.expire(key, window_seconds)
+    if current > max_attempts:
+        ttl = redis_client.ttl(key)
+        return True, 0, ttl if ttl > 0 else window_seconds
+    return False, max_attempts - current, 0
+
+
+class CountingClient:
+    """計算每次檢查送出的 Redis 指令（round-trip）數。"""
+
+    def __init__(self, client):
+        self._client = client
+        self.calls = 0
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if name == 'register_script':
+            def register(source):
+                script = attr(source)
+
+                def run(keys=None, args=None):
+                    self.calls += 1
+                    return script(keys=keys, args=args, client=self._client)
+                return run
+            return register
+        if callable(attr):
+            def wrapped(*args, **kwargs):
+                self.calls += 1
+                return attr(*args, **kwargs)
+            return wrapped
+        return attr
+
+
+def _client():
+    url = os.environ.get('REDIS_URL')
+    if url:
+        import redis
+        return redis.from_url(url), url
+    import fakeredis
+    return fakeredis.FakeRedis(), 'fakeredis'
+
+
+def _run(name, fn, client, iterations):
+    counting = CountingClient(client)
+    start = time.perf_counter()
+    for i in range(iterations):
+        # 每 20 次換一個 IP，混合「未受限」與「已受限」路徑
+        fn(counting, f'bench-{name}-{i // 20}', max_attempts=5, window_seconds=60, key_prefix='bench')
+    elapsed = time.perf_counter() - start
+    print(f'{name:<16} {elapsed / iterations * 1e6:9.1f} us/check   {counting.calls / iterations:4.2f} round-trips/check')
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    client, label = _client()
+    print(f'backend: {label}, iterations: {iterations}')
+    _run('legacy', legacy_is_rate_limited, client, iterations)
+    for algorithm in ('fixed', 'sliding', 'gcra'):
+        _run(f'lua-{algorithm}',
+             lambda c, ip, **kw: is_rate_limited(c, ip, algorithm=algorithm, **kw),
+             client, iterations)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""Benchmark：GET /api/share/<id> 回應組裝，decode + jsonify vs. 直接輸出儲存的 JSON bytes。
+
+兩者都從相同的 share_codec 儲存值開始（含 zlib 解壓），差異只在是否重新解析/序列化。
+用法：python scripts/bench_share_read.py [subjects] [iterations]
+"""
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask, jsonify  # noqa: E402
+
+from app.services import share_codec  # noqa: E402
+
+
+def _payload(subjects):
+    return {
+        'Result': {
+            'StudentClassName': '高二 1 班',
+            'SubjectExamInfoList': [
+                {
+                    'SubjectName': f'科目{i}',
+                    'ScoreDisplay': f'{60 + i % 40}.00',
+                    'Score': 60 + i % 40,
+                    'ClassAVGScore': 72.3,
+                    'ClassRank': i % 36 + 1,
+                    'YearTermDisplay': '114 學年度 上學期',
+                }
+                for i in range(subjects)
+            ],
+        },
+    }
+
+
+def _legacy(app, stored):
+    data = share_codec.decode(stored)
+    return jsonify({'success': True, 'data': data}).get_data()
+
+
+def _raw(app, stored):
+    json_bytes = share_codec.decode_json_bytes(stored)
+    resp = app.response_class([b'{"success":true,"data":', json_bytes, b'}'], mimetype='application/json')
+    return resp.get_data()
+
+
+def main():
+    subjects = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+    iterations = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    app = Flask(__name__)
+    stored = share_codec.encode(_payload(subjects))
+
+    with app.app_context():
+        assert json.loads(_legacy(app, stored)) == json.loads(_raw(app, stored))
+        size = len(_raw(app, stored))
+        print(f'payload: {size / 1024:.1f} KB (stored {len(stored) / 1024:.1f} KB), iterations: {iterations}')
+        for name, fn in (('decode+jsonify', _legacy), ('raw bytes', _raw)):
+            start = time.perf_counter()
+            for _ in range(iterations):
+                fn(app, stored)
+            elapsed = time.perf_counter() - start
+            print(f'{name:<16} {elapsed / iterations * 1000:8.3f} ms/response')
+
+
+if __name__ == '__main__':
+    main()
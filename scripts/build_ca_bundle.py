@@ -0,0 +1,18 @@
+"""建置時合併 certifi 與 TWCA 中繼憑證為 certs/ca-bundle.pem。
+
+執行期 app.services.http_client 直接載入此檔，不再於暫存目錄寫入合併後的 bundle。
+
+    python scripts/build_ca_bundle.py [輸出路徑]
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.http_client import PREBUILT_CA_BUNDLE, build_ca_bundle  # noqa: E402
+
+
+if __name__ == '__main__':
+    dest = build_ca_bundle(sys.argv[1] if len(sys.argv) > 1 else PREBUILT_CA_BUNDLE)
+    print(f'[CA] Wrote {dest}')
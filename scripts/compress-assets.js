@@ -0,0 +1,72 @@
+import fs from 'fs';
+import path from 'path';
+import zlib from 'zlib';
+import { fileURLToPath } from 'url';
+
+const __filename = fileURLToPath(import.meta.url);
+const __dirname = path.dirname(__filename);
+
+const projectRoot = path.resolve(__dirname, '..');
+const distDir = path.resolve(projectRoot, 'public/dist');
+const extraFiles = [
+    path.resolve(projectRoot, 'public/index.html'),
+    path.resolve(projectRoot, 'public/privacy.html')
+];
+
+// 與 app/services/static_assets.py 的 COMPRESSIBLE_EXT / COMPRESS_MIN_BYTES 一致
+const COMPRESSIBLE_EXT = new Set(['.html', '.css', '.js', '.json', '.svg', '.webmanifest', '.xml', '.txt', '.ico', '.ttf']);
+const MIN_BYTES = 1024;
+
+function walk(dir) {
+    if (!fs.existsSync(dir)) {
+        return [];
+    }
+    return fs.readdirSync(dir, { withFileTypes: true }).flatMap(entry => {
+        if (entry.name.startsWith('.')) {
+            return [];
+        }
+        const full = path.join(dir, entry.name);
+        return entry.isDirectory() ? walk(full) : [full];
+    });
+}
+
+function compress(file) {
+    const data = fs.readFileSync(file);
+    if (data.length < MIN_BYTES || !COMPRESSIBLE_EXT.has(path.extname(file).toLowerCase())) {
+        return 0;
+    }
+
+    const variants = [
+        ['.br', zlib.brotliCompressSync(data, {
+            params: {
+                [zlib.constants.BROTLI_PARAM_QUALITY]: zlib.constants.BROTLI_MAX_QUALITY,
+                [zlib.constants.BROTLI_PARAM_SIZE_HINT]: data.length
+            }
+        })],
+        ['.gz', zlib.gzipSync(data, { level: zlib.constants.Z_BEST_COMPRESSION })]
+    ];
+
+    let written = 0;
+    variants.forEach(([suffix, encoded]) => {
+        // 壓縮後沒有變小就不產生，伺服器會直接送原檔
+        if (encoded.length < data.length) {
+            fs.writeFileSync(file + suffix, encoded);
+            written += 1;
+        } else if (fs.existsSync(file + suffix)) {
+            fs.unlinkSync(file + suffix);
+        }
+    });
+    return written;
+}
+
+try {
+    const files = walk(distDir)
+        .filter(file => !file.endsWith('.br') && !file.endsWith('.gz'))
+        .concat(extraFiles.filter(file => fs.existsSync(file)));
+
+    const written = files.reduce((total, file) => total + compress(file), 0);
+    console.log(`[Compress] Wrote ${written} precompressed variants for ${files.length} files`);
+} catch (error) {
+    console.error('[Compress] Error:', error);
+    process.exit(1);
+}
@@ -1,6 +1,12 @@
-from app import create_app
+import startup_profile
 
-app = create_app()
+startup_profile.install()
+
+from app import create_app  # noqa: E402
+
+with startup_profile.phase('create_app'):
+    app = create_app()
+startup_profile.report()
 
 if __name__ == '__main__':
     logger = app.config['LOGGER']
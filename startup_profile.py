@@ -0,0 +1,81 @@
+"""啟動剖析 — ``STARTUP_PROFILE=1`` 時記錄各模組 import 耗時與 create_app 各階段耗時。
+
+server.py 在 import app 之前呼叫 ``install()``，create_app 完成後呼叫 ``report()``，
+輸出依累計時間排序的模組（含子模組）與自身時間，以及各初始化階段的耗時。
+此模組只依賴標準函式庫，必須能在 app 與第三方套件載入前 import。
+"""
+
+import builtins
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+ENABLED = os.environ.get('STARTUP_PROFILE', '').lower() in ('1', 'true', 'yes')
+
+# 模組名稱 -> (累計秒數, 自身秒數)；只記錄第一次（真正載入的那次）
+_imports = {}
+_phases = []
+_stack = []
+_original_import = None
+
+
+def _timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+    if level or name in sys.modules:
+        return _original_import(name, globals, locals, fromlist, level)
+
+    start = time.perf_counter()
+    _stack.append(0.0)
+    try:
+        return _original_import(name, globals, locals, fromlist, level)
+    finally:
+        elapsed = time.perf_counter() - start
+        children = _stack.pop()
+        if _stack:
+            _stack[-1] += elapsed
+        _imports.setdefault(name, (elapsed, elapsed - children))
+
+
+def install():
+    """開始記錄 import 耗時（未啟用時不做任何事）。"""
+    global _original_import
+    if not ENABLED or _original_import is not None:
+        return
+    _original_import = builtins.__import__
+    builtins.__import__ = _timed_import
+
+
+def uninstall():
+    global _original_import
+    if _original_import is not None:
+        builtins.__import__ = _original_import
+        _original_import = None
+
+
+@contextmanager
+def phase(name):
+    """記錄 create_app 中一個初始化階段的耗時。"""
+    if not ENABLED:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _phases.append((name, time.perf_counter() - start))
+
+
+def report(top=25, stream=None):
+    """輸出剖析結果並停止記錄 import，回傳輸出的文字。"""
+    if not ENABLED:
+        return ''
+    uninstall()
+    lines = [f'[startup] pid={os.getpid()} slowest imports (cumulative / self, ms):']
+    for name, (total, own) in sorted(_imports.items(), key=lambda item: item[1][0], reverse=True)[:top]:
+        lines.append(f'[startup]   {total * 1000:8.1f} {own * 1000:8.1f}  {name}')
+    lines.append('[startup] create_app phases (ms):')
+    for name, elapsed in _phases:
+        lines.append(f'[startup]   {elapsed * 1000:8.1f}  {name}')
+    text = '\n'.join(lines)
+    print(text, file=stream or sys.stderr, flush=True)
+    return text
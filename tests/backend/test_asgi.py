@@ -0,0 +1,95 @@
+import asyncio
+import time
+
+from flask import Flask, Response, request
+
+from app.asgi import WSGIBridge, build_environ
+
+
+def _call(bridge, method, path, body=b'', headers=(), query=b''):
+    async def run():
+        messages = []
+        chunks = [{'type': 'http.request', 'body': body, 'more_body': False}]
+
+        async def receive():
+            return chunks.pop(0) if chunks else {'type': 'http.disconnect'}
+
+        async def send(message):
+            messages.append(message)
+
+        scope = {
+            'type': 'http', 'method': method, 'path': path, 'query_string': query,
+            'headers': [(k.encode(), v.encode()) for k, v in headers],
+            'server': ('testserver', 80), 'client': ('10.0.0.1', 5555), 'scheme': 'http', 'http_version': '1.1',
+        }
+        await bridge(scope, receive, send)
+        return messages
+
+    return run()
+
+
+def _app():
+    app = Flask(__name__)
+
+    @app.route('/echo', methods=['POST'])
+    def echo():
+        return {'json': request.json, 'ip': request.remote_addr, 'q': request.args.get('q')}
+
+    @app.route('/stream')
+    def stream():
+        return Response((f'{i}\n' for i in range(3)), mimetype='application/x-ndjson')
+
+    @app.route('/slow')
+    def slow():
+        time.sleep(0.2)
+        return 'ok'
+
+    return app
+
+
+def test_bridge_passes_body_headers_and_query():
+    bridge = WSGIBridge(_app(), max_threads=4)
+    messages = asyncio.run(_call(
+        bridge, 'POST', '/echo', body=b'{"a": 1}', headers=[('content-type', 'application/json')], query=b'q=x',
+    ))
+
+    assert messages[0]['status'] == 200
+    body = b''.join(m.get('body', b'') for m in messages[1:])
+    assert body == b'{"ip":"10.0.0.1","json":{"a":1},"q":"x"}\n'
+    assert messages[-1].get('more_body', False) is False
+
+
+def test_bridge_streams_each_chunk():
+    bridge = WSGIBridge(_app(), max_threads=4)
+    messages = asyncio.run(_call(bridge, 'GET', '/stream'))
+
+    bodies = [m['body'] for m in messages[1:] if m.get('body')]
+    assert bodies == [b'0\n', b'1\n', b'2\n']
+
+
+def test_bridge_holds_many_blocked_requests_at_once():
+    bridge = WSGIBridge(_app(), max_threads=64)
+
+    async def many():
+        return await asyncio.gather(*(_call(bridge, 'GET', '/slow') for _ in range(50)))
+
+    start = time.monotonic()
+    results = asyncio.run(many())
+    assert all(messages[0]['status'] == 200 for messages in results)
+    assert time.monotonic() - start < 1.5
+
+
+def test_bridge_rejects_oversized_body():
+    bridge = WSGIBridge(_app(), max_threads=1, max_body=4)
+    messages = asyncio.run(_call(bridge, 'POST', '/echo', body=b'0123456789'))
+    assert messages[0]['status'] == 413
+
+
+def test_environ_keeps_root_path_and_repeated_headers():
+    environ = build_environ({
+        'type': 'http', 'method': 'GET', 'path': '/app/api/x', 'raw_path': b'/app/api/x', 'root_path': '/app',
+        'query_string': b'', 'headers': [(b'x-forwarded-for', b'1.1.1.1'), (b'x-forwarded-for', b'2.2.2.2')],
+    }, b'')
+    assert environ['SCRIPT_NAME'] == '/app'
+    assert environ['PATH_INFO'] == '/api/x'
+    assert environ['HTTP_X_FORWARDED_FOR'] == '1.1.1.1,2.2.2.2'
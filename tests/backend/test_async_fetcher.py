@@ -0,0 +1,93 @@
+import json
+from http.cookiejar import CookieJar
+
+import httpx
+
+from app.services.http_client import _RejectAllCookiePolicy
+from async_fetcher import AsyncGradeFetcher, EventLoopThread, LoopBoundGradeFetcher
+
+
+def _handler(request):
+    path = request.url.path
+    if path.endswith('GetGradeCanQueryYearTermListByStudentNo'):
+        assert request.headers.get('Cookie') == 'sid=abc'
+        return httpx.Response(200, json=[{'DisplayText': '114上', 'Value': '1141'}, {'DisplayText': '114下', 'Value': '1142'}])
+    if path.endswith('GetGradeCanQueryExamNoListByStudentNo'):
+        term = dict(httpx.QueryParams(request.content.decode()))['term']
+        return httpx.Response(200, json=[{'DisplayText': f'段考{term}', 'Value': term}])
+    if path.endswith('GetScoreForStudentExamContent'):
+        form = dict(httpx.QueryParams(request.content.decode()))
+        return httpx.Response(200, json={'Result': {'ExamNo': form['ExamNo'], 'Year': form['Year']}})
+    return httpx.Response(404)
+
+
+def _fetcher():
+    def factory():
+        client = httpx.AsyncClient(transport=httpx.MockTransport(_handler))
+        client.cookies = CookieJar(policy=_RejectAllCookiePolicy())
+        return client
+    return LoopBoundGradeFetcher(AsyncGradeFetcher(client_factory=factory), EventLoopThread())
+
+
+def test_async_structure_matches_threaded_contract():
+    fetcher = _fetcher()
+    structure = fetcher.get_structure_via_api({'sid': 'abc'}, 'A123', 'tok')
+    assert structure == {
+        '114上': {'year_value': '1141', 'exams': [{'text': '段考1', 'value': '1'}]},
+        '114下': {'year_value': '1142', 'exams': [{'text': '段考2', 'value': '2'}]},
+    }
+
+
+def test_async_fetch_grades_returns_upstream_json():
+    fetcher = _fetcher()
+    data = fetcher.fetch_grades_via_api({'sid': 'abc'}, 'A123', 'tok', '1141', '3')
+    assert json.loads(json.dumps(data)) == {'Result': {'ExamNo': '3', 'Year': '114'}}
+
+
+def test_async_redirects_keep_user_cookies_and_collect_new_ones():
+    seen = []
+
+    def handler(request):
+        seen.append((request.url.path, request.headers.get('Cookie')))
+        if request.url.path == '/CLHSTYC/Auth/Auth/CloudLogin':
+            return httpx.Response(302, headers={'Location': '/CLHSTYC/Auth/Auth/Hop', 'Set-Cookie': 'hop=1; Path=/'})
+        if request.url.path == '/CLHSTYC/Auth/Auth/Hop':
+            return httpx.Response(302, headers={'Location': 'https://other.example/x'})
+        if request.url.host == 'other.example':
+            return httpx.Response(200, text='done')
+        return httpx.Response(404)
+
+    def factory():
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        client.cookies = CookieJar(policy=_RejectAllCookiePolicy())
+        return client
+
+    fetcher = AsyncGradeFetcher(client_factory=factory, status_retries=0)
+    jar = {'sid': 'abc'}
+    response = EventLoopThread().run(fetcher._request('GET', fetcher.LOGIN_PAGE, cookie_jar=jar))
+
+    assert response.text == 'done'
+    assert len(response.history) == 2
+    assert seen == [
+        ('/CLHSTYC/Auth/Auth/CloudLogin', 'sid=abc'),
+        ('/CLHSTYC/Auth/Auth/Hop', 'sid=abc; hop=1'),
+        ('/x', None),
+    ]
+    assert jar == {'sid': 'abc', 'hop': '1'}
+
+
+def test_async_retries_retryable_status_like_sync_session():
+    statuses = iter([503, 502, 200])
+
+    def handler(request):
+        assert request.headers.get('Cookie') == 'sid=abc'
+        return httpx.Response(next(statuses), json={'ok': True})
+
+    fetcher = AsyncGradeFetcher(
+        client_factory=lambda: httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+        status_retries=2, backoff_factor=0.01,
+    )
+    response = EventLoopThread().run(
+        fetcher._request('POST', fetcher.GRADES_PAGE, cookie_jar={'sid': 'abc'}, data={'a': '1'})
+    )
+    assert response.status_code == 200
@@ -1,6 +1,13 @@
-from app.services.auth_service import is_logged_in, login_and_build_session_payload
+import threading
+import time
 from unittest.mock import Mock
 
+import pytest
+
+from app import create_app
+from app.services import turnstile_service
+from app.services.auth_service import is_logged_in, login_and_build_session_payload, pack_cookies, unpack_cookies
+
 def test_is_logged_in():
     assert is_logged_in({'api_cookies': 'c', 'api_token': 't'})
     assert not is_logged_in({'api_cookies': 'c'})
@@ -8,11 +15,12 @@ def test_is_logged_in():
 
 def test_login_and_build_session_payload():
     fetcher = Mock()
-    fetcher.login_and_get_tokens.return_value = (True, 'Success', 'cookies', '123', 'token')
+    fetcher.login_and_get_tokens.return_value = (True, 'Success', {'sid': 'abc', 'auth': 'x=1'}, '123', 'token')
     
     success, msg, payload = login_and_build_session_payload(fetcher, 'user', 'pass')
     assert success
-    assert payload['api_cookies'] == 'cookies'
+    assert payload['api_cookies'] == 'sid=abc; auth=x=1'
+    assert 'username' not in payload
     assert payload['student_no'] == '123'
     assert payload['api_token'] == 'token'
 
@@ -24,3 +32,133 @@ def test_login_and_build_session_payload_fail():
     assert not success
     assert msg == 'Failed to login'
     assert payload is None
+
+
+def test_pack_cookies_roundtrip_and_legacy_dict():
+    cookies = {'ASP.NET_SessionId': 'abc', '.ASPXAUTH': 'DEF=='}
+    assert unpack_cookies(pack_cookies(cookies)) == cookies
+    assert unpack_cookies({'sid': 'x'}) == {'sid': 'x'}
+    assert unpack_cookies(None) is None
+
+
+@pytest.fixture
+def login_client(monkeypatch):
+    monkeypatch.setenv('APP_ENV', 'testing')
+    app = create_app()
+    app.config['TESTING'] = True
+    app.config['REDIS_CLIENT'] = None
+    fetcher = Mock()
+    app.config['GRADE_FETCHER'] = fetcher
+    with app.test_client() as client:
+        yield client, fetcher
+
+
+def _slow_login(*_args, **_kwargs):
+    time.sleep(0.3)
+    return True, '登入成功', {'sid': 'abc'}, '123', 'token'
+
+
+def _login_body():
+    return {'username': 'user', 'password': 'pass', 'captcha_code': '1234', 'turnstile_token': 't'}
+
+
+def test_login_overlaps_turnstile_with_school_login(login_client, monkeypatch):
+    client, fetcher = login_client
+    # 兩邊都必須在對方完成前抵達 barrier；依序執行時 wait 會逾時並拋出 BrokenBarrierError
+    barrier = threading.Barrier(2, timeout=5)
+    overlapped = []
+
+    def login(*_args, **_kwargs):
+        barrier.wait()
+        overlapped.append('login')
+        return True, '登入成功', {'sid': 'abc'}, '123', 'token'
+
+    def verify(*_args, **_kwargs):
+        barrier.wait()
+        overlapped.append('turnstile')
+        return True, None
+
+    fetcher.login_and_get_tokens.side_effect = login
+    monkeypatch.setattr(turnstile_service, 'verify_turnstile_token', verify)
+
+    res = client.post('/api/login', json=_login_body())
+
+    assert res.status_code == 200
+    assert sorted(overlapped) == ['login', 'turnstile']
+    assert client.get('/api/check_login').status_code == 200
+
+
+def test_login_discards_school_session_when_turnstile_fails(login_client, monkeypatch):
+    client, fetcher = login_client
+    fetcher.login_and_get_tokens.side_effect = _slow_login
+
+    def failing_verify(*_args, **_kwargs):
+        time.sleep(0.1)
+        return False, '人機驗證失敗，請重試'
+
+    monkeypatch.setattr(turnstile_service, 'verify_turnstile_token', failing_verify)
+
+    res = client.post('/api/login', json=_login_body())
+
+    assert res.status_code == 403
+    assert res.get_json()['need_refresh_captcha'] is True
+    fetcher.login_and_get_tokens.assert_called_once()
+    assert client.get('/api/check_login').status_code == 401
+
+
+def test_login_returns_503_when_school_circuit_is_open(login_client, monkeypatch):
+    from app.services.upstream_guard import UpstreamUnavailable
+
+    client, fetcher = login_client
+    fetcher.login_and_get_tokens.side_effect = UpstreamUnavailable('login_check', 'circuit_open', retry_after=30)
+    monkeypatch.setattr(turnstile_service, 'verify_turnstile_token', lambda *_a, **_k: (True, None))
+
+    res = client.post('/api/login', json=_login_body())
+
+    assert res.status_code == 503
+    assert res.headers['Retry-After'] == '30'
+    assert res.get_json()['need_refresh_captcha'] is True
+
+
+def test_failed_turnstile_does_not_use_up_login_quota(login_client, monkeypatch):
+    client, fetcher = login_client
+    fetcher.login_and_get_tokens.return_value = (True, '登入成功', {'sid': 'abc'}, '123', 'token')
+    verdict = {'ok': False}
+    monkeypatch.setattr(
+        turnstile_service, 'verify_turnstile_token',
+        lambda *_a, **_k: (True, None) if verdict['ok'] else (False, '人機驗證失敗，請重試'),
+    )
+
+    for _ in range(8):
+        assert client.post('/api/login', json=_login_body()).status_code == 403
+
+    verdict['ok'] = True
+    assert client.post('/api/login', json=_login_body()).status_code == 200
+
+
+def test_active_session_expiry_is_extended_at_most_every_half_lifetime(login_client, monkeypatch):
+    from types import SimpleNamespace
+
+    from app.services import auth_service
+
+    client, fetcher = login_client
+    fetcher.login_and_get_tokens.return_value = (True, '登入成功', {'sid': 'abc'}, '123', 'token')
+    monkeypatch.setattr(turnstile_service, 'verify_turnstile_token', lambda *_a, **_k: (True, None))
+    lifetime = client.application.permanent_session_lifetime.total_seconds()
+    start = time.time()
+
+    def at(offset):
+        monkeypatch.setattr(auth_service, 'time', SimpleNamespace(time=lambda: start + offset))
+        return client.get('/api/check_login')
+
+    monkeypatch.setattr(auth_service, 'time', SimpleNamespace(time=lambda: start))
+    assert client.post('/api/login', json=_login_body()).status_code == 200
+
+    early = at(lifetime * 0.1)
+    late = at(lifetime * 0.6)
+    after_refresh = at(lifetime * 0.7)
+
+    assert early.status_code == 200 and 'Set-Cookie' not in early.headers
+    # 剩餘不到一半：回寫 session 並重新設定 cookie（延長存活時間）
+    assert late.status_code == 200 and 'Set-Cookie' in late.headers
+    assert 'Set-Cookie' not in after_refresh.headers
@@ -0,0 +1,74 @@
+import time
+from unittest.mock import Mock
+
+from app.services.captcha_pool import CaptchaPool
+
+
+def _payload(n):
+    return True, 'OK', {
+        'image_bytes': f'img-{n}'.encode(),
+        'content_type': 'image/png',
+        'context': {'login_token': f'tok-{n}', 'cookies': {}},
+    }
+
+
+def _wait_for(pool, count, timeout=2):
+    deadline = time.time() + timeout
+    while time.time() < deadline and (pool._refilling or pool._count() < count):
+        time.sleep(0.01)
+
+
+def test_refill_and_take_hands_out_each_context_once():
+    fetcher = Mock()
+    fetcher.prepare_login_captcha.side_effect = [_payload(i) for i in range(3)]
+    pool = CaptchaPool(fetcher, size=3, max_age=30)
+
+    assert pool.take() is None
+    pool.refill_async()
+    _wait_for(pool, 3)
+
+    taken = [pool.take() for _ in range(4)]
+    assert [p['context']['login_token'] for p in taken[:3]] == ['tok-0', 'tok-1', 'tok-2']
+    assert taken[0]['image_bytes'] == b'img-0'
+    assert taken[3] is None
+
+
+def test_take_discards_expired_contexts():
+    fetcher = Mock()
+    fetcher.prepare_login_captcha.side_effect = [_payload(0)]
+    pool = CaptchaPool(fetcher, size=1, max_age=30)
+    pool.refill_async()
+    _wait_for(pool, 1)
+
+    pool.max_age = -1
+    assert pool.take() is None
+
+
+def test_each_request_refills_only_one_slot():
+    fetcher = Mock()
+    fetcher.prepare_login_captcha.side_effect = [_payload(i) for i in range(5)]
+    pool = CaptchaPool(fetcher, size=3, max_age=30)
+
+    pool.refill_async(1)
+    _wait_for(pool, 1)
+    assert fetcher.prepare_login_captcha.call_count == 1
+
+    assert pool.take()['context']['login_token'] == 'tok-0'
+    pool.refill_async(1)
+    _wait_for(pool, 1)
+    assert fetcher.prepare_login_captcha.call_count == 2
+    assert pool._count() == 1
+
+
+def test_warm_fills_pool_once_redis_readiness_settles():
+    fetcher = Mock()
+    fetcher.prepare_login_captcha.side_effect = [_payload(i) for i in range(3)]
+    readiness = Mock()
+    pool = CaptchaPool(fetcher, size=3, max_age=30)
+
+    pool.warm_async(readiness, wait=1.0)
+    time.sleep(0.05)
+    _wait_for(pool, 3)
+
+    readiness.wait.assert_called_once_with(1.0)
+    assert pool._count() == 3
@@ -0,0 +1,87 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from app.services import http_client
+from app.services.deadline import Deadline, DeadlineExceeded, DeadlineTimeout
+from fetcher import GradeFetcher
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class _UnavailableHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    hits = 0
+
+    def do_POST(self):
+        type(self).hits += 1
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        self.send_response(503)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *_args):
+        pass
+
+
+@pytest.fixture
+def unavailable_server():
+    _UnavailableHandler.hits = 0
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _UnavailableHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_port}'
+    server.shutdown()
+    server.server_close()
+
+
+def test_deadline_timeout_shrinks_on_each_attempt():
+    clock = _Clock()
+    deadline = Deadline(12, clock=clock)
+    timeout = DeadlineTimeout(deadline, connect=5, read=20)
+
+    assert (timeout.connect_timeout, timeout.read_timeout) == (5, 12)
+
+    clock.now = 10
+    retry = timeout.clone()
+    assert (retry.connect_timeout, retry.read_timeout) == (2, 2)
+
+
+def test_check_raises_once_budget_is_spent():
+    clock = _Clock()
+    deadline = Deadline(1, clock=clock)
+    assert deadline.check() == 1
+
+    clock.now = 1
+    with pytest.raises(DeadlineExceeded):
+        deadline.check()
+
+
+def test_retries_stop_when_deadline_is_exhausted(unavailable_server, monkeypatch):
+    monkeypatch.delenv('SCHOOL_SOCKS_PROXY', raising=False)
+    monkeypatch.setenv('HTTP_RETRY_TOTAL', '10')
+    monkeypatch.setenv('HTTP_BACKOFF_FACTOR', '0.2')
+    http_client.reset_pooled_sessions()
+    fetcher = GradeFetcher()
+    monkeypatch.setattr(
+        fetcher, '_grades_request',
+        lambda *_args: (f'{unavailable_server}/GetScoreForStudentExamContent', {}, {'Year': '114', 'Term': '1'}),
+    )
+
+    start = time.monotonic()
+    try:
+        with pytest.raises(DeadlineExceeded):
+            fetcher.fetch_grades_via_api({}, 'A123', 'tok', '1141', '1', deadline=Deadline(1.0))
+    finally:
+        http_client.reset_pooled_sessions()
+
+    assert time.monotonic() - start < 1.5
+    assert 1 <= _UnavailableHandler.hits < 10
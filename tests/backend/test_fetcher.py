@@ -0,0 +1,41 @@
+import os
+
+import pytest
+
+from fetcher import GradeFetcher, scan_page_tags
+
+FIXTURE = os.path.join(os.path.dirname(__file__), 'fixtures', 'school_login_page.html')
+
+
+@pytest.fixture
+def login_html():
+    with open(FIXTURE, encoding='utf-8') as f:
+        return f.read()
+
+
+def test_fast_login_page_parse_matches_beautifulsoup(login_html):
+    fetcher = GradeFetcher(session_factory=lambda: None)
+    fast = fetcher._parse_login_page(login_html)
+
+    assert fast == fetcher._parse_login_page_soup(login_html)
+    assert fast['login_token'] == 'CfDJ8Kx_AbC-123&xyz=='
+    assert fast['shcaptcha_gen_code'] == '10'
+    assert fast['device_token'] == 'dev-7f3a9c'
+    assert fast['captcha_url'] == 'https://shcloud2.k12ea.gov.tw/CLHSTYC/Auth/Auth/GetCaptcha?t=1716200000000&w=120'
+
+
+def test_scan_page_tags_skips_comments_and_keeps_first_input():
+    html = (
+        '<!-- <input name="a" value="commented"> -->'
+        '<input name="a" value="first"><input name="a" value="second">'
+        "<IMG ID='Captcha1' SRC=/x.png>"
+    )
+    inputs, imgs = scan_page_tags(html)
+    assert inputs == {'a': 'first'}
+    assert imgs == [{'id': 'Captcha1', 'src': '/x.png'}]
+
+
+def test_parse_login_page_falls_back_when_token_missing():
+    fetcher = GradeFetcher(session_factory=lambda: None)
+    with pytest.raises(RuntimeError):
+        fetcher._parse_login_page('<html><body>維護中</body></html>')
@@ -1,4 +1,6 @@
-from app.services.grades_service import filter_grades_data
+from unittest.mock import Mock
+
+from app.services.grades_service import filter_grades_data, get_structure
 
 def test_filter_grades_data_empty():
     assert filter_grades_data({}) == {}
@@ -22,3 +24,229 @@ def test_filter_grades_data_valid():
     assert len(filtered['Result']['SubjectExamInfoList']) == 1
     assert filtered['Result']['SubjectExamInfoList'][0]['SubjectName'] == 'Math'
     assert filtered['Result']['成績五標List'][0]['頂標'] == 88
+
+
+class _DictRedis:
+    def __init__(self):
+        self.store = {}
+
+    def get(self, key):
+        return self.store.get(key)
+
+    def setex(self, key, ttl, value):
+        self.store[key] = value
+
+    def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.store:
+            return False
+        self.store[key] = value
+        return True
+
+    def delete(self, *keys):
+        for key in keys:
+            self.store.pop(key, None)
+
+
+def _structure_fetcher():
+    fetcher = Mock()
+    fetcher.get_year_terms_via_api.return_value = [('114上', '1141'), ('114下', '1142')]
+    fetcher.get_exams_via_api.side_effect = lambda c, s, t, year_value, deadline=None: [{'text': 'E1', 'value': f'{year_value}-1'}]
+    return fetcher
+
+
+def test_get_structure_shares_cached_exam_lists_across_students():
+    redis_client = _DictRedis()
+    fetcher = _structure_fetcher()
+
+    first = get_structure(fetcher, {}, 'A123', 'tok', redis_client=redis_client)
+    second = get_structure(fetcher, {}, 'B456', 'tok', redis_client=redis_client)
+
+    assert first == second
+    assert first['114下'] == {'year_value': '1142', 'exams': [{'text': 'E1', 'value': '1142-1'}]}
+    assert fetcher.get_year_terms_via_api.call_count == 2
+    assert fetcher.get_exams_via_api.call_count == 2
+
+
+def test_get_structure_force_reload_bypasses_cache():
+    redis_client = _DictRedis()
+    fetcher = _structure_fetcher()
+
+    get_structure(fetcher, {}, 'A123', 'tok', redis_client=redis_client)
+    get_structure(fetcher, {}, 'A123', 'tok', redis_client=redis_client, force_reload=True)
+
+    assert fetcher.get_year_terms_via_api.call_count == 2
+    assert fetcher.get_exams_via_api.call_count == 4
+
+
+def test_get_structure_without_redis_uses_fetcher_directly():
+    fetcher = Mock()
+    fetcher.get_structure_via_api.return_value = {'x': 1}
+    assert get_structure(fetcher, {}, 'A123', 'tok') == {'x': 1}
+
+
+def test_fetch_grades_coalesces_concurrent_identical_calls():
+    import threading
+    import time
+
+    from app.services.grades_service import fetch_grades
+
+    calls = []
+
+    def slow_fetch(*args, **_kwargs):
+        calls.append(args)
+        time.sleep(0.2)
+        return {'Result': {'StudentName': 'Test', 'SubjectExamInfoList': []}}
+
+    fetcher = Mock()
+    fetcher.fetch_grades_via_api.side_effect = slow_fetch
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(fetch_grades(fetcher, {}, 'A123', 'tok', '1141', '1')))
+        for _ in range(5)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(calls) == 1
+    assert len(results) == 5
+    assert all(r['Result']['StudentName'] == 'Test' for r in results)
+
+
+def test_fetch_grades_followers_receive_leader_error():
+    import threading
+    import time
+
+    from app.services.grades_service import fetch_grades
+
+    def failing_fetch(*_args, **_kwargs):
+        time.sleep(0.2)
+        raise RuntimeError('upstream down')
+
+    fetcher = Mock()
+    fetcher.fetch_grades_via_api.side_effect = failing_fetch
+
+    errors = []
+
+    def run():
+        try:
+            fetch_grades(fetcher, {}, 'A123', 'tok', '1141', '2')
+        except RuntimeError as exc:
+            errors.append(str(exc))
+
+    threads = [threading.Thread(target=run) for _ in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert errors == ['upstream down'] * 3
+    assert fetcher.fetch_grades_via_api.call_count == 1
+
+
+def test_fetch_grades_result_cache_is_encrypted_and_respects_force():
+    from app.services.grades_service import fetch_grades
+    from app.services.result_cache import GradesResultCache
+
+    redis_client = _DictRedis()
+    cache = GradesResultCache(redis_client, 'secret', 'token-1', 60)
+    fetcher = Mock()
+    fetcher.fetch_grades_via_api.return_value = {'Result': {'StudentName': '王小明', 'SubjectExamInfoList': []}}
+
+    first = fetch_grades(fetcher, {}, 'A123', 'token-1', '1141', '3', result_cache=cache)
+    second = fetch_grades(fetcher, {}, 'A123', 'token-1', '1141', '3', result_cache=cache)
+    assert first == second
+    assert fetcher.fetch_grades_via_api.call_count == 1
+
+    (blob,) = redis_client.store.values()
+    assert '王小明'.encode('utf-8') not in blob
+    assert b'A123' not in blob
+
+    fetch_grades(fetcher, {}, 'A123', 'token-1', '1141', '3', result_cache=cache, force=True)
+    assert fetcher.fetch_grades_via_api.call_count == 2
+
+    other_login = GradesResultCache(redis_client, 'secret', 'token-2', 60)
+    assert other_login.get('A123', '1141', '3') is None
+
+
+def test_cross_worker_single_flight_keeps_grades_out_of_redis_plaintext():
+    import threading
+    import time
+
+    import fakeredis
+
+    from app.services.result_cache import GradesResultCache
+    from app.services.single_flight import SingleFlight
+
+    redis_client = fakeredis.FakeRedis(server=fakeredis.FakeServer())
+    cache = GradesResultCache(redis_client, 'secret', 'tok', 5)
+    data = {'Result': {'StudentName': '王小明', 'SubjectExamInfoList': []}}
+    calls = []
+    seen = []
+
+    def leader_fetch():
+        calls.append('leader')
+        time.sleep(0.2)
+        cache.set('A123', '1141', '1', data)
+        seen.extend(redis_client.get(k) for k in redis_client.keys('*'))
+        return data
+
+    def follower_fetch():
+        calls.append('follower')
+        return data
+
+    # 兩個 SingleFlight 實例模擬兩個 gunicorn worker
+    results = {}
+    leader = threading.Thread(target=lambda: results.setdefault('leader', SingleFlight('grades').do(
+        'k', leader_fetch, redis_client=redis_client)))
+    leader.start()
+    time.sleep(0.05)
+    results['follower'] = SingleFlight('grades').do(
+        'k', follower_fetch, redis_client=redis_client, read_shared=lambda: cache.get('A123', '1141', '1'),
+    )
+    leader.join()
+
+    assert calls == ['leader']
+    assert results['follower'] == data
+    slot = redis_client.get('singleflight:result:grades:k')
+    for raw in seen + [slot]:
+        assert '王小明'.encode('utf-8') not in raw
+        assert b'StudentName' not in raw
+
+
+def test_failed_background_refresh_keeps_stale_value_and_releases_lock():
+    import json
+    import threading
+    import time
+
+    import fakeredis
+
+    from app.services.deadline import Deadline
+    from app.services.structure_cache import get_or_load
+
+    redis_client = fakeredis.FakeRedis(server=fakeredis.FakeServer())
+    key = 'structure:years:A123'
+    redis_client.set(key, json.dumps({'value': [['114上', '1141']], 'fetched_at': time.time() - 100}))
+
+    done = threading.Event()
+    budgets = []
+
+    def failing_loader(deadline):
+        budgets.append(deadline.remaining())
+        done.set()
+        raise RuntimeError('upstream down')
+
+    # 原請求的 deadline 已經用完，背景重新抓取仍有自己的預算
+    expired = Deadline(0)
+    value = get_or_load(redis_client, key, failing_loader, ttl=10, stale_ttl=3600, deadline=expired)
+
+    assert value == [['114上', '1141']]
+    assert done.wait(2)
+    deadline = time.monotonic() + 2
+    while redis_client.exists(f'{key}:refresh') and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not redis_client.exists(f'{key}:refresh')
+    assert budgets[0] > 10
+    assert json.loads(redis_client.get(key))['value'] == [['114上', '1141']]
@@ -0,0 +1,125 @@
+import json
+from unittest.mock import Mock
+
+import pytest
+
+from app import create_app
+
+
+def _structure():
+    return {
+        '114上': {'year_value': '1141', 'exams': [{'text': '第一次段考', 'value': '1'}, {'text': '第二次段考', 'value': '2'}]},
+        '114下': {'year_value': '1142', 'exams': [{'text': '第一次段考', 'value': '1'}]},
+    }
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setenv('APP_ENV', 'testing')
+    app = create_app()
+    app.config['TESTING'] = True
+    app.config['REDIS_CLIENT'] = None
+
+    def fake_fetch(cookies, student_no, token, year_value, exam_value, deadline=None):
+        if (year_value, exam_value) == ('1142', '1'):
+            raise RuntimeError('upstream down')
+        return {'Result': {'StudentName': 'Test', 'ExamItem': {'ExamName': f'{year_value}-{exam_value}'}}}
+
+    fetcher = Mock()
+    fetcher.fetch_grades_via_api.side_effect = fake_fetch
+    fetcher.get_structure_via_api.return_value = _structure()
+    app.config['GRADE_FETCHER'] = fetcher
+
+    with app.test_client() as client:
+        yield client
+
+
+def _login(client):
+    with client.session_transaction() as sess:
+        sess['api_cookies'] = {'sid': 'x'}
+        sess['api_token'] = 'tok'
+        sess['student_no'] = 'A123'
+
+
+def test_fetch_all_requires_login(client):
+    res = client.post('/api/fetch_all')
+    assert res.status_code == 401
+
+
+def test_fetch_all_streams_ndjson_per_exam(client):
+    _login(client)
+    res = client.post('/api/fetch_all')
+
+    assert res.status_code == 200
+    assert res.mimetype == 'application/x-ndjson'
+    lines = [json.loads(line) for line in res.get_data(as_text=True).splitlines()]
+
+    items, summary = lines[:-1], lines[-1]
+    assert summary == {'done': True, 'total': 3, 'failed': 1}
+    ok = {(i['year_value'], i['exam_value']): i for i in items if i['success']}
+    assert ok[('1141', '2')]['data']['Result']['ExamItem']['ExamName'] == '1141-2'
+    failed = [i for i in items if not i['success']]
+    assert failed[0]['error'] == 'upstream down'
+
+
+def test_structure_is_kept_in_shared_cache_not_session(client):
+    import fakeredis
+
+    redis_client = fakeredis.FakeRedis(server=fakeredis.FakeServer())
+    client.application.config['REDIS_CLIENT'] = redis_client
+    fetcher = client.application.config['GRADE_FETCHER']
+    fetcher.get_year_terms_via_api.return_value = [('114上', '1141')]
+    fetcher.get_exams_via_api.return_value = [{'text': '第一次段考', 'value': '1'}]
+    _login(client)
+
+    first = client.get('/api/structure')
+    assert first.status_code == 200
+    with client.session_transaction() as sess:
+        assert 'structure' not in sess
+        key = sess['structure_key']
+    assert json.loads(redis_client.get(key)) == first.get_json()['structure']
+
+    fetcher.get_year_terms_via_api.reset_mock()
+    second = client.get('/api/structure')
+    assert second.get_json() == first.get_json()
+    fetcher.get_year_terms_via_api.assert_not_called()
+
+
+def test_fetch_returns_503_when_upstream_unavailable(client):
+    from app.services.upstream_guard import UpstreamUnavailable
+
+    _login(client)
+    client.application.config['GRADE_FETCHER'].fetch_grades_via_api.side_effect = UpstreamUnavailable(
+        'grades', 'circuit_open', retry_after=30
+    )
+    res = client.post('/api/fetch', json={'year_value': '1141', 'exam_value': '9'})
+
+    assert res.status_code == 503
+    assert res.headers['Retry-After'] == '30'
+    assert res.get_json()['success'] is False
+
+
+def test_fetch_returns_504_when_deadline_exceeded(client):
+    from app.services.deadline import DeadlineExceeded
+
+    _login(client)
+    fetcher = client.application.config['GRADE_FETCHER']
+    fetcher.fetch_grades_via_api.side_effect = DeadlineExceeded()
+    res = client.post('/api/fetch', json={'year_value': '1141', 'exam_value': '9'})
+
+    assert res.status_code == 504
+    assert res.get_json()['success'] is False
+    assert fetcher.fetch_grades_via_api.call_args.kwargs['deadline'] is not None
+
+
+def test_structure_returns_503_instead_of_empty_tree_when_circuit_open(client):
+    from app.services.upstream_guard import UpstreamUnavailable
+
+    _login(client)
+    fetcher = client.application.config['GRADE_FETCHER']
+    fetcher.get_structure_via_api.side_effect = UpstreamUnavailable('structure', 'circuit_open', retry_after=30)
+    res = client.get('/api/structure')
+
+    assert res.status_code == 503
+    with client.session_transaction() as sess:
+        assert 'structure' not in sess and 'structure_key' not in sess
@@ -0,0 +1,209 @@
+import datetime
+import ssl
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from requests.cookies import RequestsCookieJar
+
+from app.services import http_client
+from app.services.http_client import (
+    get_pool_stats,
+    get_pooled_school_http_session,
+    merge_response_cookies,
+)
+
+
+class _CookieHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        body = (self.headers.get('Cookie') or '').encode('utf-8')
+        self.send_response(200)
+        self.send_header('Set-Cookie', 'sid=abc; Path=/')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *_args):
+        pass
+
+
+@pytest.fixture
+def local_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _CookieHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_port}/'
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(autouse=True)
+def fresh_pools(monkeypatch):
+    monkeypatch.delenv('SCHOOL_SOCKS_PROXY', raising=False)
+    http_client.reset_pooled_sessions()
+    yield
+    http_client.reset_pooled_sessions()
+
+
+def test_pooled_school_session_is_shared_and_close_is_noop():
+    s1 = get_pooled_school_http_session()
+    s1.close()
+    assert get_pooled_school_http_session() is s1
+
+
+def test_pooled_session_does_not_keep_user_cookies(local_server):
+    session = get_pooled_school_http_session()
+    session.trust_env = False
+    jar = RequestsCookieJar()
+
+    resp = session.get(local_server, cookies=jar)
+    merge_response_cookies(jar, resp)
+
+    assert len(session.cookies) == 0
+    assert jar.get('sid') == 'abc'
+
+    resp = session.get(local_server, cookies=jar)
+    assert resp.text == 'sid=abc'
+    assert session.get(local_server).text == ''
+
+
+def test_pool_stats_report_connection_reuse(local_server):
+    session = get_pooled_school_http_session()
+    session.trust_env = False
+    for _ in range(3):
+        session.get(local_server)
+
+    stats = get_pool_stats()['school']
+    assert stats['requests'] == 3
+    assert stats['connections_created'] == 1
+    assert stats['pool_maxsize'] == 20
+
+
+def test_pooled_session_records_upstream_metrics(local_server):
+    from prometheus_client import REGISTRY
+
+    labels = {'endpoint': 'other', 'status': '200'}
+    before = REGISTRY.get_sample_value('school_upstream_requests_total', labels) or 0
+    session = get_pooled_school_http_session()
+    session.trust_env = False
+    session.get(local_server)
+
+    assert REGISTRY.get_sample_value('school_upstream_requests_total', labels) == before + 1
+
+
+def test_turnstile_session_uses_its_own_fast_fail_timeout(monkeypatch):
+    monkeypatch.setenv('TURNSTILE_TIMEOUT_CONNECT', '1.5')
+    monkeypatch.setenv('TURNSTILE_TIMEOUT_READ', '2.5')
+    session = http_client.get_pooled_turnstile_http_session()
+
+    assert http_client.get_pooled_turnstile_http_session() is session
+    assert session.default_timeout == (1.5, 2.5)
+    assert session is not get_pooled_school_http_session()
+
+
+def _self_signed(tmp_path):
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.x509.oid import NameOID
+
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, 'localhost')])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name).issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(minutes=1))
+        .not_valid_after(now + datetime.timedelta(hours=1))
+        .add_extension(x509.SubjectAlternativeName([x509.DNSName('localhost')]), critical=False)
+        .add_extension(x509.BasicConstraints(ca=True, path_length=None), critical=True)
+        .sign(key, hashes.SHA256())
+    )
+    cert_path, key_path = tmp_path / 'cert.pem', tmp_path / 'key.pem'
+    cert_path.write_bytes(cert.public_bytes(serialization.Encoding.PEM))
+    key_path.write_bytes(key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    ))
+    return str(cert_path), str(key_path)
+
+
+@pytest.fixture
+def tls_server(tmp_path, monkeypatch):
+    cert_path, key_path = _self_signed(tmp_path)
+    server_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    server_context.load_cert_chain(cert_path, key_path)
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _CookieHandler)
+    server.socket = server_context.wrap_socket(server.socket, server_side=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    monkeypatch.setattr(http_client, 'PREBUILT_CA_BUNDLE', cert_path)
+    monkeypatch.setattr(http_client, '_ssl_context', None)
+    yield f'https://localhost:{server.server_port}/'
+    server.shutdown()
+    server.server_close()
+
+
+def test_new_connections_resume_tls_session_from_shared_context(tls_server):
+    from prometheus_client import REGISTRY
+
+    def count(result):
+        return REGISTRY.get_sample_value('tls_handshakes_total', {'host': 'localhost', 'result': result}) or 0
+
+    full_before, resumed_before = count('full'), count('resumed')
+    for _ in range(3):
+        # 每次都用新 session（新連線池），只有 SSLContext 是共用的
+        session = http_client.get_http_session()
+        session.trust_env = False
+        assert session.get(tls_server).status_code == 200
+        session.close()
+
+    adapter = session.get_adapter('https://')
+    assert adapter.poolmanager.connection_pool_kw['ssl_context'] is http_client.get_ssl_context()
+    assert count('full') == full_before + 1
+    assert count('resumed') == resumed_before + 2
+
+
+def _reuse_samples():
+    from prometheus_client import REGISTRY
+
+    return tuple(
+        REGISTRY.get_sample_value(
+            'school_upstream_connection_reuse_total', {'endpoint': 'other', 'proxy': 'false', 'reused': reused}
+        ) or 0
+        for reused in ('true', 'false')
+    )
+
+
+def test_each_upstream_call_records_connection_reuse(local_server):
+    reused_before, new_before = _reuse_samples()
+    session = get_pooled_school_http_session()
+    session.trust_env = False
+    first = session.get(local_server)
+    second = session.get(local_server)
+
+    assert first.raw.reused_connection is False
+    assert second.raw.reused_connection is True
+    assert _reuse_samples() == (reused_before + 1, new_before + 1)
+
+
+def test_async_transport_records_connection_reuse(local_server):
+    import asyncio
+
+    import httpx
+
+    from async_fetcher import InstrumentedAsyncTransport
+
+    async def run():
+        async with httpx.AsyncClient(transport=InstrumentedAsyncTransport()) as client:
+            for _ in range(2):
+                await client.get(local_server)
+
+    reused_before, new_before = _reuse_samples()
+    asyncio.run(run())
+    assert _reuse_samples() == (reused_before + 1, new_before + 1)
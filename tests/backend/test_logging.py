@@ -0,0 +1,95 @@
+import json
+import logging
+import queue
+import threading
+
+import pytest
+from flask import Flask, g
+
+from app.extensions import TEXT_LOG_FORMAT, BoundedQueueHandler, JsonFormatter, RequestContextFilter
+import fetcher
+
+
+def test_bounded_queue_handler_drops_when_full():
+    handler = BoundedQueueHandler(queue.Queue(maxsize=1))
+    record = logging.LogRecord('t', logging.INFO, __file__, 1, 'msg', None, None)
+
+    handler.emit(record)
+    handler.emit(record)
+
+    assert handler.queue.qsize() == 1
+    assert handler.dropped == 1
+
+
+@pytest.fixture
+def fetcher_logger(monkeypatch):
+    log_queue = queue.Queue()
+    handler = BoundedQueueHandler(log_queue)
+    handler.addFilter(RequestContextFilter())
+    monkeypatch.setattr(fetcher.logger, 'handlers', [handler])
+    monkeypatch.setattr(fetcher.logger, 'propagate', False)
+    original_level = fetcher.logger.level
+    yield log_queue
+    fetcher.logger.setLevel(original_level)
+
+
+def test_log_record_carries_request_id_and_masked_user(fetcher_logger):
+    log_queue = fetcher_logger
+    fetcher.logger.setLevel(logging.INFO)
+
+    app = Flask(__name__)
+    with app.test_request_context():
+        g.request_id = 'abcd1234'
+        fetcher._log('info', 'S1234567', 'Fetching %s/%s', '1141', '1')
+
+    entry = json.loads(JsonFormatter().format(log_queue.get_nowait()))
+    assert entry['msg'] == 'Fetching 1141/1'
+    assert entry['request_id'] == 'abcd1234'
+    assert entry['user'] == 'S12***'
+    assert entry['level'] == 'INFO'
+
+
+def test_text_format_includes_request_id_and_user(fetcher_logger):
+    fetcher.logger.setLevel(logging.INFO)
+
+    app = Flask(__name__)
+    with app.test_request_context():
+        g.request_id = 'abcd1234'
+        fetcher._log('info', 'S1234567', 'Fetching %s/%s', '1141', '1')
+
+    line = logging.Formatter(TEXT_LOG_FORMAT).format(fetcher_logger.get_nowait())
+    assert line.endswith('INFO - [abcd1234 S12***] Fetching 1141/1')
+
+
+def test_records_outside_requests_use_placeholders():
+    record = logging.LogRecord('t', logging.INFO, __file__, 1, 'startup', None, None)
+    RequestContextFilter().filter(record)
+
+    assert logging.Formatter(TEXT_LOG_FORMAT).format(record).endswith('INFO - [- -] startup')
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry['request_id'] is None and entry['user'] is None
+
+
+def test_dropped_count_is_exact_under_concurrent_overflow():
+    handler = BoundedQueueHandler(queue.Queue(maxsize=1))
+    record = logging.LogRecord('t', logging.INFO, __file__, 1, 'msg', None, None)
+
+    def flood():
+        for _ in range(2000):
+            handler.emit(record)
+
+    threads = [threading.Thread(target=flood) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert handler.dropped == 8 * 2000 - 1
+
+
+def test_log_skips_disabled_levels(fetcher_logger):
+    fetcher.logger.setLevel(logging.ERROR)
+
+    fetcher._log('info', 'S1234567', 'ignored %s', object())
+
+    assert fetcher_logger.empty()
@@ -0,0 +1,84 @@
+import fakeredis
+import pytest
+import redis
+from prometheus_client import REGISTRY
+
+from app import create_app
+from app.services.metrics import InstrumentedRedis, record_upstream, upstream_endpoint
+
+
+def _sample(name, labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setenv('APP_ENV', 'testing')
+    app = create_app()
+    app.config['TESTING'] = True
+    app.config['REDIS_CLIENT'] = None
+    with app.test_client() as client:
+        yield client
+
+
+def test_metrics_endpoint_exports_route_latency(client):
+    labels = {'route': '/health', 'method': 'GET', 'status': '200'}
+    before = _sample('http_request_seconds_count', labels)
+    assert client.get('/health').status_code == 200
+
+    res = client.get('/metrics')
+    assert res.status_code == 200
+    assert res.mimetype == 'text/plain'
+    assert b'http_request_seconds_bucket' in res.data
+    assert _sample('http_request_seconds_count', labels) == before + 1
+
+
+def test_metrics_endpoint_requires_token_when_configured(client):
+    client.application.config['METRICS_TOKEN'] = 'secret'
+    assert client.get('/metrics').status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer secret'}).status_code == 200
+
+
+def test_metrics_endpoint_is_hidden_from_public_addresses_without_token(client):
+    public = {'REMOTE_ADDR': '8.8.8.8'}
+    assert client.get('/metrics', environ_base=public).status_code == 404
+    # 直連時偽造 X-Forwarded-For 不能冒充內網
+    spoofed = client.get('/metrics', environ_base=public, headers={'X-Forwarded-For': '10.0.0.2'})
+    assert spoofed.status_code == 404
+    # 經同機 proxy 轉送的外部請求
+    proxied = client.get('/metrics', headers={'X-Forwarded-For': '8.8.8.8'})
+    assert proxied.status_code == 404
+    assert client.get('/metrics', environ_base={'REMOTE_ADDR': '10.0.0.2'}).status_code == 200
+
+
+def test_upstream_endpoint_names():
+    base = 'https://shcloud2.k12ea.gov.tw/CLHSTYC'
+    assert upstream_endpoint(f'{base}/Auth/Auth/DoCloudLoginCheck') == 'login_check'
+    assert upstream_endpoint(f'{base}/ICampus/TutorShGrade/GetScoreForStudentExamContent') == 'grades'
+    assert upstream_endpoint('https://example.com/') == 'other'
+
+
+def test_record_upstream_counts_status_retries_and_bytes():
+    before_ok = _sample('school_upstream_requests_total', {'endpoint': 'exams', 'status': '200'})
+    before_retries = _sample('school_upstream_retries_total', {'endpoint': 'exams'})
+    record_upstream('exams', 0.2, 200, retries=2, nbytes=512)
+
+    assert _sample('school_upstream_requests_total', {'endpoint': 'exams', 'status': '200'}) == before_ok + 1
+    assert _sample('school_upstream_retries_total', {'endpoint': 'exams'}) == before_retries + 2
+    assert _sample('school_upstream_response_bytes_total', {'endpoint': 'exams'}) >= 512
+
+
+def test_instrumented_redis_times_commands_and_pipelines():
+    pool = redis.ConnectionPool(connection_class=fakeredis.FakeConnection, server=fakeredis.FakeServer())
+    client = InstrumentedRedis(connection_pool=pool)
+    before_get = _sample('redis_command_seconds_count', {'command': 'GET'})
+    before_pipe = _sample('redis_command_seconds_count', {'command': 'PIPELINE'})
+
+    client.get('missing')
+    pipe = client.pipeline()
+    pipe.set('a', 1)
+    pipe.get('a')
+    assert pipe.execute() == [True, b'1']
+
+    assert _sample('redis_command_seconds_count', {'command': 'GET'}) == before_get + 1
+    assert _sample('redis_command_seconds_count', {'command': 'PIPELINE'}) == before_pipe + 1
@@ -0,0 +1,112 @@
+import fakeredis
+import pytest
+
+from app.services.rate_limiter import (
+    TokenBucketLimiter,
+    check_rate_limits,
+    is_rate_limited,
+    rate_limit,
+    refund_rate_limit,
+)
+
+
+@pytest.fixture
+def redis_client():
+    return fakeredis.FakeRedis(server=fakeredis.FakeServer())
+
+
+@pytest.mark.parametrize('algorithm', ['fixed', 'sliding', 'gcra'])
+def test_rate_limiter_blocks_after_max_attempts(redis_client, algorithm):
+    results = [
+        is_rate_limited(redis_client, '1.2.3.4', max_attempts=3, window_seconds=60, algorithm=algorithm)
+        for _ in range(4)
+    ]
+
+    assert [r[0] for r in results] == [False, False, False, True]
+    assert [r[1] for r in results[:3]] == [2, 1, 0]
+    assert 0 < results[3][2] <= 60
+
+
+def test_fixed_window_always_sets_expiry(redis_client):
+    redis_client.set('rate_limit:login:1.2.3.4', 1)  # 模擬舊實作遺留、沒有 TTL 的 key
+    is_rate_limited(redis_client, '1.2.3.4', max_attempts=5, window_seconds=60)
+    assert 0 < redis_client.ttl('rate_limit:login:1.2.3.4') <= 60
+
+
+def test_check_rate_limits_combines_subjects(redis_client):
+    limits = [('share', '1.2.3.4', 10, 3600), ('share_student', 'A123', 2, 3600)]
+
+    assert check_rate_limits(redis_client, limits) == (False, 1, 0)
+    assert check_rate_limits(redis_client, limits) == (False, 0, 0)
+    limited, remaining, retry_after = check_rate_limits(redis_client, limits)
+    assert limited and remaining == 0 and retry_after > 0
+
+
+def test_unknown_algorithm_rejected(redis_client):
+    with pytest.raises(ValueError):
+        is_rate_limited(redis_client, 'x', algorithm='leaky')
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_token_bucket_refills_over_time():
+    clock = _Clock()
+    limiter = TokenBucketLimiter(clock=clock)
+
+    assert [limiter.consume('ip', 2, 1.0)[0] for _ in range(3)] == [True, True, False]
+    clock.now = 1.0
+    assert limiter.consume('ip', 2, 1.0)[0] is True
+
+
+def test_token_bucket_evicts_least_recently_used():
+    limiter = TokenBucketLimiter(max_entries=2)
+    limiter.consume('a', 1, 1.0)
+    limiter.consume('b', 1, 1.0)
+    limiter.consume('a', 1, 1.0)
+    limiter.consume('c', 1, 1.0)
+
+    assert len(limiter) == 2
+    assert 'b' not in limiter._buckets
+
+
+def test_rate_limit_prefilter_rejects_without_touching_redis(monkeypatch):
+    monkeypatch.setattr('app.services.rate_limiter.PREFILTER_CAPACITY', 1)
+    limiter = TokenBucketLimiter()
+
+    class ExplodingRedis:
+        def register_script(self, _source):
+            raise AssertionError('Redis should not be called')
+
+    assert rate_limit(None, 'ip', prefilter_ip='ip', limiter=limiter)[0] is False
+    limited, _, retry_after = rate_limit(ExplodingRedis(), 'ip', prefilter_ip='ip', limiter=limiter)
+    assert limited and retry_after >= 1
+
+
+def test_rate_limit_falls_back_to_local_limit_without_redis():
+    limiter = TokenBucketLimiter()
+    results = [rate_limit(None, '1.2.3.4', max_attempts=3, window_seconds=60, limiter=limiter)[0] for _ in range(4)]
+    assert results == [False, False, False, True]
+
+
+def test_refund_returns_the_attempt_in_redis_and_locally(redis_client):
+    for _ in range(3):
+        assert rate_limit(redis_client, 'ip', max_attempts=3)[0] is False
+    refund_rate_limit(redis_client, 'ip', max_attempts=3)
+    assert rate_limit(redis_client, 'ip', max_attempts=3)[0] is False
+    assert rate_limit(redis_client, 'ip', max_attempts=3)[0] is True
+
+    refund_rate_limit(redis_client, 'never-seen', max_attempts=3)
+    assert redis_client.get('rate_limit:login:never-seen') is None
+
+    limiter = TokenBucketLimiter()
+    for _ in range(3):
+        rate_limit(None, 'ip', max_attempts=3, limiter=limiter)
+    refund_rate_limit(None, 'ip', max_attempts=3, limiter=limiter)
+    assert rate_limit(None, 'ip', max_attempts=3, limiter=limiter)[0] is False
+    assert rate_limit(None, 'ip', max_attempts=3, limiter=limiter)[0] is True
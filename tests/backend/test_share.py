@@ -1,4 +1,12 @@
-from app.services.share_service import generate_share_id, is_valid_share_id, validate_share_payload
+import json
+
+from app.services import share_codec
+from app.services.share_service import (
+    generate_share_id,
+    is_valid_share_id,
+    prepare_share_payload,
+    validate_share_payload,
+)
 
 def test_generate_share_id():
     sid = generate_share_id()
@@ -40,3 +48,65 @@ def test_validate_share_payload_valid():
     assert 'turnstile_token' not in cleaned
     assert 'share_expiry' not in cleaned
     assert 'Result' in cleaned
+
+
+def test_validate_share_payload_uses_raw_size():
+    payload = {'Result': {'SubjectExamInfoList': []}}
+    is_valid, err, _ = validate_share_payload(payload, max_bytes=1000, raw_size=1001)
+    assert not is_valid
+    assert '大小限制' in err
+
+    is_valid, _, _ = validate_share_payload(payload, max_bytes=1000, raw_size=1000)
+    assert is_valid
+
+
+def test_prepare_share_payload_returns_compact_json_bytes():
+    payload = {'Result': {'SubjectExamInfoList': [{'SubjectName': '國語文'}]}, 'turnstile_token': 'abc'}
+    is_valid, err, json_bytes = prepare_share_payload(payload, raw_size=100)
+    assert is_valid and err is None
+    assert json_bytes == '{"Result":{"SubjectExamInfoList":[{"SubjectName":"國語文"}]}}'.encode('utf-8')
+
+
+def _grades_payload(subject_count=8):
+    subjects = ['國語文', '英語文', '數學A', '歷史', '地理', '公民與社會', '物理', '化學']
+    return {
+        'Message': '',
+        'Status': 'Success',
+        'Result': {
+            'StudentName': '測試',
+            'SubjectExamInfoList': [
+                {'SubjectName': subjects[i % len(subjects)], 'Score': 70 + i, 'ScoreDisplay': f'{70 + i}.00',
+                 'ClassRank': i + 1, 'ClassRankCount': 36, 'YearRank': i * 7, 'YearRankCount': 360,
+                 'YearTermDisplay': '114 學年度 上學期'}
+                for i in range(subject_count)
+            ],
+            '成績五標List': [
+                {'SubjectName': subjects[i % len(subjects)], '頂標': 88, '前標': 80, '均標': 72, '後標': 63, '底標': 56,
+                 '標準差': 9.2, '大於90Count': 3, '大於80Count': 6, '大於70Count': 12, '大於60Count': 10}
+                for i in range(subject_count)
+            ],
+        },
+    }
+
+
+def test_share_codec_roundtrip_and_compresses():
+    payload = _grades_payload()
+    stored = share_codec.encode(payload)
+
+    assert stored.startswith(b'GS\x01')
+    assert share_codec.decode(stored) == payload
+    assert len(stored) * 5 < len(json.dumps(payload, ensure_ascii=False).encode('utf-8'))
+
+
+def test_share_codec_v1_dictionary_is_pinned():
+    import zlib
+
+    assert zlib.adler32(share_codec.ZDICT_V1) == share_codec.ZDICT_V1_ID
+    assert share_codec.encode({'a': 1})[5:9] == share_codec.ZDICT_V1_ID.to_bytes(4, 'big')
+
+
+def test_share_codec_reads_legacy_json():
+    payload = _grades_payload(1)
+    legacy = json.dumps(payload, ensure_ascii=False)
+    assert share_codec.decode(legacy) == payload
+    assert share_codec.decode(legacy.encode('utf-8')) == payload
@@ -1,39 +1,23 @@
 import json
+import math
+
+import fakeredis
 import pytest
 
 from app import create_app
+from app.services import share_codec
 
 
-class FakeRedis:
-    def __init__(self):
-        self.store = {}
-        self.ttl_map = {}
-        self.counter = {}
-        self.setex_calls = []
-
-    def ping(self):
-        return True
-
-    def setex(self, key, ttl, value):
-        self.store[key] = value
-        self.ttl_map[key] = ttl
-        self.setex_calls.append((key, ttl, value))
-
-    def get(self, key):
-        return self.store.get(key)
-
-    def expire(self, key, ttl):
-        if key in self.store:
-            self.ttl_map[key] = ttl
-            return 1
-        return 0
+class FakeRedis(fakeredis.FakeRedis):
+    """每個測試獨立的 in-memory Redis（支援 pipeline 與 Lua script）。"""
 
-    def incr(self, key):
-        self.counter[key] = self.counter.get(key, 0) + 1
-        return self.counter[key]
+    def __init__(self):
+        super().__init__(server=fakeredis.FakeServer())
 
     def ttl(self, key):
-        return self.ttl_map.get(key, -1)
+        # 無條件進位到秒，避免 fakeredis 時鐘誤差與測試執行時間造成 7199 之類的結果
+        pttl = self.pttl(key)
+        return pttl if pttl < 0 else math.ceil(pttl / 1000)
 
 
 @pytest.fixture
@@ -72,8 +56,8 @@ def test_share_create_and_update_by_owner_resets_ttl(client):
     redis_client = client.application.config['REDIS_CLIENT']
     assert json.loads(redis_client.get(f'share_meta:{share_id}'))['creator_student_no'] == 'A123'
 
-    redis_client.ttl_map[f'share:{share_id}'] = 100
-    redis_client.ttl_map[f'share_meta:{share_id}'] = 100
+    redis_client.expire(f'share:{share_id}', 100)
+    redis_client.expire(f'share_meta:{share_id}', 100)
 
     update_res = client.put(f'/api/share/{share_id}', json=_share_payload())
     assert update_res.status_code == 200
@@ -213,7 +197,7 @@ def test_share_get_returns_503_when_redis_unavailable(client):
     assert get_res.get_json()['error'] == 'Share service unavailable'
 
 
-def test_share_update_returns_409_when_metadata_ttl_refresh_fails(client):
+def test_share_update_returns_409_when_metadata_ttl_is_invalid(client):
     with client.session_transaction() as sess:
         sess['student_no'] = 'A123'
 
@@ -221,9 +205,97 @@ def test_share_update_returns_409_when_metadata_ttl_refresh_fails(client):
     share_id = create_res.get_json()['id']
 
     redis_client = client.application.config['REDIS_CLIENT']
-    redis_client.expire = lambda *_args, **_kwargs: 0
+    redis_client.setex(f'share_meta:{share_id}', 7200, json.dumps({'creator_student_no': 'A123', 'ttl_seconds': 31}))
+    before = redis_client.get(f'share:{share_id}')
 
     update_res = client.put(f'/api/share/{share_id}', json=_share_payload())
 
     assert update_res.status_code == 409
     assert update_res.get_json()['error'] == 'Share metadata state conflict'
+    assert redis_client.get(f'share:{share_id}') == before
+
+
+def test_share_create_writes_data_and_metadata_atomically(client):
+    with client.session_transaction() as sess:
+        sess['student_no'] = 'A123'
+
+    create_res = client.post('/api/share', json=_share_payload())
+    share_id = create_res.get_json()['id']
+
+    redis_client = client.application.config['REDIS_CLIENT']
+    assert redis_client.ttl(f'share:{share_id}') == redis_client.ttl(f'share_meta:{share_id}') == 7200
+
+    get_res = client.get(f'/api/share/{share_id}')
+    assert get_res.status_code == 200
+    assert get_res.get_json()['data'] == {'Result': {'SubjectExamInfoList': []}}
+
+
+def test_share_update_missing_share_returns_404(client):
+    with client.session_transaction() as sess:
+        sess['student_no'] = 'A123'
+
+    update_res = client.put('/api/share/aaaaaaaaaaaaaaa', json=_share_payload())
+    assert update_res.status_code == 404
+
+
+def test_share_get_returns_etag_and_304_on_match(client):
+    with client.session_transaction() as sess:
+        sess['student_no'] = 'A123'
+    share_id = client.post('/api/share', json=_share_payload()).get_json()['id']
+
+    res = client.get(f'/api/share/{share_id}')
+    assert res.status_code == 200
+    assert res.get_json()['data'] == {'Result': {'SubjectExamInfoList': []}}
+    etag = res.headers['ETag']
+    assert etag.startswith('"') and not etag.startswith('W/')
+    assert 's-maxage=' in res.headers['Cache-Control']
+
+    # 304 不需要讀取分享內容
+    redis_client = client.application.config['REDIS_CLIENT']
+    redis_client.delete(f'share:{share_id}')
+    not_modified = client.get(f'/api/share/{share_id}', headers={'If-None-Match': etag})
+    assert not_modified.status_code == 304
+    assert not_modified.headers['ETag'] == etag
+    assert not_modified.get_data() == b''
+
+
+def test_share_update_changes_etag(client):
+    with client.session_transaction() as sess:
+        sess['student_no'] = 'A123'
+    share_id = client.post('/api/share', json=_share_payload()).get_json()['id']
+    old_etag = client.get(f'/api/share/{share_id}').headers['ETag']
+
+    payload = _share_payload()
+    payload['Result']['SubjectExamInfoList'] = [{'SubjectName': '數學'}]
+    assert client.put(f'/api/share/{share_id}', json=payload).status_code == 200
+
+    res = client.get(f'/api/share/{share_id}', headers={'If-None-Match': old_etag})
+    assert res.status_code == 200
+    assert res.headers['ETag'] != old_etag
+    assert res.get_json()['data']['Result']['SubjectExamInfoList'] == [{'SubjectName': '數學'}]
+
+
+def test_share_get_legacy_share_without_hash_still_has_etag(client):
+    redis_client = client.application.config['REDIS_CLIENT']
+    share_id = 'a' * 15
+    redis_client.setex(f'share:{share_id}', 100, json.dumps({'Result': {'SubjectExamInfoList': []}}))
+
+    res = client.get(f'/api/share/{share_id}')
+    assert res.status_code == 200
+    assert res.headers['ETag']
+
+
+def test_share_get_serves_stored_json_bytes_verbatim(client):
+    with client.session_transaction() as sess:
+        sess['student_no'] = 'A123'
+    payload = _share_payload()
+    payload['Result']['SubjectExamInfoList'] = [{'SubjectName': '國語文', 'Score': 88}]
+    share_id = client.post('/api/share', json=payload).get_json()['id']
+
+    res = client.get(f'/api/share/{share_id}')
+    assert res.status_code == 200
+    assert res.mimetype == 'application/json'
+    stored = client.application.config['REDIS_CLIENT'].get(f'share:{share_id}')
+    assert res.get_data() == b'{"success":true,"data":' + share_codec.decode_json_bytes(stored) + b'}'
+    assert res.get_json()['data']['Result']['SubjectExamInfoList'] == [{'SubjectName': '國語文', 'Score': 88}]
+    assert int(res.headers['Content-Length']) == len(res.get_data())
@@ -0,0 +1,157 @@
+import io
+import os
+import subprocess
+import sys
+import threading
+
+import fakeredis
+import pytest
+import redis
+from flask import session
+
+import startup_profile
+from app import create_app
+from app.services import http_client
+from app.services.redis_readiness import CONNECTED, CONNECTING, UNAVAILABLE, RedisReadiness
+
+
+class _FlakyRedis:
+    def __init__(self, failures):
+        self.failures = failures
+        self.calls = 0
+
+    def ping(self):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise redis.exceptions.ConnectionError('refused')
+        return True
+
+
+class _BlockedRedis:
+    def __init__(self):
+        self.release = threading.Event()
+
+    def ping(self):
+        self.release.wait(5)
+        return True
+
+
+@pytest.fixture
+def app(monkeypatch):
+    monkeypatch.setenv('APP_ENV', 'testing')
+    app = create_app()
+    app.config['TESTING'] = True
+    return app
+
+
+def test_readiness_hands_client_over_once_connected():
+    client = fakeredis.FakeRedis(server=fakeredis.FakeServer())
+    received = []
+    readiness = RedisReadiness(client, received.append).start()
+
+    assert readiness.wait(2) == CONNECTED
+    assert readiness.ready
+    assert received == [client]
+
+
+def test_readiness_reports_unavailable_then_recovers():
+    client = _FlakyRedis(failures=2)
+    received = []
+    readiness = RedisReadiness(client, received.append, interval=0.01)
+    readiness._run()
+
+    assert readiness.state == CONNECTED
+    assert received == [client]
+    assert client.calls == 3
+
+
+def test_readiness_gives_up_after_retry_window():
+    readiness = RedisReadiness(_FlakyRedis(failures=100), lambda c: None, retry_seconds=0, interval=0.01)
+    readiness._run()
+    assert readiness.state == UNAVAILABLE
+
+
+def test_health_reports_starting_and_unavailable(app, monkeypatch):
+    monkeypatch.setattr('app.routes.system.HEALTH_REDIS_WAIT', 0.01)
+    blocked = _BlockedRedis()
+    app.config['REDIS_READINESS'] = RedisReadiness(blocked, lambda c: None).start()
+    app.config['REDIS_CLIENT'] = None
+    with app.test_client() as client:
+        starting = client.get('/health')
+        blocked.release.set()
+
+        app.config['REDIS_READINESS'] = RedisReadiness(
+            _FlakyRedis(failures=100), lambda c: None, retry_seconds=0, interval=0.01
+        )
+        app.config['REDIS_READINESS']._run()
+        degraded = client.get('/health')
+
+    assert starting.status_code == 503
+    assert starting.get_json() == {'status': 'starting', 'redis': CONNECTING}
+    assert degraded.status_code == 200
+    assert degraded.get_json() == {'status': 'ok', 'redis': UNAVAILABLE}
+
+
+def test_startup_profile_reports_imports_and_phases(monkeypatch):
+    monkeypatch.setattr(startup_profile, 'ENABLED', True)
+    monkeypatch.setattr(startup_profile, '_imports', {})
+    monkeypatch.setattr(startup_profile, '_phases', [])
+    monkeypatch.delitem(__import__('sys').modules, 'colorsys', raising=False)
+
+    startup_profile.install()
+    try:
+        with startup_profile.phase('init'):
+            import colorsys  # noqa: F401
+    finally:
+        startup_profile.uninstall()
+    text = startup_profile.report(stream=io.StringIO())
+
+    assert 'colorsys' in text
+    assert 'init' in text
+
+
+def test_ssl_context_uses_prebuilt_bundle_without_writing_tmp(tmp_path, monkeypatch):
+    bundle = http_client.build_ca_bundle(str(tmp_path / 'ca-bundle.pem'))
+    monkeypatch.setattr(http_client, 'PREBUILT_CA_BUNDLE', bundle)
+    monkeypatch.setattr(http_client, '_ssl_context', None)
+
+    context = http_client.get_ssl_context()
+
+    assert http_client.get_ssl_context() is context
+    assert context.cert_store_stats()['x509_ca'] > 100
+    assert os.listdir(tmp_path) == ['ca-bundle.pem']
+
+
+def test_importing_app_does_not_load_upstream_client_modules():
+    code = 'import sys, app; print(",".join(m for m in ("fetcher", "requests", "cachelib", "bs4") if m in sys.modules))'
+    out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == ''
+
+
+def test_testing_env_skips_redis_readiness(app):
+    assert app.config['REDIS_READINESS'].state == UNAVAILABLE
+    assert app.config['REDIS_CLIENT'] is None
+
+
+def test_fallback_sessions_move_to_redis_once_ready(app):
+    fake = fakeredis.FakeRedis(server=fakeredis.FakeServer())
+    app.session_interface.redis_interface.client = fake
+
+    @app.route('/_test/session', methods=['POST'])
+    def set_session():
+        session['student_no'] = 'S1234567'
+        return 'ok'
+
+    @app.route('/_test/session')
+    def get_session():
+        return session.get('student_no', '')
+
+    with app.test_client() as client:
+        created = client.post('/_test/session')
+        sid = created.headers['Set-Cookie'].split(';')[0].split('=', 1)[1]
+
+        app.config['REDIS_READINESS'].state = CONNECTED
+        moved = client.get('/_test/session', headers={'Cookie': f'session={sid}'})
+
+    assert moved.data == b'S1234567'
+    assert fake.exists(f'session:{sid}')
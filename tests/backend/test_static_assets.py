@@ -0,0 +1,86 @@
+import gzip
+import os
+
+import pytest
+
+from app import create_app
+from app.services.static_assets import StaticAssetIndex
+
+
+@pytest.fixture
+def public_dir(tmp_path):
+    (tmp_path / 'dist').mkdir()
+    (tmp_path / 'index.html').write_text('<html>' + 'x' * 4000 + '</html>', encoding='utf-8')
+    bundle = ('console.log("grades");\n' * 200).encode()
+    (tmp_path / 'dist' / 'main-abc.js').write_bytes(bundle)
+    (tmp_path / 'dist' / 'main-abc.js.br').write_bytes(b'fake-brotli')
+    (tmp_path / 'robots.txt').write_text('User-agent: *\n', encoding='utf-8')
+    return tmp_path
+
+
+@pytest.fixture
+def client(monkeypatch, public_dir):
+    monkeypatch.setenv('APP_ENV', 'testing')
+    app = create_app()
+    app.config['TESTING'] = True
+    app.config['STATIC_ASSETS'] = StaticAssetIndex(str(public_dir))
+    with app.test_client() as client:
+        yield client
+
+
+def test_encoding_is_chosen_from_accept_encoding(client):
+    br = client.get('/dist/main-abc.js', headers={'Accept-Encoding': 'gzip, br'})
+    gz = client.get('/dist/main-abc.js', headers={'Accept-Encoding': 'gzip'})
+    plain = client.get('/dist/main-abc.js', headers={'Accept-Encoding': 'identity'})
+
+    assert br.headers['Content-Encoding'] == 'br'
+    assert br.data == b'fake-brotli'
+    assert gz.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(gz.data) == plain.data
+    assert 'Content-Encoding' not in plain.headers
+    for res in (br, gz, plain):
+        assert 'Accept-Encoding' in res.headers['Vary']
+    assert br.headers['Cache-Control'] == 'public, max-age=31536000, immutable'
+
+
+def test_each_variant_has_its_own_etag(client):
+    etags = {
+        client.get('/dist/main-abc.js', headers={'Accept-Encoding': enc}).headers['ETag']
+        for enc in ('br', 'gzip', 'identity')
+    }
+    assert len(etags) == 3
+    assert all(not tag.startswith('W/') for tag in etags)
+
+
+def test_if_none_match_returns_304_including_weak_etags(client):
+    first = client.get('/', headers={'Accept-Encoding': 'gzip'})
+    etag = first.headers['ETag']
+    assert first.headers['Cache-Control'] == 'no-cache'
+
+    again = client.get('/', headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+    weak = client.get('/share/abc', headers={'Accept-Encoding': 'gzip', 'If-None-Match': f'W/{etag}'})
+    other_variant = client.get('/', headers={'If-None-Match': etag})
+
+    assert again.status_code == 304 and again.data == b''
+    assert weak.status_code == 304
+    assert other_variant.status_code == 200
+
+
+def test_small_file_is_not_varied_by_encoding(client):
+    res = client.get('/robots.txt', headers={'Accept-Encoding': 'gzip'})
+    assert res.status_code == 200
+    assert 'Content-Encoding' not in res.headers
+    assert 'Accept-Encoding' not in res.headers.get('Vary', '')
+
+
+def test_reload_picks_up_changed_files(public_dir):
+    index = StaticAssetIndex(str(public_dir), reload=True)
+    before = index.get('index.html').etag
+
+    path = public_dir / 'index.html'
+    path.write_text('<html>new build</html>', encoding='utf-8')
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+
+    assert index.get('index.html').etag != before
+    assert StaticAssetIndex(str(public_dir)).get('../etc/passwd') is None
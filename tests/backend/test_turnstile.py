@@ -0,0 +1,104 @@
+import fakeredis
+import pytest
+from flask import Flask
+
+from app.services import turnstile_service
+from app.services.turnstile_service import verify_turnstile_token
+
+
+class _Resp:
+    def __init__(self, payload):
+        self._payload = payload
+
+    def json(self):
+        return self._payload
+
+
+class _FakeSession:
+    def __init__(self, success=True):
+        self.success = success
+        self.calls = []
+
+    def post(self, url, data=None):
+        self.calls.append(data)
+        return _Resp({'success': self.success, 'error-codes': [] if self.success else ['invalid-input-response']})
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.config.update(TURNSTILE_SECRET_KEY='secret', TURNSTILE_CACHE_TTL=30, REDIS_CLIENT=None)
+    turnstile_service.clear_local_cache()
+    with app.app_context():
+        yield app
+    turnstile_service.clear_local_cache()
+
+
+def _use_session(monkeypatch, session):
+    monkeypatch.setattr(turnstile_service, 'get_pooled_turnstile_http_session', lambda: session)
+
+
+def test_verified_token_is_not_reverified_from_same_ip(app, monkeypatch):
+    session = _FakeSession()
+    _use_session(monkeypatch, session)
+
+    assert verify_turnstile_token('tok', remoteip='1.2.3.4', action='login', identity='user') == (True, None)
+    assert verify_turnstile_token('tok', remoteip='1.2.3.4', action='login', identity='user') == (True, None)
+    assert len(session.calls) == 1
+
+    verify_turnstile_token('tok', remoteip='5.6.7.8', action='login', identity='user')
+    assert len(session.calls) == 2
+
+
+def test_failed_verification_is_not_cached(app, monkeypatch):
+    session = _FakeSession(success=False)
+    _use_session(monkeypatch, session)
+
+    assert verify_turnstile_token('bad', remoteip='1.2.3.4', action='login', identity='user')[0] is False
+    assert verify_turnstile_token('bad', remoteip='1.2.3.4', action='login', identity='user')[0] is False
+    assert len(session.calls) == 2
+
+
+def test_cache_is_shared_through_redis_without_raw_token(app, monkeypatch):
+    redis_client = fakeredis.FakeRedis(server=fakeredis.FakeServer())
+    app.config['REDIS_CLIENT'] = redis_client
+    session = _FakeSession()
+    _use_session(monkeypatch, session)
+
+    verify_turnstile_token('tok', remoteip='1.2.3.4', action='login', identity='user')
+    turnstile_service.clear_local_cache()
+    verify_turnstile_token('tok', remoteip='1.2.3.4', action='login', identity='user')
+
+    assert len(session.calls) == 1
+    keys = redis_client.keys('turnstile:ok:*')
+    assert len(keys) == 1 and b'tok' not in keys[0] and b'user' not in keys[0]
+    assert 0 < redis_client.ttl(keys[0]) <= 30
+
+
+def test_cache_can_be_disabled(app, monkeypatch):
+    app.config['TURNSTILE_CACHE_TTL'] = 0
+    session = _FakeSession()
+    _use_session(monkeypatch, session)
+
+    verify_turnstile_token('tok', remoteip='1.2.3.4', action='login', identity='user')
+    verify_turnstile_token('tok', remoteip='1.2.3.4', action='login', identity='user')
+    assert len(session.calls) == 2
+
+
+def test_cached_token_is_scoped_to_endpoint_and_identity(app, monkeypatch):
+    session = _FakeSession()
+    _use_session(monkeypatch, session)
+
+    verify_turnstile_token('tok', remoteip='1.2.3.4', action='login', identity='user')
+    verify_turnstile_token('tok', remoteip='1.2.3.4', action='share', identity='user')
+    verify_turnstile_token('tok', remoteip='1.2.3.4', action='login', identity='other')
+    assert len(session.calls) == 3
+
+
+def test_verification_without_endpoint_is_never_cached(app, monkeypatch):
+    session = _FakeSession()
+    _use_session(monkeypatch, session)
+
+    verify_turnstile_token('tok', remoteip='1.2.3.4')
+    verify_turnstile_token('tok', remoteip='1.2.3.4')
+    assert len(session.calls) == 2
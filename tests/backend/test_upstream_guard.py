@@ -0,0 +1,242 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import fakeredis
+import pytest
+
+from app.services.upstream_guard import (
+    ALLOW,
+    PROBE,
+    REJECT,
+    AdaptiveConcurrencyLimiter,
+    CircuitBreaker,
+    UpstreamGuard,
+    UpstreamUnavailable,
+)
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def redis_client():
+    return fakeredis.FakeRedis(server=fakeredis.FakeServer())
+
+
+def test_redis_breaker_opens_after_threshold_and_is_shared(redis_client):
+    breaker = CircuitBreaker(redis_client, threshold=3, window=30, open_seconds=30)
+    other_worker = CircuitBreaker(redis_client, threshold=3, window=30, open_seconds=30)
+
+    for _ in range(2):
+        breaker.record('grades', False)
+    assert other_worker.allow('grades') == ALLOW
+
+    breaker.record('grades', False)
+    assert other_worker.allow('grades') == REJECT
+    assert breaker.allow('exams') == ALLOW
+
+
+def test_redis_breaker_half_open_allows_single_probe(redis_client):
+    breaker = CircuitBreaker(redis_client, threshold=1, window=30, open_seconds=0.05)
+    breaker.record('grades', False)
+    assert breaker.allow('grades') == REJECT
+
+    time.sleep(0.08)
+    assert breaker.allow('grades') == PROBE
+    assert breaker.allow('grades') == REJECT
+
+    breaker.record('grades', True, PROBE)
+    assert breaker.allow('grades') == ALLOW
+
+
+@pytest.mark.parametrize('use_redis', [True, False])
+def test_breaker_trips_on_failure_ratio_not_absolute_count(redis_client, use_redis):
+    breaker = CircuitBreaker(redis_client if use_redis else None, threshold=5, window=30, failure_ratio=0.5)
+
+    # 高流量下 20% 失敗：失敗次數早已超過 threshold，但比例不足，不開路
+    for i in range(50):
+        breaker.record('grades', i % 5 != 0)
+    assert breaker.allow('grades') == ALLOW
+
+    # 失敗持續到超過一半才開路
+    for _ in range(30):
+        breaker.record('grades', False)
+        if breaker.allow('grades') == REJECT:
+            break
+    assert breaker.allow('grades') == REJECT
+
+
+def test_local_breaker_reopens_when_probe_fails():
+    clock = _Clock()
+    breaker = CircuitBreaker(None, threshold=2, window=30, open_seconds=10, clock=clock)
+    breaker.record('login_check', False)
+    breaker.record('login_check', False)
+    assert breaker.allow('login_check') == REJECT
+
+    clock.now += 11
+    assert breaker.allow('login_check') == PROBE
+    breaker.record('login_check', False, PROBE)
+    assert breaker.allow('login_check') == REJECT
+
+    clock.now += 11
+    assert breaker.allow('login_check') == PROBE
+    breaker.record('login_check', True, PROBE)
+    assert breaker.allow('login_check') == ALLOW
+
+
+def test_aimd_limiter_grows_on_success_and_halves_on_failure():
+    clock = _Clock()
+    limiter = AdaptiveConcurrencyLimiter(initial=4, max_limit=8, latency_target=1.0, clock=clock)
+    for _ in range(4):
+        assert limiter.acquire()
+        limiter.release(0.1, True)
+    assert limiter.limit == pytest.approx(5.0, abs=0.2)
+
+    assert limiter.acquire()
+    limiter.release(0.1, False)
+    assert limiter.limit == pytest.approx(2.5, abs=0.1)
+
+    # 同一個延遲週期內不會連續減半
+    assert limiter.acquire()
+    limiter.release(3.0, True)
+    assert limiter.limit == pytest.approx(2.5, abs=0.1)
+
+
+def test_guard_fails_fast_when_saturated():
+    guard = UpstreamGuard(CircuitBreaker(None), AdaptiveConcurrencyLimiter(initial=1), queue_timeout=0.05)
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow_call():
+        started.set()
+        release.wait(1)
+        return SimpleNamespace(status_code=200)
+
+    worker = threading.Thread(target=guard.call, args=('grades', slow_call))
+    worker.start()
+    started.wait(1)
+
+    with pytest.raises(UpstreamUnavailable) as exc_info:
+        guard.call('grades', lambda: SimpleNamespace(status_code=200))
+    assert exc_info.value.reason == 'saturated'
+
+    release.set()
+    worker.join(1)
+    assert guard.call('grades', lambda: SimpleNamespace(status_code=200)).status_code == 200
+
+
+def test_guard_counts_5xx_as_failure_and_opens_circuit():
+    guard = UpstreamGuard(CircuitBreaker(None, threshold=2), AdaptiveConcurrencyLimiter())
+    for _ in range(2):
+        assert guard.call('grades', lambda: SimpleNamespace(status_code=503)).status_code == 503
+
+    with pytest.raises(UpstreamUnavailable) as exc_info:
+        guard.call('grades', lambda: SimpleNamespace(status_code=200))
+    assert exc_info.value.reason == 'circuit_open'
+
+
+def _open_guard():
+    guard = UpstreamGuard(CircuitBreaker(None, threshold=1), AdaptiveConcurrencyLimiter())
+    for endpoint in ('login_page', 'login_check', 'structure', 'exams'):
+        guard.call(endpoint, lambda: SimpleNamespace(status_code=503))
+    return guard
+
+
+def test_fetcher_does_not_swallow_open_circuit():
+    import requests
+
+    from fetcher import GradeFetcher
+
+    fetcher = GradeFetcher(session_factory=requests.Session, guard=_open_guard())
+
+    with pytest.raises(UpstreamUnavailable):
+        fetcher.get_structure_via_api({'sid': 'x'}, 'A123', 'tok')
+    with pytest.raises(UpstreamUnavailable):
+        fetcher.get_exams_via_api({'sid': 'x'}, 'A123', 'tok', '1141')
+    with pytest.raises(UpstreamUnavailable):
+        fetcher.login_and_get_tokens('user', 'pass', captcha_code='1234')
+
+
+def test_async_fetcher_does_not_swallow_open_circuit():
+    import asyncio
+
+    from async_fetcher import AsyncGradeFetcher
+
+    fetcher = AsyncGradeFetcher(client_factory=lambda: None, guard=_open_guard())
+
+    with pytest.raises(UpstreamUnavailable):
+        asyncio.run(fetcher.get_structure_via_api({'sid': 'x'}, 'A123', 'tok'))
+    with pytest.raises(UpstreamUnavailable):
+        asyncio.run(fetcher.login_and_get_tokens('user', 'pass', captcha_code='1234'))
+
+
+def test_async_guard_queues_on_the_loop_instead_of_rejecting():
+    import asyncio
+
+    guard = UpstreamGuard(CircuitBreaker(None), AdaptiveConcurrencyLimiter(initial=1), queue_timeout=1.0)
+    order = []
+
+    async def upstream(name):
+        order.append(f'start-{name}')
+        await asyncio.sleep(0.05)
+        order.append(f'end-{name}')
+        return SimpleNamespace(status_code=200)
+
+    async def main():
+        ticker = asyncio.create_task(asyncio.sleep(0.01))
+        results = await asyncio.gather(
+            guard.acall('grades', lambda: upstream('a')),
+            guard.acall('grades', lambda: upstream('b')),
+        )
+        # loop 未被排隊阻塞，其他 task 照常完成
+        assert ticker.done()
+        return results
+
+    results = asyncio.run(main())
+    assert [r.status_code for r in results] == [200, 200]
+    assert order == ['start-a', 'end-a', 'start-b', 'end-b']
+
+
+def test_async_waiter_is_woken_by_release_from_another_thread():
+    import asyncio
+
+    limiter = AdaptiveConcurrencyLimiter(initial=1)
+    assert limiter.acquire(0)
+
+    async def main():
+        threading.Timer(0.05, limiter.release, args=(0.1, True)).start()
+        return await limiter.acquire_async(timeout=1.0)
+
+    assert asyncio.run(main()) is True
+    assert limiter.inflight == 1
+
+
+def test_async_guard_runs_redis_breaker_off_the_event_loop(redis_client):
+    import asyncio
+
+    breaker = CircuitBreaker(redis_client)
+    threads = []
+    original_allow = breaker.allow
+
+    def tracking_allow(endpoint):
+        threads.append(threading.get_ident())
+        return original_allow(endpoint)
+
+    breaker.allow = tracking_allow
+    guard = UpstreamGuard(breaker, AdaptiveConcurrencyLimiter())
+
+    async def upstream():
+        return SimpleNamespace(status_code=200)
+
+    async def main():
+        await guard.acall('grades', upstream)
+        return threading.get_ident()
+
+    loop_thread = asyncio.run(main())
+    assert threads and threads[0] != loop_thread